@@ -1,31 +1,44 @@
-import psutil
+import sys
 import time
-import threading
-import tkinter as tk
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.animation as animation
-from matplotlib.figure import Figure
-from collections import deque
-import configparser
-import platform
 import logging
-import os
-import sys
-from threading import RLock
-import ctypes
-import webbrowser
+import multiprocessing
+
+# Reference point for --profile-startup
+STARTUP_BEGIN = time.perf_counter()
+
+
+if __name__ == "__main__":
+    # Frozen executables re-enter here to run the collector worker process
+    multiprocessing.freeze_support()
 
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # Collector mode: sample and emit without ever loading Tk or matplotlib
+    from bitmeter_core import run_headless
+    sys.exit(run_headless(sys.argv[1:]))
 
-logging.basicConfig(
-    level=logging.INFO,  # Change back from DEBUG to INFO for release
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='speedmeter.log',
-    filemode='a'
-)
+# The spawned collector worker re-runs this script as __mp_main__ and only
+# needs bitmeter_worker, so it skips the GUI imports
+if __name__ != "__mp_main__":
+    # Only what is needed to show the first sample is imported here; matplotlib,
+    # webbrowser and the win32 modules are imported where they are first used.
+    import psutil
+    import json
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+    import numpy as np
+    from collections import deque
+    import platform
+    import os
 
-CONFIG_FILE = "config.ini"
+    from bitmeter_core import (CONFIG_FILE, load_config, save_config, format_speed,
+                               format_duration, format_burst, EnhancedNetworkMonitor)
+    from bitmeter_history import create_history_writer
+    from bitmeter_files import create_file_exporter
+    from bitmeter_exporter import create_exporter
+    from bitmeter_remote import create_agent_server, create_remote_monitor
+    from bitmeter_alerts import create_alert_engine
+    from bitmeter_anomaly import FLAG_DOWNLOAD, FLAG_UPLOAD
+    from bitmeter_selfstats import LatencyHistogram
 
 # Define color themes
 THEMES = {
@@ -74,348 +87,258 @@ THEMES = {
     "system": {}
 }
 
-def load_config():
-    config = configparser.ConfigParser()
-    
-    if not os.path.exists(CONFIG_FILE):
-        config["Settings"] = {
-            "theme": "dark",
-            "speed_unit": "None",
-            "update_interval": "0.5",
-            "show_system_stats": "True"
-        }
-        save_config(config)
-    else:
-        config.read(CONFIG_FILE)
-        if not config.has_section("Settings"):
-            config.add_section("Settings")
-        for key, default in {"theme": "dark", "speed_unit": "None", 
-                             "update_interval": "0.5", "show_system_stats": "True"}.items():
-            if not config.has_option("Settings", key):
-                config.set("Settings", key, default)
-    
-    return config
+class BlitPlotRenderer:
+    """Keeps the download/upload artists alive between frames so they can be blitted.
 
-def save_config(config):
-    try:
-        with open(CONFIG_FILE, "w") as configfile:
-            config.write(configfile)
-    except Exception as e:
-        logging.error(f"Error saving config: {e}")
+    Values are drawn normalised to the current scale, so the axes limits never
+    change and the background cached by FuncAnimation stays valid.
+    """
 
-def format_speed(speed_bps, force_unit=None):
-    if force_unit == "None":
-        force_unit = None
+    def __init__(self, ax1, ax2, data_points):
+        from matplotlib.patches import Polygon
         
-    speed_Bps = speed_bps / 8.0
-        
-    if force_unit:
-        if force_unit == "kbps":
-            return f"{speed_Bps/1000:.1f}", "KB/s"
-        elif force_unit == "Mbps":
-            return f"{speed_Bps/1000000:.1f}", "MB/s"
-        elif force_unit == "Gbps":
-            return f"{speed_Bps/1000000000:.2f}", "GB/s"
-        else:
-            return f"{speed_Bps:.0f}", "B/s"
-    else:
-        if speed_Bps < 1000:
-            return f"{speed_Bps:.0f}", "B/s"
-        elif speed_Bps < 1000000:
-            return f"{speed_Bps/1000:.1f}", "KB/s"
-        elif speed_Bps < 1000000000:
-            return f"{speed_Bps/1000000:.1f}", "MB/s"
-        else:
-            return f"{speed_Bps/1000000000:.2f}", "GB/s"
-
-class EnhancedNetworkMonitor:
-    def __init__(self):
-        self.download_speed = 0.0
-        self.upload_speed = 0.0
-        self.running = True
-        self.lock = threading.Lock()
-        
-        self.system_stats_lock = RLock()
-        self.cpu_usage = 0.0
-        self.cpu_per_core = []
-        self.ram_usage = 0.0
-        self.ram_used = 0
-        self.ram_total = 0
-        self.top_processes = []
-        
-        self.core_count = psutil.cpu_count(logical=True) or 1
-        self.cpu_per_core = [0.0] * self.core_count
-        
-        self.last_received = psutil.net_io_counters().bytes_recv
-        self.last_sent = psutil.net_io_counters().bytes_sent
-        self.last_time = time.time()
-        
-        self.system_stats_thread = threading.Thread(target=self.update_system_stats, daemon=True)
-        self.system_stats_thread.start()
-        
-        # Add an interface filter to allow user to select which network interface to monitor
-        self.selected_interface = None  # Will use combined stats by default
-        # Initialize active_method attribute
-        self.active_method = "Monitoring all interfaces"
-    
-    def update_speeds(self):
-        last_received = self.last_received
-        last_sent = self.last_sent
-        last_time = self.last_time
-        
-        while self.running:
-            try:
-                time.sleep(0.5)  # This is fine for normal monitoring
-                
-                current_time = time.time()
-                try:
-                    # Get per-interface counters to detect actual active interfaces
-                    net_io_per_nic = psutil.net_io_counters(pernic=True)
-                    
-                    # If a specific interface is selected, use its stats
-                    if self.selected_interface and self.selected_interface in net_io_per_nic:
-                        network_stats = net_io_per_nic[self.selected_interface]
-                        self.active_method = f"Monitoring {self.selected_interface}"
-                    else:
-                        # Get combined stats from all interfaces
-                        network_stats = psutil.net_io_counters()
-                        self.active_method = "Monitoring all interfaces"
-                    
-                    # Log active interfaces for debugging
-                    logging.debug(f"Active interfaces: {list(net_io_per_nic.keys())}")
-                    
-                    # Get combined stats from all interfaces
-                    current_received = network_stats.bytes_recv
-                    current_sent = network_stats.bytes_sent
-                    
-                    time_delta = current_time - last_time
-                    
-                    # Log raw values for debugging
-                    logging.debug(f"Time delta: {time_delta:.2f}s, Bytes received: {current_received-last_received}, Bytes sent: {current_sent-last_sent}")
-                    
-                    if current_received < last_received or current_sent < last_sent:
-                        logging.warning("Network counter reset detected")
-                        last_received = current_received
-                        last_sent = current_sent
-                        last_time = current_time
-                        continue
-
-                    with self.lock:
-                        dl_bytes = current_received - last_received
-                        ul_bytes = current_sent - last_sent
-                        
-                        # Convert bytes to bits per second
-                        self.download_speed = (dl_bytes * 8) / time_delta
-                        self.upload_speed = (ul_bytes * 8) / time_delta
-                        
-                        # Add sanity check for abnormally high values
-                        if self.download_speed > 1e12:  # More than ~1 TB/s is likely an error
-                            logging.warning(f"Abnormally high download speed detected: {self.download_speed} bps")
-                            self.download_speed = 0
-                            
-                        if self.upload_speed > 1e12:
-                            logging.warning(f"Abnormally high upload speed detected: {self.upload_speed} bps")
-                            self.upload_speed = 0
-                        
-                        # Log calculated speeds for debugging
-                        dl_text, dl_unit = format_speed(self.download_speed)
-                        ul_text, ul_unit = format_speed(self.upload_speed)
-                        logging.debug(f"Download: {dl_text} {dl_unit}, Upload: {ul_text} {ul_unit}")
-
-                    last_received = current_received
-                    last_sent = current_sent
-                    last_time = current_time
-                    
-                except Exception as e:
-                    logging.error(f"Error getting network stats: {e}")
-                    time.sleep(0.5)
+        self.axes = (ax1, ax2)
+        self.data_points = data_points
 
-            except Exception as e:
-                logging.error(f"Error updating speeds: {e}")
-                time.sleep(0.5)
-    
-    def update_system_stats(self):
-        windows_counters = False
-        
-        if platform.system() == "Windows":
-            try:
-                import win32pdh
-                import win32pdhutil
-                import win32api
-                import win32con
-                import win32process
-                windows_counters = True
-                
-                self.hq = win32pdh.OpenQuery()
-                self.processor_path = win32pdh.MakeCounterPath((None, "Processor", "_Total", None, 0, "% Processor Time"))
-                self.processor_counter = win32pdh.AddCounter(self.hq, self.processor_path)
-                win32pdh.CollectQueryData(self.hq)
-                
-                logging.info("Windows performance counters activated with Task Manager precision")
-            except Exception as e:
-                windows_counters = False
-                logging.warning(f"Windows performance counters unavailable: {e}")
-        
-        task_manager_interval = 0.5
+        x = np.arange(data_points, dtype=float)
+        self.lines = []
+        self.fills = []
+        self.verts = []
+        self.markers = []
+        for ax in self.axes:
+            line, = ax.plot(x, np.zeros(data_points), linewidth=1.0, animated=True)
+            # Spikes flagged by the anomaly detector
+            marker, = ax.plot([], [], linestyle="", marker="o", markersize=3, animated=True)
+
+            # Area polygon: baseline start, one vertex per sample, baseline end
+            verts = np.zeros((data_points + 2, 2))
+            verts[1:-1, 0] = x
+            verts[-1, 0] = data_points - 1
+            fill = Polygon(verts, closed=True, alpha=0.3, linewidth=0, animated=True)
+            ax.add_patch(fill)
+
+            ax.set_xlim(0, data_points - 1)
+            ax.set_ylim(0, 1.2)
+            ax.set_xticks([])
+            ax.set_yticks([])
+
+            self.lines.append(line)
+            self.fills.append(fill)
+            self.verts.append(verts)
+            self.markers.append(marker)
+
+        self.artists = self.fills + self.lines + self.markers
+
+    def apply_theme(self, theme):
+        for line, fill, color in zip(self.lines, self.fills, (theme["dl_color"], theme["ul_color"])):
+            line.set_color(color)
+            fill.set_facecolor(color)
+        for marker in self.markers:
+            marker.set_color(theme["close_bg"])
+
+    def update(self, download_data, upload_data, max_dl, max_ul, flags=None):
+        """Push new samples into the existing artists and return them for blitting"""
+        for line, fill, verts, marker, bit, data, scale in zip(
+                self.lines, self.fills, self.verts, self.markers, (FLAG_DOWNLOAD, FLAG_UPLOAD),
+                (download_data, upload_data), (max_dl, max_ul)):
+            values = data / scale
+            line.set_ydata(values)
+            verts[1:-1, 1] = values
+            fill.set_xy(verts)
+            spikes = np.flatnonzero(flags & bit) if flags is not None else []
+            marker.set_data(spikes, np.minimum(values[spikes], 1.2))
+        return self.artists
+
+class TkSparklineRenderer:
+    """Draws the download/upload area graphs straight onto a tk.Canvas, without matplotlib.
+
+    The panel rectangles, area polygons and lines are created once and each
+    frame only moves their coordinates. Tk has no alpha, so the 30% area fill
+    is pre-blended with the plot background. Values use the same normalised
+    0-1.2 range as BlitPlotRenderer. Flagged spikes get small dots from a
+    pool of hidden ovals.
+    """
+
+    def __init__(self, master, data_points, width=95, height=35):
+        self.data_points = data_points
+        self.canvas = tk.Canvas(master, width=width, height=height,
+                                highlightthickness=0, borderwidth=0)
+        self.panels = []
+        self.fills = []
+        self.lines = []
+        for _ in range(2):
+            self.panels.append(self.canvas.create_rectangle(0, 0, 0, 0, outline=""))
+            self.fills.append(self.canvas.create_polygon(0, 0, 0, 0, 0, 0, outline=""))
+            self.lines.append(self.canvas.create_line(0, 0, 0, 0, width=1))
+        self.dots = ([], [])
+        self.dot_color = "red"
+        # Nothing for FuncAnimation to blit
+        self.artists = []
+        
+        self.values = (np.zeros(data_points), np.zeros(data_points))
+        self.flags = np.zeros(data_points, dtype=np.uint8)
+        # Baseline start, one vertex per sample, baseline end
+        self.points = np.zeros((data_points + 2, 2))
+        self.bounds = []
+        self.layout(width, height)
+        self.canvas.bind("<Configure>", lambda event: self.layout(event.width, event.height))
+
+    def get_tk_widget(self):
+        return self.canvas
+
+    def layout(self, width, height, margin=1, gap=2):
+        panel_height = max((height - 2 * margin - gap) / 2.0, 1.0)
+        left = margin
+        right = max(width - margin, left + 1)
+        self.points[1:-1, 0] = np.linspace(left, right, self.data_points)
+        self.points[0, 0] = left
+        self.points[-1, 0] = right
+        self.bounds = []
+        for i, panel in enumerate(self.panels):
+            top = margin + i * (panel_height + gap)
+            bottom = top + panel_height
+            self.canvas.coords(panel, left, top, right, bottom)
+            self.bounds.append((top, bottom))
+        self.redraw()
+
+    def blend(self, color, background, alpha):
+        fg = self.canvas.winfo_rgb(color)
+        bg = self.canvas.winfo_rgb(background)
+        return "#" + "".join(f"{int(f * alpha + b * (1 - alpha)) >> 8:02x}" for f, b in zip(fg, bg))
+
+    def apply_theme(self, theme):
+        self.canvas.configure(bg=theme["bg"])
+        for panel, fill, line, color in zip(self.panels, self.fills, self.lines,
+                                            (theme["dl_color"], theme["ul_color"])):
+            self.canvas.itemconfig(panel, fill=theme["plot_bg"])
+            self.canvas.itemconfig(fill, fill=self.blend(color, theme["plot_bg"], 0.3))
+            self.canvas.itemconfig(line, fill=color)
+        self.dot_color = theme["close_bg"]
+        for dot in self.dots[0] + self.dots[1]:
+            self.canvas.itemconfig(dot, fill=self.dot_color)
+
+    def update(self, download_data, upload_data, max_dl, max_ul, flags=None):
+        """Move the existing polygons and lines to the new samples"""
+        self.values = (download_data / max_dl, upload_data / max_ul)
+        if flags is not None:
+            self.flags = flags
+        self.redraw()
+        return self.artists
+
+    def redraw(self, radius=1.5):
+        points = self.points
+        for fill, line, dots, bit, values, (top, bottom) in zip(
+                self.fills, self.lines, self.dots, (FLAG_DOWNLOAD, FLAG_UPLOAD), self.values, self.bounds):
+            points[:, 1] = bottom
+            points[1:-1, 1] -= np.minimum(values, 1.2) * ((bottom - top) / 1.2)
+            self.canvas.coords(fill, points.ravel().tolist())
+            self.canvas.coords(line, points[1:-1].ravel().tolist())
+            
+            spikes = np.flatnonzero(self.flags & bit)
+            while len(dots) < len(spikes):
+                dots.append(self.canvas.create_oval(0, 0, 0, 0, outline="", fill=self.dot_color))
+            for dot, index in zip(dots, spikes):
+                x, y = points[index + 1]
+                self.canvas.coords(dot, x - radius, y - radius, x + radius, y + radius)
+                self.canvas.itemconfig(dot, state="normal")
+            for dot in dots[len(spikes):]:
+                self.canvas.itemconfig(dot, state="hidden")
+
+class FrameTimer:
+    """Tk based event source for FuncAnimation that records how long each frame takes.
+
+    If should_draw is given, a tick where it returns False skips the frame
+    entirely, so nothing is recomputed or redrawn between samples.
+    """
+
+    def __init__(self, widget, interval=200, history=100, should_draw=None):
+        self.widget = widget
+        self.interval = interval
+        self.should_draw = should_draw
+        self.callbacks = []
+        self.frame_times = deque(maxlen=history)
+        self.histogram = LatencyHistogram()
+        self.frame_count = 0
+        self.skipped_count = 0
+        self._after_id = None
+
+    def add_callback(self, func, *args, **kwargs):
+        self.callbacks.append((func, args, kwargs))
+        return func
+
+    def remove_callback(self, func, *args, **kwargs):
+        self.callbacks = [cb for cb in self.callbacks if cb[0] != func]
+
+    def start(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        if self._after_id is None:
+            self._after_id = self.widget.after(self.interval, self._on_timer)
 
-        while self.running:
-            try:
-                if platform.system() == "Windows" and windows_counters:
-                    try:
-                        win32pdh.CollectQueryData(self.hq)
-                        time.sleep(task_manager_interval)
-                        win32pdh.CollectQueryData(self.hq)
-                        _, processor_raw = win32pdh.GetFormattedCounterValue(self.processor_counter, win32pdh.PDH_FMT_DOUBLE)
-                        cpu_percent = processor_raw
-                        
-                    except Exception as e:
-                        try:
-                            import ctypes
-                            from ctypes.wintypes import FILETIME
-                            
-                            class FILETIME(ctypes.Structure):
-                                _fields_ = [("dwLowDateTime", ctypes.c_ulong),
-                                          ("dwHighDateTime", ctypes.c_ulong)]
-                            
-                            kernel32 = ctypes.windll.kernel32
-                            idle_time = FILETIME()
-                            kernel_time = FILETIME()
-                            user_time = FILETIME()
-                            
-                            kernel32.GetSystemTimes(ctypes.byref(idle_time), 
-                                                 ctypes.byref(kernel_time),
-                                                 ctypes.byref(user_time))
-                            
-                            idle_initial = (idle_time.dwHighDateTime << 32) + idle_time.dwLowDateTime
-                            kernel_initial = (kernel_time.dwHighDateTime << 32) + kernel_time.dwLowDateTime
-                            user_initial = (user_time.dwHighDateTime << 32) + user_time.dwLowDateTime
-                            
-                            time.sleep(task_manager_interval)
-                            
-                            kernel32.GetSystemTimes(ctypes.byref(idle_time), 
-                                                 ctypes.byref(kernel_time),
-                                                 ctypes.byref(user_time))
-                                                 
-                            idle_end = (idle_time.dwHighDateTime << 32) + idle_time.dwLowDateTime
-                            kernel_end = (kernel_time.dwHighDateTime << 32) + kernel_time.dwLowDateTime
-                            user_end = (user_time.dwHighDateTime << 32) + user_time.dwLowDateTime
-                            
-                            idle_delta = idle_end - idle_initial
-                            kernel_delta = kernel_end - kernel_initial
-                            user_delta = user_end - user_initial
-                            
-                            system_delta = kernel_delta + user_delta
-                            
-                            if system_delta > 0:
-                                cpu_percent = 100.0 * (1.0 - idle_delta / float(system_delta))
-                            else:
-                                cpu_percent = 0.0
-                                
-                        except Exception as inner_e:
-                            logging.error(f"All Windows-specific methods failed, using psutil: {inner_e}")
-                            cpu_percent = psutil.cpu_percent(interval=0.1)
-                            
-                else:
-                    cpu_percent = psutil.cpu_percent(interval=0.1)
-                    
-                cpu_percent = max(0.0, min(100.0, cpu_percent))
-                
-                try:
-                    cpu_per_core = psutil.cpu_percent(interval=0, percpu=True)
-                except Exception as core_e:
-                    logging.error(f"Error getting per-core CPU: {core_e}")
-                    cpu_per_core = [0.0] * self.core_count
-                
-                try:
-                    mem = psutil.virtual_memory()
-                    ram_percent = mem.percent
-                    ram_used = mem.used
-                    ram_total = mem.total
-                except Exception as e:
-                    logging.error(f"Error getting memory info: {e}")
-                    ram_percent = 0.0
-                    ram_used = 0
-                    ram_total = 1
-                
-                try:
-                    processes = []
-                    for proc in psutil.process_iter(['pid', 'name']):
-                        try:
-                            proc.cpu_percent()
-                        except:
-                            pass
-                    
-                    time.sleep(0.02)
-                    
-                    for proc in psutil.process_iter(['pid', 'name']):
-                        try:
-                            cpu_usage = proc.cpu_percent()
-                            if cpu_usage > 0.5:
-                                name = proc.name() if hasattr(proc, 'name') and callable(proc.name) else proc.info.get('name', 'Unknown')
-                                processes.append((cpu_usage, name))
-                        except:
-                            pass
-                            
-                    processes.sort(reverse=True)
-                    top_processes = processes[:3]
-                except Exception as e:
-                    logging.error(f"Error getting process info: {e}")
-                    top_processes = []
-
-                with self.system_stats_lock:
-                    self.cpu_usage = cpu_percent
-                    self.cpu_per_core = cpu_per_core
-                    self.ram_usage = ram_percent
-                    self.ram_used = ram_used
-                    self.ram_total = ram_total
-                    self.top_processes = top_processes
-                
-                time.sleep(0.02)
-                
-            except Exception as e:
-                logging.error(f"Error updating system stats: {e}")
-                time.sleep(0.1)
-    
-    def get_system_stats(self):
-        with self.system_stats_lock:
-            return {
-                "cpu_percent": self.cpu_usage,
-                "cpu_per_core": self.cpu_per_core,
-                "ram_percent": self.ram_usage,
-                "ram_used": self.ram_used,
-                "ram_total": self.ram_total,
-                "top_processes": self.top_processes
-            }
-    
-    def get_speeds(self):
-        with self.lock:
-            return self.download_speed, self.upload_speed
-    
-    def get_monitoring_method(self):
-        """Returns the current network monitoring method"""
-        return getattr(self, 'active_method', "Monitoring all interfaces")
-    
     def stop(self):
-        self.running = False
-    
-    # Add method to allow selecting a specific interface
-    def set_interface(self, interface_name=None):
-        """Set a specific network interface to monitor or None for all interfaces"""
-        self.selected_interface = interface_name
-        
-    def get_available_interfaces(self):
-        """Return a list of available network interfaces"""
-        try:
-            interfaces = psutil.net_io_counters(pernic=True)
-            # Filter out loopback interfaces
-            return [nic for nic in interfaces.keys() if not nic.startswith('lo')]
-        except Exception as e:
-            logging.error(f"Error getting interfaces: {e}")
-            return []
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _on_timer(self):
+        self._after_id = None
+        if self.should_draw is not None and not self.should_draw():
+            self.skipped_count += 1
+            self._after_id = self.widget.after(self.interval, self._on_timer)
+            return
+        start = time.perf_counter()
+        for func, args, kwargs in list(self.callbacks):
+            # Same contract as matplotlib timers: returning False unregisters
+            if func(*args, **kwargs) is False:
+                self.remove_callback(func)
+        elapsed = time.perf_counter() - start
+        self.frame_times.append(elapsed)
+        self.histogram.record(elapsed)
+        self.frame_count += 1
+        if self.callbacks:
+            self._after_id = self.widget.after(self.interval, self._on_timer)
+
+    def get_frame_stats(self):
+        """Returns frame time statistics in milliseconds"""
+        if not self.frame_times:
+            return {"frames": self.frame_count, "skipped": self.skipped_count,
+                    "avg_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+        return {
+            "frames": self.frame_count,
+            "skipped": self.skipped_count,
+            "avg_ms": sum(self.frame_times) / len(self.frame_times) * 1000.0,
+            "max_ms": max(self.frame_times) * 1000.0,
+            "last_ms": self.frame_times[-1] * 1000.0
+        }
+
+class StartupProfiler:
+    """Wall-clock time of each startup phase, reported by --profile-startup"""
+
+    def __init__(self, begin):
+        self.begin = begin
+        self.last = begin
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000.0, (now - self.begin) * 1000.0))
+        self.last = now
+
+    def report(self):
+        return {
+            "phases": [{"phase": name, "ms": round(ms, 1), "at_ms": round(at, 1)}
+                       for name, ms, at in self.phases],
+            "total_ms": round((self.last - self.begin) * 1000.0, 1),
+            "matplotlib_loaded": "matplotlib" in sys.modules
+        }
+
+STARTUP = StartupProfiler(STARTUP_BEGIN)
+STARTUP.mark("imports")
 
 class NetworkSpeedApp:
-    def __init__(self, root):
+    def __init__(self, root, profile_startup=False, remote=None):
         self.root = root
+        self.profile_startup = profile_startup
         self.root.title("")
         self.root.iconify()
         self.root.withdraw()
@@ -438,6 +361,12 @@ class NetworkSpeedApp:
         self.current_theme = config.get("Settings", "theme", fallback="dark")
         self.speed_unit = config.get("Settings", "speed_unit", fallback="None")
         self.show_system_stats = config.getboolean("Settings", "show_system_stats", fallback=True)
+        self.renderer_mode = config.get("Settings", "renderer", fallback="blit")
+        # 0 plots raw samples, otherwise the rollup tier with this bucket size
+        self.plot_window = config.getint("Settings", "plot_window", fallback=0)
+        if self.renderer_mode not in ("blit", "classic", "tk"):
+            logging.warning(f"Unknown renderer '{self.renderer_mode}', using blit")
+            self.renderer_mode = "blit"
         
         if self.current_theme == "system":
             self.detect_system_theme()
@@ -478,6 +407,8 @@ class NetworkSpeedApp:
         self.left_frame.pack(side=tk.LEFT)
         
         # Create help button with explicit background
+        # Shift-click adds the hidden Diagnostics entry to the menu
+        self.diagnostics_requested = False
         self.help_button = tk.Button(self.left_frame, text="?", command=self.show_menu,
                                    font=("Arial", 8, "bold"), relief=tk.FLAT, 
                                    padx=0, pady=0, bd=0, width=2,
@@ -518,8 +449,31 @@ class NetworkSpeedApp:
         self.close_area_frame.pack(side=tk.RIGHT, padx=0, pady=0)
         
         # No need to apply styles again since we already set them in the creation
+        STARTUP.mark("window")
 
-        self.monitor = EnhancedNetworkMonitor()
+        # host[:port] of a BitMeter agent to show instead of this machine
+        remote = remote or config.get("Settings", "remote_agent", fallback="").strip() or None
+        self.remote = remote is not None
+        self.exporter = None
+        if self.remote:
+            # History, exports and the agent port stay with the agent itself
+            self.monitor = create_remote_monitor(remote, config)
+        else:
+            self.monitor = EnhancedNetworkMonitor(config)
+            history_writer = create_history_writer(config)
+            if history_writer is not None:
+                self.monitor.add_sink(history_writer)
+            file_exporter = create_file_exporter(config, self.monitor.core_count)
+            if file_exporter is not None:
+                self.monitor.add_sink(file_exporter)
+            create_agent_server(self.monitor, config)
+            self.exporter = create_exporter(self.monitor, config)
+        
+        # Alerts fire on the sampler thread; the overlay flashes on its next frame
+        self.pending_alerts = deque()
+        self.alert_engine = create_alert_engine(self.monitor, config)
+        if self.alert_engine is not None:
+            self.alert_engine.add_listener(self.pending_alerts.append)
         
         self.data_frame = tk.Frame(self.content_frame)
         self.data_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=0, pady=0)
@@ -531,20 +485,19 @@ class NetworkSpeedApp:
         self.data_frame.rowconfigure(2, weight=0)
         
         self.data_points = 40
-        self.download_data = deque([0] * self.data_points, maxlen=self.data_points)
-        self.upload_data = deque([0] * self.data_points, maxlen=self.data_points)
-        self.cpu_data = deque([0] * self.data_points, maxlen=self.data_points)
-        self.ram_data = deque([0] * self.data_points, maxlen=self.data_points)
-        
-        self.fig = Figure(figsize=(0.95, 0.35), dpi=100)
-        self.fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98, hspace=0.1)
-        
-        self.ax1 = self.fig.add_subplot(2, 1, 1)
-        self.ax2 = self.fig.add_subplot(2, 1, 2)
-        
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.data_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().grid(row=0, column=0, rowspan=2, sticky="nsew", padx=(2, 0))
+        # Plot buffers, refilled from the monitor's sample store every frame
+        self.download_data = np.zeros(self.data_points)
+        self.upload_data = np.zeros(self.data_points)
+        self.anomaly_data = np.zeros(self.data_points, dtype=np.uint8)
+        
+        # The graphs are built by create_plot() once the first sample is on screen
+        self.fig = self.ax1 = self.ax2 = None
+        self.canvas = None
+        self.plot_renderer = None
+        self.plot_ready = False
+        self.plot_scheduled = False
+        self.plot_placeholder = tk.Frame(self.data_frame, width=95, height=35)
+        self.plot_placeholder.grid(row=0, column=0, rowspan=2, sticky="nsew", padx=(2, 0))
         
         self.dl_label = tk.Label(self.data_frame, text="↓ 0 B/s", font=("Consolas", 9),
                              anchor="w", padx=2)
@@ -583,17 +536,29 @@ class NetworkSpeedApp:
         self.ram_canvas = tk.Canvas(self.ram_frame, height=5, highlightthickness=0)
         self.ram_canvas.pack(side=tk.BOTTOM, fill=tk.X, expand=True, pady=(2, 0))
         
-        self.cpu_tooltip = ToolTip(self.cpu_label, "Loading process data...")
-        self.ram_tooltip = ToolTip(self.ram_label, "System memory usage")
+        # Tooltip text is only built while a tooltip is shown
+        self.cpu_tooltip = ToolTip(self.cpu_label, text_func=self.get_cpu_tooltip_text)
+        self.ram_tooltip = ToolTip(self.ram_label, text_func=self.get_ram_tooltip_text)
+        self.dl_tooltip = ToolTip(self.dl_label, text_func=self.get_talker_tooltip_text)
+        self.ul_tooltip = ToolTip(self.ul_label, text_func=self.get_talker_tooltip_text)
+        
+        # Last values pushed to each widget, so unchanged ones are left alone
+        self.frame_key = None
+        # Source store and generation the graph was last drawn from
+        self.plot_key = None
+        self.label_texts = {}
+        self.bar_states = {}
         
         self.style = ttk.Style()
         
         self.ani = None
+        self.frame_timer = None
         
         self.apply_theme(self.current_theme)
+        STARTUP.mark("widgets")
         
-        self.monitor_thread = threading.Thread(target=self.monitor.update_speeds, daemon=True)
-        self.monitor_thread.start()
+        self.monitor.start()
+        STARTUP.mark("monitor")
         
         self.update_status()
         
@@ -616,11 +581,71 @@ class NetworkSpeedApp:
 
         self.fix_menu_style()
 
+    def create_plot(self):
+        """Build the graph renderer and hook it to the running frame timer"""
+        if self.plot_ready:
+            return
+        if self.renderer_mode == "tk":
+            # matplotlib is never imported in this mode
+            self.plot_renderer = TkSparklineRenderer(self.data_frame, self.data_points)
+            self.canvas = self.plot_renderer
+        else:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            
+            self.fig = Figure(figsize=(0.95, 0.35), dpi=100)
+            self.fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98, hspace=0.1)
+            
+            self.ax1 = self.fig.add_subplot(2, 1, 1)
+            self.ax2 = self.fig.add_subplot(2, 1, 2)
+            
+            if self.renderer_mode == "blit":
+                self.plot_renderer = BlitPlotRenderer(self.ax1, self.ax2, self.data_points)
+            
+            self.canvas = FigureCanvasTkAgg(self.fig, master=self.data_frame)
+        
+        self.plot_placeholder.destroy()
+        self.plot_placeholder = None
+        self.canvas.get_tk_widget().grid(row=0, column=0, rowspan=2, sticky="nsew", padx=(2, 0))
+        self.plot_ready = True
+        self.update_theme_colors()
+        
+        if self.fig is not None and self.frame_timer is not None:
+            from matplotlib import animation, rcParams
+            # FuncAnimation takes over the frame timer from here on
+            self.frame_timer.remove_callback(self.update_plot)
+            self.ani = animation.FuncAnimation(
+                self.fig,
+                self.update_plot,
+                init_func=self.get_plot_artists,
+                event_source=self.frame_timer,
+                cache_frame_data=False,
+                blit=self.plot_renderer is not None
+            )
+            _animations.append(self.ani)
+            
+            # Apply matplotlib backend configurations
+            rcParams['figure.autolayout'] = True  # Use tight layout to avoid resizing
+            self.canvas.draw_idle()
+        # Draw the graphs on the next tick even without a new sample
+        self.frame_key = None
+        self.plot_key = None
+        STARTUP.mark("plot")
+        
+        if self.profile_startup:
+            report = STARTUP.report()
+            logging.info(f"Startup profile: {report}")
+            print(json.dumps(report, indent=2))
+            self.window.after(500, self.close_app)
+
     def setup_button_effects(self):
         """Add hover effects to buttons"""
         # Help button hover effects
         self.help_button.bind("<Enter>", self.on_help_hover_enter)
         self.help_button.bind("<Leave>", self.on_help_hover_leave)
+        # The button command still opens the menu on release
+        self.help_button.bind("<Shift-ButtonPress-1>",
+                              lambda e: setattr(self, "diagnostics_requested", True))
         
         # Close button hover effects  
         self.close_button.bind("<Enter>", self.on_close_hover_enter)
@@ -723,15 +748,20 @@ class NetworkSpeedApp:
         theme = THEMES[self.current_theme]
         self.window.after(10, lambda: self.close_button.config(bg=theme["close_bg"]))
     
-    def update_status(self):
+    def refresh_status(self):
         try:
             method = self.monitor.get_monitoring_method()
+            firing = self.alert_engine.firing() if self.alert_engine is not None else []
+            if firing:
+                method = "Alert: " + ", ".join(firing)
             # Use original text format without extra padding
             self.status_label.config(text=method)
             
         except Exception as e:
             logging.error(f"Error updating status: {e}")
-        
+    
+    def update_status(self):
+        self.refresh_status()
         self.window.after(2000, self.update_status)
     
     def detect_system_theme(self):
@@ -830,6 +860,14 @@ class NetworkSpeedApp:
         self.cpu_canvas.configure(bg=theme["plot_bg"])
         self.ram_canvas.configure(bg=theme["plot_bg"])
         
+        if not self.plot_ready:
+            self.plot_placeholder.configure(bg=theme["bg"])
+            return
+        
+        if self.fig is None:
+            self.plot_renderer.apply_theme(theme)
+            return
+        
         self.fig.patch.set_facecolor(theme["bg"])
         for ax in [self.ax1, self.ax2]:
             ax.set_facecolor(theme["plot_bg"])
@@ -839,6 +877,13 @@ class NetworkSpeedApp:
             ax.spines['bottom'].set_visible(False)
             ax.spines['left'].set_visible(False)
         
+        if self.plot_renderer is not None:
+            self.plot_renderer.apply_theme(theme)
+            # The cached blit background still has the old colors
+            if self.ani is not None:
+                from matplotlib.backend_bases import ResizeEvent
+                self.canvas.callbacks.process("resize_event", ResizeEvent("resize_event", self.canvas))
+        
         self.canvas.draw()
     
     def show_menu(self):
@@ -895,7 +940,20 @@ class NetworkSpeedApp:
             interface_menu.add_command(label=interface, 
                                    command=lambda intf=interface: self.select_interface(intf))
         
+        # Add time window submenu, one entry per rollup tier
+        window_menu = tk.Menu(menu, tearoff=0, 
+                          bg=THEMES[self.current_theme]["menu_bg"], 
+                          fg=THEMES[self.current_theme]["menu_fg"], 
+                          activebackground=THEMES[self.current_theme]["menu_active_bg"], 
+                          activeforeground=THEMES[self.current_theme]["fg"],
+                          bd=0, relief=tk.FLAT, borderwidth=0)
+        window_menu.add_command(label="Live", command=lambda: self.set_plot_window(0))
+        for seconds in self.monitor.rollups.resolutions():
+            window_menu.add_command(label=format_duration(seconds * self.data_points),
+                                    command=lambda sec=seconds: self.set_plot_window(sec))
+        
         menu.add_cascade(label="Network Interface", menu=interface_menu)
+        menu.add_cascade(label="Time Window", menu=window_menu)
         menu.add_cascade(label="Theme", menu=theme_menu)
         menu.add_cascade(label="Speed Unit", menu=unit_menu)
         menu.add_separator()
@@ -905,9 +963,20 @@ class NetworkSpeedApp:
         else:
             menu.add_command(label="Show CPU/RAM", command=self.toggle_system_stats)
         
+        # Bursts are captured on the agent, so there is no entry for a remote host
+        if not self.remote:
+            if self.monitor.burst is not None and self.monitor.burst.is_running():
+                menu.add_command(label="Burst Capture (running)", state=tk.DISABLED)
+            else:
+                menu.add_command(label=f"Burst Capture ({format_duration(self.monitor.burst_duration)})",
+                                 command=self.start_burst_capture)
         menu.add_command(label="Reset Application", command=self.reset_app)
         
         menu.add_separator()
+        # Hidden entry, shown when the menu is opened with Shift held
+        if self.diagnostics_requested:
+            self.diagnostics_requested = False
+            menu.add_command(label="Diagnostics", command=self.show_diagnostics)
         menu.add_command(label="About", command=self.show_about)
         
         x = self.help_button.winfo_rootx()
@@ -920,9 +989,8 @@ class NetworkSpeedApp:
         return "break"  # Prevent default handling
     
     def close_app(self):
+        logging.info(f"Frame stats ({self.renderer_mode}): {self.get_frame_stats()}")
         self.monitor.stop()
-        if self.monitor_thread.is_alive():
-            self.monitor_thread.join(0.5)
         self.window.destroy()
         self.root.destroy()
     
@@ -938,6 +1006,16 @@ class NetworkSpeedApp:
         config.set("Settings", "speed_unit", str(unit))
         save_config(config)
     
+    def set_plot_window(self, seconds):
+        self.plot_window = seconds
+        # Let the y-scale settle on the new series instead of easing from the old one
+        if hasattr(self, 'current_max_dl'):
+            del self.current_max_dl
+            del self.current_max_ul
+        config = load_config()
+        config.set("Settings", "plot_window", str(seconds))
+        save_config(config)
+    
     def toggle_system_stats(self):
         self.show_system_stats = not self.show_system_stats
         
@@ -960,8 +1038,6 @@ class NetworkSpeedApp:
             return
             
         self.monitor.stop()
-        if self.monitor_thread.is_alive():
-            self.monitor_thread.join(1.0)
         
         try:
             if os.path.exists(CONFIG_FILE):
@@ -978,6 +1054,90 @@ class NetworkSpeedApp:
         subprocess.Popen([python, script_path])
         sys.exit(0)
     
+    def start_burst_capture(self):
+        """Sample the selected interface every few ms; the graph keeps updating meanwhile"""
+        try:
+            capture = self.monitor.start_burst()
+        except (RuntimeError, OSError) as e:
+            messagebox.showerror("Burst Capture", str(e), parent=self.window)
+            return
+        
+        # The capture finishes on its own thread; Tk is only touched from here
+        def poll():
+            if not capture.done.is_set():
+                self.window.after(100, poll)
+                return
+            if capture.result is None:
+                messagebox.showerror("Burst Capture", f"Capture failed: {capture.error}", parent=self.window)
+                return
+            logging.info(f"Burst capture: {capture.result}")
+            messagebox.showinfo("Burst Capture", format_burst(capture.result, self.speed_unit), parent=self.window)
+        
+        poll()
+    
+    def format_self_stats(self, stats):
+        process = stats["process"]
+        lines = [
+            f"CPU time: {process['cpu_user_seconds']:.2f} s user, {process['cpu_system_seconds']:.2f} s system",
+            f"Memory: {process['rss_bytes'] / 2**20:.1f} MB RSS, {process['threads']} threads"
+        ]
+        remote = stats.get("remote")
+        if remote:
+            lines += [f"Agent: {remote['agent']} ({'connected' if remote['connected'] else 'reconnecting'}, "
+                      f"{remote['connects']} connects)",
+                      f"Received: {remote['rows_received']} rows, {remote['bytes_received']} bytes "
+                      f"({remote['bytes_per_row']:.1f} B/row)"]
+        scheduler = stats.get("scheduler")
+        if scheduler:
+            lines += [f"Ticks: {scheduler['ticks']} ({scheduler['late_ticks']} late, {scheduler['skipped_ticks']} skipped)",
+                      "", "Collectors (mean / p99 / max ms):"]
+            for name, hist in stats["collectors"].items():
+                lines.append(f"  {name:<13}{hist['mean_ms']:7.3f} {hist['p99_ms']:7.3f} {hist['max_ms']:8.3f}")
+        frames = stats.get("frames")
+        if frames:
+            hist = frames["histogram"]
+            lines += ["", f"Frames: {frames['frames']} drawn, {frames['skipped']} skipped",
+                      f"  {'update_plot':<13}{hist['mean_ms']:7.3f} {hist['p99_ms']:7.3f} {hist['max_ms']:8.3f}"]
+        if "locks" in stats:
+            lines += ["", "Lock waits (mean / p99 / max ms):"]
+        for name, hist in stats.get("locks", {}).items():
+            lines.append(f"  {name:<18}{hist['mean_ms']:6.3f} {hist['p99_ms']:6.3f} {hist['max_ms']:7.3f}")
+        return "\n".join(lines)
+    
+    def show_diagnostics(self):
+        """Live view of BitMeter's own overhead, with a JSON dump for bug reports"""
+        theme = THEMES[self.current_theme]
+        window = tk.Toplevel(self.window)
+        window.title("Bit Meter Diagnostics")
+        window.configure(bg=theme["bg"])
+        window.attributes("-topmost", True)
+        
+        text = tk.Text(window, width=52, height=22, font=("Consolas", 8), relief=tk.FLAT,
+                       bg=theme["plot_bg"], fg=theme["fg"], highlightthickness=0)
+        text.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
+        
+        def save():
+            path = os.path.abspath(time.strftime("bitmeter-selfstats-%Y%m%d-%H%M%S.json"))
+            with open(path, "w") as f:
+                json.dump(self.monitor.get_self_stats(self.frame_timer), f, indent=2)
+            logging.info(f"Self stats written to {path}")
+            messagebox.showinfo("Diagnostics", f"Saved to {path}", parent=window)
+        
+        tk.Button(window, text="Save JSON", command=save, relief=tk.FLAT,
+                  bg=theme["button_bg"], fg=theme["button_fg"],
+                  activebackground=theme["button_active_bg"]).pack(pady=(0, 4))
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, self.format_self_stats(self.monitor.get_self_stats(self.frame_timer)))
+            text.config(state=tk.DISABLED)
+            window.after(1000, refresh)
+        
+        refresh()
+    
     def show_about(self):
         about_theme = THEMES["dark"]
         
@@ -1052,6 +1212,7 @@ class NetworkSpeedApp:
         
         # Function to open the GitHub link
         def open_github(event):
+            import webbrowser
             webbrowser.open_new("https://github.com/Bijoy121/Bit-Meter")
         
         # Bind the click event
@@ -1117,83 +1278,136 @@ class NetworkSpeedApp:
             y = self.window.winfo_y() + deltay
             self.window.geometry(f"+{x}+{y}")
     
+    def set_label_text(self, label, text):
+        if self.label_texts.get(label) != text:
+            self.label_texts[label] = text
+            label.config(text=text)
+    
+    def draw_bar(self, canvas, percent, color):
+        """Resize the usage bar in place, only when its pixel width or color changed"""
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        if width <= 1:
+            return
+        bar_width = max(1, int(width * (percent / 100.0)))
+        state = self.bar_states.get(canvas)
+        if state is not None and state[1:] == (bar_width, height, color):
+            return
+        if state is None:
+            item = canvas.create_rectangle(0, 0, bar_width, height, fill=color, outline="")
+        else:
+            item = state[0]
+            canvas.coords(item, 0, 0, bar_width, height)
+            if state[3] != color:
+                canvas.itemconfig(item, fill=color)
+        self.bar_states[canvas] = (item, bar_width, height, color)
+    
+    def get_cpu_tooltip_text(self):
+        top_processes = self.monitor.get_system_stats().get("top_processes", [])
+        top_process_text = "Top CPU processes:\n"
+        if top_processes:
+            for proc in top_processes:
+                if len(proc) >= 2 and proc[0] > 0:
+                    top_process_text += f"• {proc[1]}: {int(proc[0])}%\n"
+        else:
+            top_process_text += "No processes with significant CPU usage"
+        return top_process_text
+    
+    def get_ram_tooltip_text(self):
+        system_stats = self.monitor.get_system_stats()
+        ram_gb_used = system_stats["ram_used"] / (1024**3)
+        ram_gb_total = system_stats["ram_total"] / (1024**3)
+        ram_tooltip_text = f"Memory usage: {int(system_stats['ram_percent'])}%\n"
+        ram_tooltip_text += f"Used: {ram_gb_used:.1f} GB\n"
+        ram_tooltip_text += f"Total: {ram_gb_total:.1f} GB"
+        return ram_tooltip_text
+    
+    def get_talker_tooltip_text(self):
+        top_talkers = self.monitor.get_system_stats().get("top_talkers", [])
+        talker_text = "Top talkers:\n"
+        if top_talkers:
+            for talker_dl, talker_ul, name in top_talkers:
+                talker_dl_text, talker_dl_unit = format_speed(talker_dl, self.speed_unit)
+                talker_ul_text, talker_ul_unit = format_speed(talker_ul, self.speed_unit)
+                talker_text += (f"• {name}: ↓ {talker_dl_text} {talker_dl_unit}"
+                                f"  ↑ {talker_ul_text} {talker_ul_unit}\n")
+        elif not self.monitor.talkers_available():
+            talker_text += "Not available on this system"
+        else:
+            talker_text += "No significant network usage"
+        return talker_text
+    
+    def set_border_color(self, color=None):
+        """Color the window border, or restore the theme's colors with None"""
+        theme = THEMES[self.current_theme]
+        self.main_frame.configure(bg=color or theme["bg"])
+        self.border_frame.configure(bg=color or theme["highlight_bg"])
+    
+    def flash_alert(self, flashes=3):
+        """Blink the window border in the alert color"""
+        color = THEMES[self.current_theme]["close_bg"]
+        for i in range(flashes):
+            self.window.after(i * 300, lambda: self.set_border_color(color))
+            self.window.after(i * 300 + 150, self.set_border_color)
+    
     def update_plot(self, i):
         try:
             theme = THEMES[self.current_theme]
             
+            if self.pending_alerts:
+                events = [self.pending_alerts.popleft() for _ in range(len(self.pending_alerts))]
+                if any(event["state"] == "firing" for event in events):
+                    self.flash_alert()
+                    self.refresh_status()
+            
             dl_speed, ul_speed = self.monitor.get_speeds()
             
             system_stats = self.monitor.get_system_stats()
             cpu_percent = system_stats["cpu_percent"]
             ram_percent = system_stats["ram_percent"]
-            ram_used = system_stats["ram_used"]
-            ram_total = system_stats["ram_total"]
-            cpu_per_core = system_stats.get("cpu_per_core", [])
-            top_processes = system_stats.get("top_processes", [])
-            
-            if hasattr(self, 'cpu_tooltip'):
-                top_process_text = "Top CPU processes:\n"
-                if top_processes:
-                    for i, proc in enumerate(top_processes):
-                        if len(proc) >= 2 and proc[0] > 0:
-                            top_process_text += f"• {proc[1]}: {int(proc[0])}%\n"
-                else:
-                    top_process_text += "No processes with significant CPU usage"
-                self.cpu_tooltip.update_text(top_process_text)
-
-            if hasattr(self, 'ram_tooltip'):
-                ram_gb_used = ram_used / (1024**3)
-                ram_gb_total = ram_total / (1024**3)
-                ram_tooltip_text = f"Memory usage: {int(ram_percent)}%\n"
-                ram_tooltip_text += f"Used: {ram_gb_used:.1f} GB\n"
-                ram_tooltip_text += f"Total: {ram_gb_total:.1f} GB"
-                self.ram_tooltip.update_text(ram_tooltip_text)
             
-            self.download_data.append(dl_speed)
-            self.upload_data.append(ul_speed)
-            self.cpu_data.append(cpu_percent)
-            self.ram_data.append(ram_percent)
+            # Only a visible tooltip is rebuilt
+            for tooltip in (self.cpu_tooltip, self.ram_tooltip, self.dl_tooltip, self.ul_tooltip):
+                tooltip.refresh()
             
             dl_text, dl_unit = format_speed(dl_speed, self.speed_unit)
             ul_text, ul_unit = format_speed(ul_speed, self.speed_unit)
             
-            self.dl_label.config(text=f"D(↓) {dl_text} {dl_unit}")
-            self.ul_label.config(text=f"U(↑) {ul_text} {ul_unit}")
+            self.set_label_text(self.dl_label, f"D(↓) {dl_text} {dl_unit}")
+            self.set_label_text(self.ul_label, f"U(↑) {ul_text} {ul_unit}")
             
-            self.cpu_label.config(text=f"CPU: {int(cpu_percent)}%")
-            self.ram_label.config(text=f"RAM: {int(ram_percent)}%")
+            self.set_label_text(self.cpu_label, f"CPU: {int(cpu_percent)}%")
+            self.set_label_text(self.ram_label, f"RAM: {int(ram_percent)}%")
             
-            width = self.cpu_canvas.winfo_width()
-            height = self.cpu_canvas.winfo_height()
-            if width > 1:
-                self.cpu_canvas.delete("all")
-                bar_width = max(1, int(width * (cpu_percent / 100.0)))
-                self.cpu_canvas.create_rectangle(0, 0, bar_width, height, 
-                                             fill=theme["cpu_color"], outline="")
-                
-            width = self.ram_canvas.winfo_width()
-            height = self.ram_canvas.winfo_height()
-            if width > 1:
-                self.ram_canvas.delete("all")
-                bar_width = max(1, int(width * (ram_percent / 100.0)))
-                self.ram_canvas.create_rectangle(0, 0, bar_width, height, 
-                                             fill=theme["ram_color"], outline="")
-                
-            # Store current background color before clearing
-            bg_color = theme["plot_bg"]
+            self.draw_bar(self.cpu_canvas, cpu_percent, theme["cpu_color"])
+            self.draw_bar(self.ram_canvas, ram_percent, theme["ram_color"])
             
-            # Clear with specific background color
-            self.ax1.clear()
-            self.ax2.clear()
+            if not self.plot_ready:
+                if self.monitor.store.generation > 0 and not self.plot_scheduled:
+                    self.plot_scheduled = True
+                    STARTUP.mark("first sample")
+                    # Load the graphs once the first numbers are painted
+                    self.window.after_idle(self.create_plot)
+                return []
             
+            # The labels follow every sample; the graph only when its own source has new rows,
+            # e.g. once per bucket for a rollup tier
+            store = self.plot_store()
+            plot_key = (id(store), store.generation, self.current_theme, self.plot_window,
+                        self.monitor.selected_interface)
+            if plot_key == self.plot_key:
+                return self.get_plot_artists()
+            self.plot_key = plot_key
+            self.load_plot_data(store)
+                
             # Calculate smooth max values to prevent frequent rescaling
             # Only rescale when really needed (values exceed current scale by 20% or drop below 50%)
             if not hasattr(self, 'current_max_dl'):
-                self.current_max_dl = max(self.download_data) if max(self.download_data) > 0 else 1
-                self.current_max_ul = max(self.upload_data) if max(self.upload_data) > 0 else 1
+                self.current_max_dl = self.download_data.max() if self.download_data.max() > 0 else 1
+                self.current_max_ul = self.upload_data.max() if self.upload_data.max() > 0 else 1
             else:
-                max_dl = max(self.download_data) if max(self.download_data) > 0 else 1
-                max_ul = max(self.upload_data) if max(self.upload_data) > 0 else 1
+                max_dl = self.download_data.max() if self.download_data.max() > 0 else 1
+                max_ul = self.upload_data.max() if self.upload_data.max() > 0 else 1
                 
                 # Only increase scale if new max exceeds current by 20%
                 if max_dl > self.current_max_dl * 1.2:
@@ -1208,6 +1422,18 @@ class NetworkSpeedApp:
                 elif max_ul < self.current_max_ul * 0.5 and max_ul > 0:
                     self.current_max_ul = max(max_ul * 2, 1)  # Smoother downscaling
             
+            if self.plot_renderer is not None:
+                return self.plot_renderer.update(self.download_data, self.upload_data,
+                                                 self.current_max_dl, self.current_max_ul,
+                                                 self.anomaly_data)
+            
+            # Store current background color before clearing
+            bg_color = theme["plot_bg"]
+            
+            # Clear with specific background color
+            self.ax1.clear()
+            self.ax2.clear()
+            
             # Set y-limits with smoothed values and some padding
             self.ax1.set_ylim(0, self.current_max_dl * 1.2)
             self.ax2.set_ylim(0, self.current_max_ul * 1.2)
@@ -1227,6 +1453,14 @@ class NetworkSpeedApp:
             self.ax2.plot(range(self.data_points), list(self.upload_data), 
                         color=theme["ul_color"], linewidth=1.0)
             
+            # Mark samples the anomaly detector flagged as spikes
+            for ax, data, bit in ((self.ax1, self.download_data, FLAG_DOWNLOAD),
+                                  (self.ax2, self.upload_data, FLAG_UPLOAD)):
+                spikes = np.flatnonzero(self.anomaly_data & bit)
+                if len(spikes):
+                    ax.plot(spikes, data[spikes], linestyle="", marker="o", markersize=3,
+                            color=theme["close_bg"])
+            
             # Apply consistent styling for both axes
             for ax in [self.ax1, self.ax2]:
                 ax.set_facecolor(bg_color)
@@ -1244,6 +1478,70 @@ class NetworkSpeedApp:
         
         except Exception as e:
             logging.error(f"Error updating plot: {e}")
+        
+        return self.get_plot_artists()
+
+    def plot_store(self):
+        """The SampleStore the graph draws from: a rollup tier, an interface ring or the main store"""
+        if self.plot_window and self.plot_window in self.monitor.rollups.tiers:
+            return self.monitor.rollups.tier(self.plot_window).store
+        store = None
+        if self.monitor.selected_interface:
+            store = self.monitor.get_interface_store(self.monitor.selected_interface)
+        return store if store is not None else self.monitor.store
+
+    def load_plot_data(self, store=None):
+        """Copy the newest samples into the fixed-size plot buffers, zero padded on the left"""
+        if store is None:
+            store = self.plot_store()
+        if "download_avg" in store.index:
+            download = store.column("download_avg", self.data_points)
+            upload = store.column("upload_avg", self.data_points)
+            # Averaged buckets hide individual spikes
+            flags = None
+        else:
+            # Per-interface rings share the column layout of the main store
+            rows = store.latest(self.data_points)
+            download = rows[:, 1]
+            upload = rows[:, 2]
+            flags = rows[:, store.index["flags"]] if "flags" in store.index else None
+        count = len(download)
+        pad = self.data_points - count
+        self.download_data[:pad] = 0
+        self.upload_data[:pad] = 0
+        self.anomaly_data[:pad] = 0
+        if count:
+            self.download_data[pad:] = download
+            self.upload_data[pad:] = upload
+            self.anomaly_data[pad:] = flags if flags is not None else 0
+
+    def get_plot_artists(self):
+        """Artists redrawn each frame; empty when the classic renderer redraws everything"""
+        if self.plot_renderer is not None:
+            return self.plot_renderer.artists
+        return []
+
+    def start_animation(self, interval=200):
+        """Start refreshing the labels; create_plot() later adds the graphs to the same timer"""
+        self.frame_timer = FrameTimer(self.window, interval=interval, should_draw=self.has_new_frame)
+        self.frame_timer.add_callback(self.update_plot, 0)
+        self.frame_timer.start()
+        return self.frame_timer
+
+    def has_new_frame(self):
+        """True when a new sample arrived or a display setting changed since the last frame"""
+        key = (self.monitor.store.generation, self.current_theme, self.speed_unit,
+               self.plot_window, self.monitor.selected_interface)
+        if key == self.frame_key:
+            return False
+        self.frame_key = key
+        return True
+    
+    def get_frame_stats(self):
+        """Returns update_plot frame times, including the blit or full redraw"""
+        if self.frame_timer is None:
+            return {"frames": 0, "skipped": 0, "avg_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+        return self.frame_timer.get_frame_stats()
 
     def fix_menu_style(self):
         """Configure Tkinter menu styles to remove all borders"""
@@ -1260,9 +1558,11 @@ class NetworkSpeedApp:
         self.monitor.set_interface(interface_name)
 
 class ToolTip:
-    def __init__(self, widget, text=""):
+    def __init__(self, widget, text="", text_func=None):
         self.widget = widget
         self.text = text
+        # Called when the tip is shown or refreshed, instead of keeping text current
+        self.text_func = text_func
         self.tip_window = None
         
         self.widget.bind("<Enter>", self.show_tip)
@@ -1271,6 +1571,8 @@ class ToolTip:
     def show_tip(self, event=None):
         if self.tip_window:
             return
+        if self.text_func is not None:
+            self.text = self.text_func()
             
         x = self.widget.winfo_rootx() + 20
         y = self.widget.winfo_rooty() + self.widget.winfo_height() + 5
@@ -1298,10 +1600,26 @@ class ToolTip:
         self.text = text
         if hasattr(self, 'label') and self.label and self.tip_window:
             self.label.config(text=self.text)
+    
+    def refresh(self):
+        """Rebuild the text of a visible tip"""
+        if self.tip_window and self.text_func is not None:
+            text = self.text_func()
+            if text != self.text:
+                self.update_text(text)
 
 _animations = []
 
 def main():
+    # Only the overlay logs to speedmeter.log; --headless logs to stderr and the
+    # spawned collector worker (which re-imports this module) creates no file
+    logging.basicConfig(
+        level=logging.INFO,  # Change back from DEBUG to INFO for release
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filename='speedmeter.log',
+        filemode='a'
+    )
+
     # Add proper error handling for no network connection
     try:
         # Check if a network connection exists
@@ -1315,6 +1633,7 @@ def main():
         sys.exit(1)
 
     root = tk.Tk()
+    STARTUP.mark("tk")
     root.withdraw()
     root.attributes('-alpha', 0)
     root.attributes("-topmost", False)
@@ -1322,7 +1641,12 @@ def main():
     root.wm_state('iconic')
     
     # Create app first before manipulating windows
-    app = NetworkSpeedApp(root)
+    # --profile-startup prints the time of each phase up to the first graph, then exits
+    # --remote HOST[:PORT] shows another machine's agent instead of this one
+    remote = None
+    if "--remote" in sys.argv[1:-1]:
+        remote = sys.argv[sys.argv.index("--remote") + 1]
+    app = NetworkSpeedApp(root, profile_startup="--profile-startup" in sys.argv[1:], remote=remote)
     
     # Let Tk process events and create windows before accessing handles
     root.update_idletasks()
@@ -1353,23 +1677,9 @@ def main():
             logging.warning(f"Could not hide root window: {e}")
             # Non-critical error, application will still function
     
-    # Use blitting and a higher interval for smoother animations
-    anim = animation.FuncAnimation(
-        app.fig, 
-        app.update_plot, 
-        interval=200,  # Increase interval to reduce flashing (was 100ms)
-        cache_frame_data=False,
-        blit=False  # Setting to False can sometimes help with flashing issues
-    )
-    
-    app.ani = anim
-    root._anim_ref = anim
-    _animations.append(anim)
-    anim._fig = app.fig
-    
-    # Apply matplotlib backend configurations
-    from matplotlib import rcParams
-    rcParams['figure.autolayout'] = True  # Use tight layout to avoid resizing
+    # Blitting is used unless another renderer is selected in config.ini
+    timer = app.start_animation(interval=200)
+    root._anim_ref = timer
     
     root.mainloop()
 
@@ -0,0 +1,108 @@
+"""Spike detection on network throughput without hand-tuned thresholds.
+
+Each series (the total and every interface, download and upload) keeps an
+exponentially weighted mean and variance of log1p(bps): four floats, updated
+in O(1) per sample. Throughput is heavy tailed, and in log space a spike is
+a large multiplicative jump whatever the link speed. A sample is anomalous
+when its z-score exceeds `threshold`, it is above `min_bps`, and the
+detector is warmed up. Anomalous samples are clipped before updating the
+estimates, so one burst does not widen the band for the next.
+
+Values above MAX_PLAUSIBLE_BPS are counter glitches, not traffic; they are
+neither flagged nor learned from.
+"""
+import math
+import logging
+from collections import deque
+
+
+MAX_PLAUSIBLE_BPS = 1e12
+
+# Bits of the SampleStore "flags" column
+FLAG_DOWNLOAD = 1
+FLAG_UPLOAD = 2
+
+
+class SpikeDetector:
+    __slots__ = ("alpha", "threshold", "warmup", "min_bps", "min_std", "mean", "var", "count", "score")
+
+    def __init__(self, alpha=0.05, threshold=4.0, warmup=30, min_bps=1e5, min_std=0.25):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_bps = min_bps
+        # Floor for the log-space deviation: a flat series needs a ~e-fold jump per threshold unit
+        self.min_std = min_std
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+        self.score = 0.0
+
+    def update(self, bps):
+        """Scores one sample and learns from it; returns True for a spike"""
+        if not 0 <= bps <= MAX_PLAUSIBLE_BPS:
+            return False
+        x = math.log1p(bps)
+        std = max(math.sqrt(self.var), self.min_std)
+        self.score = (x - self.mean) / std if self.count else 0.0
+        spike = self.count >= self.warmup and self.score > self.threshold and bps >= self.min_bps
+        if spike:
+            x = self.mean + self.threshold * std
+        # Plain averaging until 1/n drops below alpha, so early estimates settle quickly
+        alpha = max(self.alpha, 1.0 / (self.count + 1))
+        diff = x - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1.0 - alpha) * (self.var + diff * increment)
+        self.count += 1
+        return spike
+
+
+class AnomalyTracker:
+    """Download and upload detectors per interface plus the total, with a short event log"""
+
+    TOTAL = ""
+
+    def __init__(self, alpha=0.05, threshold=4.0, warmup=30, min_bps=1e5, events=256):
+        self.settings = dict(alpha=alpha, threshold=threshold, warmup=warmup, min_bps=min_bps)
+        self.detectors = {}
+        self.events = deque(maxlen=events)
+        self.count = 0
+
+    def observe(self, timestamp, download, upload, interface=TOTAL):
+        """Returns the FLAG_* bits of this sample"""
+        pair = self.detectors.get(interface)
+        if pair is None:
+            pair = self.detectors[interface] = (SpikeDetector(**self.settings), SpikeDetector(**self.settings))
+        flags = 0
+        for detector, value, flag, direction in ((pair[0], download, FLAG_DOWNLOAD, "download"),
+                                                 (pair[1], upload, FLAG_UPLOAD, "upload")):
+            if detector.update(value):
+                flags |= flag
+                self.count += 1
+                self.events.append((timestamp, interface or "all", direction, value, detector.score))
+                logging.info(f"{direction.capitalize()} spike on {interface or 'all interfaces'}: "
+                             f"{value:.0f} bps (z={detector.score:.1f})")
+        return flags
+
+    def forget(self, interface):
+        """Drops the state of an interface that went away"""
+        self.detectors.pop(interface, None)
+
+    def get_events(self):
+        return list(self.events)
+
+
+def create_anomaly_tracker(config):
+    """AnomalyTracker from config.ini, or None when anomaly_detection is off"""
+    if not config.getboolean("Settings", "anomaly_detection", fallback=True):
+        return None
+    try:
+        return AnomalyTracker(
+            alpha=config.getfloat("Settings", "anomaly_alpha", fallback=0.05),
+            threshold=config.getfloat("Settings", "anomaly_threshold", fallback=4.0),
+            min_bps=config.getfloat("Settings", "anomaly_min_bps", fallback=1e5)
+        )
+    except ValueError as e:
+        logging.warning(f"Invalid anomaly settings, detection disabled: {e}")
+        return None
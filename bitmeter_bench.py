@@ -0,0 +1,619 @@
+"""Benchmarks for BitMeter's own overhead.
+
+Run `python bitmeter_bench.py` to print the results as JSON, and
+`python bitmeter_bench.py --compare old.json` to compare against an earlier
+run. The sampler, process scan, formatting and frame benchmarks run against
+fake psutil and counter back-ends, so they do not depend on the host's live
+traffic or process list.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import itertools
+import logging
+import subprocess
+import configparser
+from collections import namedtuple, deque
+from contextlib import contextmanager
+
+import psutil
+
+import bitmeter_core
+import bitmeter_talkers
+from bitmeter_sources import PsutilCounterSource, ProcNetDevSource, SysfsCounterSource, replay
+
+
+# Recorded counter traces with expectations, see check_counter_traces()
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+
+_CpuTimes = namedtuple("_CpuTimes", ["user", "system"])
+_SystemCpuTimes = namedtuple("_SystemCpuTimes", ["user", "system", "idle"])
+_VirtualMemory = namedtuple("_VirtualMemory", ["total", "available", "percent", "used", "free"])
+
+
+class FakeCounterSource:
+    """Per-interface byte counters that grow by a fixed amount on every read"""
+
+    name = "fake"
+
+    def __init__(self, interfaces=4, step=125000):
+        self.step = step
+        self.counters = {f"eth{i}": [0, 0] for i in range(interfaces)}
+
+    def read(self):
+        result = {}
+        for i, (nic, counter) in enumerate(self.counters.items()):
+            counter[0] += self.step * (i + 1)
+            counter[1] += self.step // 4 * (i + 1)
+            result[nic] = (counter[0], counter[1])
+        return result
+
+    def close(self):
+        pass
+
+
+class _FakeProcess:
+    def __init__(self, backend, pid):
+        self.backend = backend
+        self.pid = pid
+
+    def name(self):
+        return f"proc{self.pid}"
+
+    def cpu_times(self):
+        # Every pid burns a different, steady amount of CPU per scan
+        total = self.backend.scans * (self.pid % 17) * 0.01
+        return _CpuTimes(total * 0.7, total * 0.3)
+
+
+class FakePsutil:
+    """Just enough of the psutil API for EnhancedNetworkMonitor and ProcessTable"""
+
+    NoSuchProcess = psutil.NoSuchProcess
+    AccessDenied = psutil.AccessDenied
+    ZombieProcess = psutil.ZombieProcess
+
+    def __init__(self, processes=300, cores=8, churn=0.01):
+        self.processes = processes
+        self.cores = cores
+        self.churn = churn
+        self.first_pid = 1
+        self.scans = 0
+        self.cpu_reads = 0
+
+    def pids(self):
+        # A few processes exit and as many start on every scan
+        self.scans += 1
+        self.first_pid += max(1, int(self.processes * self.churn))
+        return list(range(self.first_pid, self.first_pid + self.processes))
+
+    def Process(self, pid):
+        return _FakeProcess(self, pid)
+
+    def cpu_count(self, logical=True):
+        return self.cores
+
+    def cpu_times(self, percpu=False):
+        # Every core is busy a different, steady share of each read interval
+        self.cpu_reads += 1
+        n = self.cpu_reads
+        if percpu:
+            return [_SystemCpuTimes(n * (i * 10 % 100) / 100, 0.0, n * (1 - (i * 10 % 100) / 100))
+                    for i in range(self.cores)]
+        return _SystemCpuTimes(n * 0.3, n * 0.12, n * 0.58)
+
+    def virtual_memory(self):
+        total = 16 * 2**30
+        used = 6 * 2**30
+        return _VirtualMemory(total, total - used, used / total * 100.0, used, total - used)
+
+
+class FakeClock:
+    """The time module, except that time() and monotonic() advance one sample interval per call"""
+
+    def __init__(self, step=0.5):
+        self.step = step
+        self.now = time.time()
+        self.ticks = time.monotonic()
+
+    def time(self):
+        self.now += self.step
+        return self.now
+
+    def monotonic(self):
+        self.ticks += self.step
+        return self.ticks
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@contextmanager
+def fake_backends(processes=300, cores=8):
+    """Swap bitmeter_core's psutil and clock for fakes and disable socket attribution"""
+    fake = FakePsutil(processes, cores)
+    saved = (bitmeter_core.psutil, bitmeter_core.time, bitmeter_talkers.create_talker_collector)
+    bitmeter_core.psutil = fake
+    bitmeter_core.time = FakeClock()
+    # The monitor imports the factory when it is built, so patch it at its source
+    bitmeter_talkers.create_talker_collector = lambda: None
+    try:
+        yield fake
+    finally:
+        bitmeter_core.psutil, bitmeter_core.time, bitmeter_talkers.create_talker_collector = saved
+
+
+class _ErrorRecorder(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@contextmanager
+def fail_on_logged_errors():
+    """Raise if the code under test logged an error, e.g. from a swallowed exception"""
+    recorder = _ErrorRecorder()
+    root = logging.getLogger()
+    root.addHandler(recorder)
+    try:
+        yield
+    finally:
+        root.removeHandler(recorder)
+    if recorder.messages:
+        raise RuntimeError(f"{len(recorder.messages)} errors logged, first: {recorder.messages[0]}")
+
+
+def bench_config():
+    """Default settings without reading config.ini; everything stays in-process"""
+    config = configparser.ConfigParser()
+    config["Settings"] = dict(bitmeter_core.DEFAULT_SETTINGS)
+    config["Settings"]["offload_collectors"] = ""
+    return config
+
+
+def fake_monitor(interfaces=4):
+    """EnhancedNetworkMonitor over FakeCounterSource; call inside fake_backends()"""
+    return bitmeter_core.EnhancedNetworkMonitor(bench_config(), counter_source=FakeCounterSource(interfaces))
+
+
+def time_call(func, iterations):
+    """Calls func repeatedly and returns per-call timings in microseconds"""
+    func()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": sum(samples) / len(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+        "min_us": samples[0] * 1e6
+    }
+
+
+def bench_counter_sources(iterations):
+    """psutil versus the Linux procfs/sysfs readers on this host's interfaces"""
+    results = {}
+    sources = [PsutilCounterSource()]
+    if sys.platform.startswith("linux"):
+        procfs = ProcNetDevSource()
+        interfaces = list(procfs.read())
+        sources.append(procfs)
+        sources.append(SysfsCounterSource(interfaces))
+    else:
+        interfaces = list(sources[0].read())
+
+    for source in sources:
+        result = time_call(source.read, iterations)
+        result["interfaces"] = len(source.read())
+        results[source.name] = result
+        source.close()
+
+    if "psutil" in results:
+        base = results["psutil"]["mean_us"]
+        for name, result in results.items():
+            result["speedup_vs_psutil"] = base / result["mean_us"] if result["mean_us"] else 0.0
+    return results
+
+
+def probe_renderer(mode, frames=200):
+    """Runs in a fresh interpreter: import, setup and per-frame cost of one renderer"""
+    import psutil
+    process = psutil.Process()
+    start = time.perf_counter()
+    import numpy as np
+    import tkinter as tk
+    import bitmeter
+    if mode != "tk":
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    result = {"import_ms": (time.perf_counter() - start) * 1000.0,
+              "matplotlib_loaded": "matplotlib" in sys.modules}
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        # No display: only the import cost can be compared
+        result["display"] = False
+        result["error"] = str(e)
+        result["rss_mb"] = process.memory_info().rss / 2**20
+        return result
+    result["display"] = True
+
+    start = time.perf_counter()
+    theme = bitmeter.THEMES["dark"]
+    if mode == "tk":
+        renderer = bitmeter.TkSparklineRenderer(root, 40)
+        renderer.apply_theme(theme)
+        renderer.get_tk_widget().pack()
+        root.update()
+
+        def frame(data):
+            renderer.update(data, data, 1.0, 1.0)
+            root.update_idletasks()
+    else:
+        fig = Figure(figsize=(0.95, 0.35), dpi=100)
+        fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98, hspace=0.1)
+        renderer = bitmeter.BlitPlotRenderer(fig.add_subplot(2, 1, 1), fig.add_subplot(2, 1, 2), 40)
+        renderer.apply_theme(theme)
+        canvas = FigureCanvasTkAgg(fig, master=root)
+        canvas.get_tk_widget().pack()
+        canvas.draw()
+        root.update()
+        background = canvas.copy_from_bbox(fig.bbox)
+
+        # What FuncAnimation does for each blitted frame
+        def frame(data):
+            renderer.update(data, data, 1.0, 1.0)
+            canvas.restore_region(background)
+            for artist in renderer.artists:
+                fig.draw_artist(artist)
+            canvas.blit(fig.bbox)
+            root.update_idletasks()
+    result["setup_ms"] = (time.perf_counter() - start) * 1000.0
+
+    rng = np.random.default_rng(0)
+    data = itertools.cycle([rng.random(40) for _ in range(16)])
+    timings = time_call(lambda: frame(next(data)), frames)
+    result["frame_us"] = timings["mean_us"]
+    result["frame_p99_us"] = timings["p99_us"]
+    result["rss_mb"] = process.memory_info().rss / 2**20
+    root.destroy()
+    return result
+
+
+def bench_renderers(iterations):
+    """Tk canvas sparklines versus the matplotlib blit path, each in a fresh interpreter"""
+    results = {}
+    for mode in ("tk", "blit"):
+        output = subprocess.run([sys.executable, __file__, "--renderer-probe", mode,
+                                 "--iterations", str(min(iterations, 500))],
+                                capture_output=True, text=True)
+        if output.returncode != 0:
+            results[mode] = {"error": output.stderr.strip().splitlines()[-1:]}
+            continue
+        results[mode] = json.loads(output.stdout)
+    if "import_ms" in results.get("tk", {}) and "import_ms" in results.get("blit", {}):
+        results["import_saving_ms"] = results["blit"]["import_ms"] - results["tk"]["import_ms"]
+        results["rss_saving_mb"] = results["blit"]["rss_mb"] - results["tk"]["rss_mb"]
+    return results
+
+
+def bench_update_speeds(iterations, interfaces=4):
+    """One sampler tick: counters, per-NIC rates, stores, rollups and sinks"""
+    results = {}
+    for count in sorted({1, interfaces, interfaces * 8}):
+        with fake_backends():
+            monitor = fake_monitor(count)
+            results[f"{count}_interfaces"] = time_call(monitor.update_speeds, iterations)
+    return results
+
+
+def bench_update_system_stats(iterations, processes=300):
+    """CPU, per-core, RAM and the top-process scan over a fake process table"""
+    results = {}
+    for count in sorted({processes // 10 or 1, processes, processes * 10}):
+        with fake_backends(processes=count):
+            monitor = fake_monitor()
+            result = time_call(monitor.update_system_stats, max(10, iterations // 10))
+            result["processes"] = count
+            result["top_processes"] = len(monitor.get_system_stats()["top_processes"])
+            results[f"{count}_processes"] = result
+    return results
+
+
+def bench_format_speed(iterations):
+    """format_speed calls per second for every unit over a spread of rates"""
+    values = [10.0 ** (i / 8.0) for i in range(8 * 11)]
+    results = {}
+    # The speed_unit values format_speed() forces; None picks the unit per value
+    for unit in (None, "kbps", "Mbps", "Gbps"):
+        def run():
+            for value in values:
+                bitmeter_core.format_speed(value, unit)
+        timing = time_call(run, max(10, iterations // 10))
+        timing["calls_per_second"] = len(values) / (timing["mean_us"] / 1e6) if timing["mean_us"] else 0.0
+        results[str(unit)] = timing
+    return results
+
+
+class _StubWidget:
+    """Stands in for the Tk labels and bar canvases update_plot touches"""
+
+    def config(self, **kwargs):
+        pass
+
+    configure = config
+
+    def bind(self, *args):
+        pass
+
+    def winfo_width(self):
+        return 90
+
+    def winfo_height(self):
+        return 5
+
+    def create_rectangle(self, *args, **kwargs):
+        return 1
+
+    def coords(self, *args):
+        pass
+
+    def itemconfig(self, *args, **kwargs):
+        pass
+
+
+def bench_update_plot(iterations):
+    """update_plot frame time for the blit and classic renderers on an Agg canvas"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import numpy as np
+    import bitmeter
+
+    results = {}
+    with fake_backends():
+        monitor = fake_monitor()
+        for _ in range(200):
+            monitor.update_speeds()
+        monitor.update_system_stats()
+
+        for mode in ("blit", "classic"):
+            # The frame path of NetworkSpeedApp without building its Tk window
+            app = bitmeter.NetworkSpeedApp.__new__(bitmeter.NetworkSpeedApp)
+            app.monitor = monitor
+            app.current_theme = "dark"
+            app.speed_unit = "None"
+            app.plot_window = 0
+            app.renderer_mode = mode
+            app.plot_ready = True
+            app.data_points = 40
+            app.download_data = np.zeros(app.data_points)
+            app.upload_data = np.zeros(app.data_points)
+            app.anomaly_data = np.zeros(app.data_points, dtype=np.uint8)
+            app.label_texts = {}
+            app.bar_states = {}
+            app.plot_key = None
+            app.pending_alerts = deque()
+            for name in ("dl_label", "ul_label", "cpu_label", "ram_label", "cpu_canvas", "ram_canvas"):
+                setattr(app, name, _StubWidget())
+            for name in ("cpu_tooltip", "ram_tooltip", "dl_tooltip", "ul_tooltip"):
+                setattr(app, name, bitmeter.ToolTip(_StubWidget(), text_func=str))
+
+            app.fig = Figure(figsize=(0.95, 0.35), dpi=100)
+            app.fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98, hspace=0.1)
+            app.ax1 = app.fig.add_subplot(2, 1, 1)
+            app.ax2 = app.fig.add_subplot(2, 1, 2)
+            app.canvas = FigureCanvasAgg(app.fig)
+            if mode == "blit":
+                app.plot_renderer = bitmeter.BlitPlotRenderer(app.ax1, app.ax2, app.data_points)
+                app.plot_renderer.apply_theme(bitmeter.THEMES["dark"])
+                app.canvas.draw()
+                background = app.canvas.copy_from_bbox(app.fig.bbox)
+
+                # What FuncAnimation does around update_plot for a blitted frame
+                def frame():
+                    # Every timed frame draws, as if a new sample had arrived
+                    app.plot_key = None
+                    artists = app.update_plot(0)
+                    app.canvas.restore_region(background)
+                    for artist in artists:
+                        app.fig.draw_artist(artist)
+            else:
+                app.plot_renderer = None
+
+                def frame():
+                    app.plot_key = None
+                    app.update_plot(0)
+
+            # update_plot logs and swallows its exceptions; a frame that failed is not a frame
+            with fail_on_logged_errors():
+                results[mode] = time_call(frame, max(10, iterations // 10))
+    return results
+
+
+def _trace(steps, expect, interval=1.0, **interfaces):
+    """A trace in the recorded format; each interface maps a step to (recv, sent) or None when absent"""
+    readings = [{"expect": expect}]
+    for step in range(steps):
+        counters = {}
+        for nic, counter in interfaces.items():
+            values = counter(step)
+            if values is not None:
+                counters[nic] = list(values)
+        readings.append({"t": 1000.0 + step * interval, "counters": counters})
+    return readings
+
+
+def counter_traces():
+    """Synthetic traces of counter wraps, resets and interface churn, with what a replay should yield"""
+    mb = 1_000_000
+
+    def wrapping(bits):
+        start = 2**bits - 3 * mb
+        return lambda step: ((start + step * mb) % 2**bits, (start + step * mb // 10) % 2**bits)
+
+    def steady(rate, start=0):
+        return lambda step: (start + step * rate, start + step * rate // 4)
+
+    def expect(wraps=0, resets=0, **totals):
+        return {"totals": totals, "wraps": wraps, "resets": resets}
+
+    return {
+        "wrap32": _trace(20, expect(eth0=(19 * mb, 19 * mb // 10), wraps=1), eth0=wrapping(32)),
+        "wrap64": _trace(20, expect(eth0=(19 * mb, 19 * mb // 10), wraps=1), eth0=wrapping(64)),
+        # eth0 is re-created at step 10; only that interval is lost, eth1 is unaffected
+        "reset": _trace(20, expect(eth0=(18 * mb, 18 * mb // 4), eth1=(38 * mb, 38 * mb // 4), resets=1),
+                        eth0=lambda step: steady(mb, 5 * 10**9)(step) if step < 10 else steady(mb)(step - 10),
+                        eth1=steady(2 * mb)),
+        # A 64-bit counter still below 2**32 resets; read as a 32-bit wrap it would be 20 Gbps
+        "reset_below_2**32": _trace(20, expect(eth0=(18 * mb, 18 * mb // 4), resets=1), interval=0.5,
+                                    eth0=lambda step: steady(mb, 3 * 10**9)(step) if step < 10 else
+                                    steady(mb, 1000)(step - 10)),
+        # vpn0 misses three reads and keeps counting; wg0 is gone past the expiry and comes back from zero
+        "readd": _trace(60, expect(vpn0=(59 * mb, 59 * mb // 4), wg0=(18 * mb, 18 * mb // 4)),
+                        vpn0=lambda step: None if 5 <= step < 8 else steady(mb)(step),
+                        wg0=lambda step: steady(mb)(step) if step < 5 else
+                        None if step < 45 else steady(mb)(step - 45)),
+        # eth0 only shows up on every other read
+        "flap": _trace(20, expect(eth0=(18 * mb, 18 * mb // 4), eth1=(19 * mb, 19 * mb // 4)),
+                       eth0=lambda step: None if step % 2 else steady(mb)(step), eth1=steady(mb))
+    }
+
+
+def _matches(totals, stats, expect):
+    for nic, want in expect["totals"].items():
+        got = totals.get(nic, (0.0, 0.0))
+        if any(abs(got[i] - want[i]) > 1e-6 * max(want[i], 1) for i in (0, 1)):
+            return False
+    return stats["wraps"] == expect["wraps"] and stats["resets"] == expect["resets"]
+
+
+def check_counter_traces(paths=()):
+    """Replays the synthetic traces and the recorded ones in traces/ (plus `paths`) against their expectations"""
+    traces = dict(counter_traces())
+    for path in sorted(glob.glob(os.path.join(TRACE_DIR, "*.ndjson"))) + list(paths):
+        traces[path] = path
+    results = {}
+    failed = False
+    for name, trace in traces.items():
+        totals, stats, expect = replay(trace)
+        results[name] = {"totals": totals, "tracker": stats}
+        if expect is not None:
+            ok = _matches(totals, stats, expect)
+            failed = failed or not ok
+            results[name].update(ok=ok, expected=expect)
+    return results, failed
+
+
+BENCHMARKS = {
+    "counter_sources": bench_counter_sources,
+    "renderers": bench_renderers,
+    "update_speeds": bench_update_speeds,
+    "update_system_stats": bench_update_system_stats,
+    "format_speed": bench_format_speed,
+    "update_plot": bench_update_plot
+}
+
+# Benchmarks that only use the fake back-ends
+OFFLINE = ("update_speeds", "update_system_stats", "format_speed", "update_plot")
+
+
+def _timings(results, path=()):
+    """Yields (path, value) for every per-call time in a results tree"""
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _timings(value, path + (key,))
+        elif key in ("mean_us", "p50_us", "p99_us"):
+            yield "/".join(path + (key,)), value
+
+
+def compare(baseline, current, threshold):
+    """Per-timing change against a baseline report; slower than threshold % is a regression"""
+    before = dict(_timings(baseline.get("results", {})))
+    changes = {}
+    regressions = []
+    for path, value in _timings(current.get("results", {})):
+        old = before.get(path)
+        if not old:
+            continue
+        change = (value - old) / old * 100.0
+        changes[path] = {"baseline": old, "current": value, "change_pct": change}
+        if path.endswith("mean_us") and change > threshold:
+            regressions.append(path)
+    return {"threshold_pct": threshold, "changes": changes, "regressions": regressions}
+
+
+def write_json(data, path):
+    """Writes a report to stdout for "-", otherwise to the file at path"""
+    text = json.dumps(data, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure BitMeter's own overhead")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS),
+                        help="run a subset of the benchmarks")
+    parser.add_argument("--offline", action="store_true",
+                        help="only the benchmarks that use fake back-ends: " + ", ".join(OFFLINE))
+    parser.add_argument("--processes", type=int, default=300,
+                        help="size of the fake process table")
+    parser.add_argument("--interfaces", type=int, default=4,
+                        help="number of fake interfaces")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="earlier JSON report to compare against; exits 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=25.0,
+                        help="mean slowdown in percent that counts as a regression")
+    parser.add_argument("--output", default="-", help="JSON file to write, - for stdout")
+    parser.add_argument("--check-traces", nargs="*", metavar="TRACE", default=None,
+                        help="replay the synthetic and recorded counter traces, plus any given, instead of "
+                             "benchmarking; exits 1 when a replay does not match its expectations")
+    parser.add_argument("--renderer-probe", choices=("tk", "blit"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    
+    if args.check_traces is not None:
+        results, failed = check_counter_traces(args.check_traces)
+        write_json(results, args.output)
+        return 1 if failed else 0
+
+    if args.renderer_probe:
+        print(json.dumps(probe_renderer(args.renderer_probe, args.iterations)))
+        return 0
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {}
+    }
+    options = {"update_speeds": {"interfaces": args.interfaces},
+               "update_system_stats": {"processes": args.processes}}
+    for name in args.only or (OFFLINE if args.offline else BENCHMARKS):
+        report["results"][name] = BENCHMARKS[name](args.iterations, **options.get(name, {}))
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(json.load(f), report, args.threshold)
+        if report["comparison"]["regressions"]:
+            status = 1
+
+    write_json(report, args.output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""High-resolution burst capture.
+
+The regular net collector averages over update_interval (0.5 s by default),
+which flattens microbursts. A BurstCapture samples the interface counters
+every 10-50 ms for a bounded window on its own thread, so the overlay and
+the scheduler keep running meanwhile. Samples go into arrays preallocated
+for the whole window and are timed with perf_counter, which is monotonic.
+
+A burst is a run of consecutive intervals at or above half the peak rate;
+burst_duration is the length of the run that contains the peak.
+"""
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+
+MIN_INTERVAL = 0.01
+MAX_DURATION = 60.0
+
+
+class BurstCapture:
+    def __init__(self, source, interval=0.02, duration=10.0, interfaces=None, on_done=None,
+                 close_source=False):
+        self.source = source
+        self.close_source = close_source
+        self.interval = max(interval, MIN_INTERVAL)
+        self.duration = min(max(duration, self.interval), MAX_DURATION)
+        # None sums every interface the source reports, like the total rate
+        self.interfaces = set(interfaces) if interfaces else None
+        self.on_done = on_done
+
+        slots = int(math.ceil(self.duration / self.interval)) + 1
+        self.times = np.zeros(slots)
+        self.counters = np.zeros((slots, 2), dtype=np.int64)
+        self.count = 0
+        self.missed = 0
+
+        self.started = None
+        self.result = None
+        self.error = None
+        self.stop_event = threading.Event()
+        self.done = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="bitmeter-burst", daemon=True)
+        self.thread.start()
+        return self
+
+    def _read(self):
+        received = sent = 0
+        wanted = self.interfaces
+        for nic, (rx, tx) in self.source.read().items():
+            if wanted is None or nic in wanted:
+                received += rx
+                sent += tx
+        return received, sent
+
+    def _run(self):
+        clock = time.perf_counter
+        slots = len(self.times)
+        try:
+            self.started = time.time()
+            start = clock()
+            next_slot = 0
+            while self.count < slots:
+                # Sleep on the event so stop() interrupts promptly
+                delay = start + next_slot * self.interval - clock()
+                if self.stop_event.wait(max(delay, 0)):
+                    break
+                received, sent = self._read()
+                now = clock()
+                self.times[self.count] = now - start
+                self.counters[self.count] = (received, sent)
+                self.count += 1
+                # After a stall, resume on the schedule instead of catching up
+                due = int((now - start) / self.interval) + 1
+                self.missed += max(due - next_slot - 1, 0)
+                next_slot = max(next_slot + 1, due)
+                if next_slot * self.interval > self.duration:
+                    break
+            self.result = summarize(self.times[:self.count], self.counters[:self.count])
+            self.result.update({"started": self.started, "interval": self.interval,
+                                "missed_slots": self.missed})
+        except Exception as e:
+            logging.error(f"Burst capture failed: {e}")
+            self.error = e
+        finally:
+            if self.close_source:
+                self.source.close()
+            self.done.set()
+            if self.on_done is not None:
+                try:
+                    self.on_done(self)
+                except Exception as e:
+                    logging.error(f"Error in burst capture callback: {e}")
+
+    def is_running(self):
+        return self.thread is not None and not self.done.is_set()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+def _direction_stats(rates, spans):
+    if not len(rates):
+        return {"peak_bps": 0.0, "p99_bps": 0.0, "mean_bps": 0.0,
+                "burst_duration": 0.0, "bursts": 0}
+    peak_index = int(np.argmax(rates))
+    peak = float(rates[peak_index])
+
+    burst_duration = 0.0
+    bursts = 0
+    if peak > 0:
+        above = rates >= peak / 2
+        # Run boundaries of the above-threshold mask
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], above.view(np.int8), [0]))))
+        starts, ends = edges[::2], edges[1::2]
+        bursts = len(starts)
+        run = np.searchsorted(ends, peak_index, side="right")
+        burst_duration = float(spans[starts[run]:ends[run]].sum())
+
+    return {
+        "peak_bps": peak,
+        "p99_bps": float(np.percentile(rates, 99)),
+        "mean_bps": float((rates * spans).sum() / spans.sum()),
+        "burst_duration": burst_duration,
+        "bursts": bursts
+    }
+
+
+def summarize(times, counters):
+    """Peak, p99, mean and burst duration of each direction from raw samples"""
+    spans = np.diff(times)
+    valid = spans > 0
+    # Counter resets show up as negative deltas and count as idle
+    deltas = np.clip(np.diff(counters, axis=0), 0, None)[valid]
+    spans = spans[valid]
+    rates = deltas * 8 / spans[:, None] if len(spans) else np.zeros((0, 2))
+    return {
+        "samples": int(len(times)),
+        "elapsed": float(times[-1] - times[0]) if len(times) > 1 else 0.0,
+        "max_gap": float(spans.max()) if len(spans) else 0.0,
+        "download": _direction_stats(rates[:, 0], spans),
+        "upload": _direction_stats(rates[:, 1], spans)
+    }
+
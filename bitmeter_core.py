@@ -0,0 +1,1196 @@
+"""Sampling core for BitMeter.
+
+Everything in here is free of Tk and matplotlib so it can be imported by the
+headless collector as well as by the overlay in bitmeter.py.
+"""
+import psutil
+import time
+import threading
+import heapq
+import configparser
+import platform
+import math
+import ctypes
+import logging
+import os
+import sys
+import io
+import json
+import argparse
+import multiprocessing
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from threading import RLock
+
+# The sample store, counter sources and optional features are imported where
+# they are first used, so the collector worker (which only needs ProcessTable
+# and SamplingScheduler) and the overlay's first paint don't load them
+from bitmeter_selfstats import LatencyHistogram, InstrumentedLock
+
+
+CONFIG_FILE = "config.ini"
+
+DEFAULT_SETTINGS = {
+    "theme": "dark",
+    "speed_unit": "None",
+    "update_interval": "0.5",
+    "export_format": "none",
+    "export_dir": "export",
+    "export_rotate_minutes": "60",
+    "export_max_mb": "64",
+    "export_fsync": "batch",
+    "export_queue_size": "1000",
+    "export_flush_interval": "1.0",
+    "show_system_stats": "True",
+    "renderer": "blit",
+    "cpu_interval": "0.5",
+    "core_interval": "1.0",
+    "ram_interval": "1.0",
+    "process_interval": "2.0",
+    "talker_interval": "2.0",
+    "offload_collectors": "processes, talkers",
+    "history_length": "7200",
+    "history_enabled": "True",
+    "history_dir": "history",
+    "history_segment_minutes": "60",
+    "history_retention_days": "7",
+    "plot_window": "0",
+    "interface_history_length": "600",
+    "counter_source": "auto",
+    "counter_interfaces": "",
+    "exporter_port": "0",
+    "exporter_address": "127.0.0.1",
+    "fleet_server": "",
+    "alert_log": "alerts.log",
+    "alert_webhook": "",
+    "agent_port": "0",
+    "agent_address": "127.0.0.1",
+    "remote_agent": "",
+    "anomaly_detection": "True",
+    "anomaly_threshold": "4.0",
+    "anomaly_alpha": "0.05",
+    "anomaly_min_bps": "100000",
+    "burst_interval": "0.02",
+    "burst_duration": "10"
+}
+
+# Collector name -> config key holding its cadence in seconds
+COLLECTOR_INTERVAL_KEYS = {
+    "net": "update_interval",
+    "cpu": "cpu_interval",
+    "cpu_per_core": "core_interval",
+    "ram": "ram_interval",
+    "processes": "process_interval",
+    "talkers": "talker_interval"
+}
+
+def load_config():
+    config = configparser.ConfigParser()
+    
+    if not os.path.exists(CONFIG_FILE):
+        config["Settings"] = dict(DEFAULT_SETTINGS)
+        config["Alerts"] = {}
+        save_config(config)
+    else:
+        config.read(CONFIG_FILE)
+        if not config.has_section("Settings"):
+            config.add_section("Settings")
+        for key, default in DEFAULT_SETTINGS.items():
+            if not config.has_option("Settings", key):
+                config.set("Settings", key, default)
+    
+    return config
+
+def save_config(config):
+    try:
+        text = io.StringIO()
+        config.write(text)
+        text = text.getvalue()
+        if config.has_section("Alerts"):
+            from bitmeter_alerts import RULE_HELP
+            # Keep the rule syntax examples, which configparser does not read back
+            text = text.replace("[Alerts]\n", "[Alerts]\n" + RULE_HELP, 1)
+        with open(CONFIG_FILE, "w") as configfile:
+            configfile.write(text)
+    except Exception as e:
+        logging.error(f"Error saving config: {e}")
+
+def format_speed(speed_bps, force_unit=None):
+    if force_unit == "None":
+        force_unit = None
+        
+    speed_Bps = speed_bps / 8.0
+        
+    if force_unit:
+        if force_unit == "kbps":
+            return f"{speed_Bps/1000:.1f}", "KB/s"
+        elif force_unit == "Mbps":
+            return f"{speed_Bps/1000000:.1f}", "MB/s"
+        elif force_unit == "Gbps":
+            return f"{speed_Bps/1000000000:.2f}", "GB/s"
+        else:
+            return f"{speed_Bps:.0f}", "B/s"
+    else:
+        if speed_Bps < 1000:
+            return f"{speed_Bps:.0f}", "B/s"
+        elif speed_Bps < 1000000:
+            return f"{speed_Bps/1000:.1f}", "KB/s"
+        elif speed_Bps < 1000000000:
+            return f"{speed_Bps/1000000:.1f}", "MB/s"
+        else:
+            return f"{speed_Bps/1000000000:.2f}", "GB/s"
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} seconds"
+    elif seconds < 3600:
+        return f"{seconds / 60:.0f} minutes"
+    elif seconds < 86400 * 2:
+        return f"{seconds / 3600:.0f} hours"
+    else:
+        return f"{seconds / 86400:.0f} days"
+
+class ProcessTable:
+    """Persistent PID -> Process table used to find the top CPU consumers.
+
+    Handles are created once per PID and dropped when the PID goes away, so
+    each scan is a single cpu_times() read per live process instead of two
+    full process_iter sweeps.
+    """
+
+    def __init__(self, top_n=3, min_percent=0.5):
+        self.top_n = top_n
+        self.min_percent = min_percent
+        # pid -> [Process, name, last cpu seconds]
+        self.entries = {}
+        self.last_scan_time = None
+
+        self.scan_count = 0
+        self.last_scan_cost = 0.0
+        self.total_scan_cost = 0.0
+        self.last_added = 0
+        self.last_removed = 0
+
+    def _add(self, pid):
+        try:
+            proc = psutil.Process(pid)
+            cpu = proc.cpu_times()
+            self.entries[pid] = [proc, proc.name(), cpu.user + cpu.system]
+            return True
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return False
+
+    def scan(self):
+        """Refresh the table and return the top (cpu_percent, name) pairs"""
+        start = time.perf_counter()
+        now = time.monotonic()
+        elapsed = now - self.last_scan_time if self.last_scan_time else 0.0
+        self.last_scan_time = now
+
+        current = set(psutil.pids())
+        known = self.entries.keys()
+
+        removed = known - current
+        for pid in removed:
+            del self.entries[pid]
+
+        added = 0
+        for pid in current - known:
+            if self._add(pid):
+                added += 1
+
+        usage = []
+        dead = []
+        for pid, entry in self.entries.items():
+            try:
+                cpu = entry[0].cpu_times()
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                dead.append(pid)
+                continue
+            except psutil.AccessDenied:
+                continue
+
+            total = cpu.user + cpu.system
+            delta = total - entry[2]
+            entry[2] = total
+
+            # A negative delta means the PID was reused; the new baseline
+            # is already stored, so just skip this round.
+            if elapsed > 0 and delta > 0:
+                percent = (delta / elapsed) * 100.0
+                if percent > self.min_percent:
+                    usage.append((percent, entry[1]))
+
+        for pid in dead:
+            del self.entries[pid]
+
+        top_processes = heapq.nlargest(self.top_n, usage)
+
+        cost = time.perf_counter() - start
+        self.scan_count += 1
+        self.last_scan_cost = cost
+        self.total_scan_cost += cost
+        self.last_added = added
+        self.last_removed = len(removed) + len(dead)
+
+        return top_processes
+
+    def get_scan_stats(self):
+        """Returns the cost of the process scans for overhead tracking"""
+        return {
+            "processes": len(self.entries),
+            "scans": self.scan_count,
+            "last_scan_ms": self.last_scan_cost * 1000.0,
+            "avg_scan_ms": (self.total_scan_cost / self.scan_count * 1000.0) if self.scan_count else 0.0,
+            "added": self.last_added,
+            "removed": self.last_removed
+        }
+
+_CLOSED = object()
+
+
+class SnapshotStream:
+    """Bounded async stream of snapshots for one subscriber.
+
+    With policy "drop_oldest" a full queue discards its oldest item, so a
+    slow consumer sees gaps but never delays sampling. With "block" the
+    publisher waits for room, pushing back on the collector that published.
+    Iterate it with `async for` on the scheduler's loop.
+    """
+
+    POLICIES = ("drop_oldest", "block")
+
+    def __init__(self, scheduler, maxsize=16, policy="drop_oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}'")
+        self.scheduler = scheduler
+        self.policy = policy
+        self.queue = asyncio.Queue(max(1, maxsize))
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, item):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def put(self, item):
+        if self.policy == "block":
+            await self.queue.put(item)
+        else:
+            self.offer(item)
+
+    def _finish(self):
+        if self.closed:
+            return
+        self.closed = True
+        # The end marker may replace the oldest item, never block on it
+        self.offer(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        self.scheduler.unsubscribe(self)
+
+
+class SamplingScheduler:
+    """Drives every collector from one asyncio loop on a shared monotonic tick.
+
+    Each collector interval is rounded to a whole number of base ticks and
+    collectors due on the same tick run as one batch. The loop only wakes
+    on ticks where some collector is due. Within a batch,
+    collectors of the same stage run concurrently and stages run in order.
+    Coroutine functions are awaited on the loop; blocking functions go to a
+    bounded thread pool. Deadlines are computed from the start time, so
+    sleeps do not drift.
+
+    The scheduler is also a sample sink: every stored row is published to
+    the snapshot streams handed out by subscribe(). stop() cancels the loop,
+    waits for running collectors, drains the subscribers and joins the
+    thread before returning.
+    """
+
+    def __init__(self, min_tick=0.01, max_workers=4):
+        self.min_tick = min_tick
+        self.max_workers = max_workers
+        self.tick = None
+        # [name, func, interval, period_ticks, next_due_tick, stage, is_coroutine]
+        self.collectors = []
+        # name -> LatencyHistogram of the collector's run time
+        self.latency = {}
+        self.streams = []
+        self.thread = None
+        self.loop = None
+        self.executor = None
+        self._main_task = None
+        self._consumers = set()
+        self._deliveries = set()
+        self._pending_consumers = []
+        self._ready = threading.Event()
+        self._stopping = False
+
+        self.tick_count = 0
+        self.batch_count = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+
+    def add(self, name, func, interval, stage=0):
+        """Register func to run every interval seconds, after lower stages of the same batch"""
+        if self.thread is not None:
+            raise RuntimeError("Collectors must be added before the scheduler starts")
+        self.collectors.append([name, func, max(float(interval), self.min_tick), 0, 0, stage,
+                                asyncio.iscoroutinefunction(func)])
+        self.latency[name] = LatencyHistogram()
+
+    def _resolve_tick(self):
+        # The base tick is the greatest common divisor of all intervals,
+        # in milliseconds, so every collector lands exactly on a tick.
+        tick_ms = 0
+        for collector in self.collectors:
+            tick_ms = math.gcd(tick_ms, int(round(collector[2] * 1000)))
+        self.tick = max(tick_ms / 1000.0, self.min_tick)
+        for collector in self.collectors:
+            collector[3] = max(1, int(round(collector[2] / self.tick)))
+            collector[4] = collector[3]
+
+    def start(self):
+        if self.thread is not None or not self.collectors:
+            return
+        self._resolve_tick()
+        self._stopping = False
+        self._ready.clear()
+        self.executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.collectors)),
+                                           thread_name_prefix="bitmeter-collector")
+        # Daemon only as a last resort; stop() always joins it
+        self.thread = threading.Thread(target=asyncio.run, args=(self._main(),),
+                                       name="bitmeter-scheduler", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def stop(self, timeout=5.0):
+        thread = self.thread
+        if thread is None:
+            return
+        self._stopping = True
+        if thread is not threading.current_thread():
+            self.loop.call_soon_threadsafe(self._main_task.cancel)
+            thread.join(timeout)
+            if thread.is_alive():
+                logging.warning("Sampling scheduler did not stop within %.1f s", timeout)
+        self.thread = None
+
+    def spawn(self, coroutine_func):
+        """Run coroutine_func() on the loop until it returns or the scheduler stops"""
+        if self.loop is None or self.thread is None:
+            self._pending_consumers.append(coroutine_func)
+        else:
+            self.loop.call_soon_threadsafe(self._start_consumer, coroutine_func)
+
+    def _start_consumer(self, coroutine_func):
+        task = self.loop.create_task(coroutine_func())
+        self._consumers.add(task)
+        task.add_done_callback(self._consumers.discard)
+
+    def subscribe(self, maxsize=16, policy="drop_oldest"):
+        """New SnapshotStream receiving every published snapshot"""
+        stream = SnapshotStream(self, maxsize, policy)
+        self.streams = self.streams + [stream]
+        return stream
+
+    def unsubscribe(self, stream):
+        self.streams = [s for s in self.streams if s is not stream]
+        if self.loop is not None and self.thread is not None:
+            self.loop.call_soon_threadsafe(stream._finish)
+        else:
+            stream._finish()
+
+    def publish(self, item):
+        """Hand item to every subscriber; safe to call from any thread"""
+        streams = self.streams
+        loop = self.loop
+        if not streams or loop is None or self._stopping:
+            return
+        if threading.current_thread() is self.thread:
+            for stream in streams:
+                if stream.policy == "block":
+                    self._track_delivery(loop.create_task(stream.put(item)))
+                else:
+                    stream.offer(item)
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._deliver(streams, item), loop)
+        except RuntimeError:
+            return  # loop already closed
+        if any(stream.policy == "block" for stream in streams):
+            # Backpressure: the publishing collector waits for room
+            try:
+                future.result()
+            except (CancelledError, Exception):
+                pass
+
+    async def _deliver(self, streams, item):
+        self._track_delivery(asyncio.current_task())
+        for stream in streams:
+            await stream.put(item)
+
+    def _track_delivery(self, task):
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    def on_sample(self, row):
+        if self.streams:
+            self.publish(row.copy())
+
+    def close(self):
+        pass
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        for coroutine_func in self._pending_consumers:
+            self._start_consumer(coroutine_func)
+        self._pending_consumers = []
+        self._ready.set()
+        try:
+            await self.run()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._stopping = True
+            for task in list(self._deliveries):
+                task.cancel()
+            # Let collectors already in the pool finish before the loop goes
+            await asyncio.to_thread(self.executor.shutdown, True)
+            for stream in self.streams:
+                stream._finish()
+            if self._consumers:
+                # Consumers drain their streams, then see the end marker
+                _, pending = await asyncio.wait(list(self._consumers), timeout=1.0)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            self.loop = None
+
+    async def run(self):
+        tick = self.tick
+        stages = sorted({c[5] for c in self.collectors})
+        start = time.monotonic()
+
+        while True:
+            # Sleep straight to the next tick anything is due on, not through idle ticks
+            n = min(c[4] for c in self.collectors)
+            delay = start + n * tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay >= tick:
+                # Fell behind by whole ticks: skip them rather than bursting
+                missed = int(-delay // tick)
+                n += missed
+                self.skipped_ticks += missed
+                self.late_ticks += 1
+
+            self.tick_count += 1
+            due = [c for c in self.collectors if c[4] <= n]
+
+            for stage in stages:
+                batch = [c for c in due if c[5] == stage]
+                if batch:
+                    await asyncio.gather(*(self._call(c) for c in batch))
+            for collector in due:
+                # Stay aligned to the collector's own period
+                collector[4] = (n // collector[3] + 1) * collector[3]
+            self.batch_count += 1
+
+    async def _call(self, collector):
+        try:
+            if collector[6]:
+                start = time.perf_counter()
+                await collector[1]()
+                self.latency[collector[0]].record(time.perf_counter() - start)
+            else:
+                await self.loop.run_in_executor(self.executor, self._timed, collector)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error in {collector[0]} collector: {e}")
+
+    def _timed(self, collector):
+        # Timed in the pool thread, so queueing for a worker is not counted
+        start = time.perf_counter()
+        try:
+            collector[1]()
+        finally:
+            self.latency[collector[0]].record(time.perf_counter() - start)
+
+    def get_stats(self):
+        return {
+            "tick_ms": (self.tick or 0.0) * 1000.0,
+            "ticks": self.tick_count,
+            "batches": self.batch_count,
+            "late_ticks": self.late_ticks,
+            "skipped_ticks": self.skipped_ticks,
+            "collectors": {c[0]: c[2] for c in self.collectors},
+            "subscribers": len(self.streams),
+            "dropped_snapshots": sum(s.dropped for s in self.streams)
+        }
+
+def cpu_busy_percent(before, after):
+    """Busy share of the CPU time between two psutil.cpu_times() readings.
+
+    Computed from our own readings instead of cpu_percent(interval=None),
+    whose baseline psutil keeps per calling thread, so the result does not
+    depend on which collector thread takes the reading.
+    """
+    # guest time is already counted in user/nice on Linux
+    total = sum(after) - sum(before)
+    for field in ("guest", "guest_nice"):
+        total -= getattr(after, field, 0.0) - getattr(before, field, 0.0)
+    idle = sum(getattr(after, field, 0.0) - getattr(before, field, 0.0) for field in ("idle", "iowait"))
+    if total <= 0:
+        return 0.0
+    return max(0.0, min(100.0, (total - idle) / total * 100.0))
+
+class _FILETIME(ctypes.Structure):
+    _fields_ = [("dwLowDateTime", ctypes.c_ulong),
+                ("dwHighDateTime", ctypes.c_ulong)]
+
+class EnhancedNetworkMonitor:
+    def __init__(self, config=None, counter_source=None):
+        from bitmeter_store import SampleStore
+        from bitmeter_rollup import RollupSet
+        from bitmeter_sources import create_counter_source, CounterTracker
+        from bitmeter_anomaly import create_anomaly_tracker, MAX_PLAUSIBLE_BPS
+        from bitmeter_worker import create_collector_worker
+        from bitmeter_talkers import create_talker_collector
+        
+        self.download_speed = 0.0
+        self.upload_speed = 0.0
+        self.running = False
+        # Both locks record their acquire wait times for get_self_stats()
+        self.lock = InstrumentedLock()
+        
+        self.system_stats_lock = InstrumentedLock(RLock())
+        self.cpu_usage = 0.0
+        self.cpu_per_core = []
+        self.ram_usage = 0.0
+        self.ram_used = 0
+        self.ram_total = 0
+        self.top_processes = []
+        self.process_table = ProcessTable()
+        self.top_talkers = []
+        
+        self.core_count = psutil.cpu_count(logical=True) or 1
+        self.cpu_per_core = [0.0] * self.core_count
+        
+        if config is None:
+            config = load_config()
+        
+        # Swappable reader of per-interface byte counters
+        self.counter_settings = None
+        if counter_source is None:
+            self.counter_settings = (
+                config.get("Settings", "counter_source", fallback="auto"),
+                config.get("Settings", "counter_interfaces", fallback="").replace(",", " ").split())
+            counter_source = create_counter_source(*self.counter_settings)
+        self.counter_source = counter_source
+        
+        # Latest (bytes_recv, bytes_sent) and (download, upload) bps per interface
+        self.nic_counters = self.counter_source.read()
+        self.nic_rates = {}
+        self.total_download = 0.0
+        self.total_upload = 0.0
+        # Rates are timed on the monotonic clock so wall-clock adjustments can't skew them
+        self.last_time = time.monotonic()
+        # Wrap and reset handling per interface; the first read is every interface's baseline
+        self.counter_tracker = CounterTracker(counter_bits=getattr(self.counter_source, "counter_bits", None))
+        self.counter_tracker.update(self.nic_counters, self.last_time)
+        
+        # Add an interface filter to allow user to select which network interface to monitor
+        self.selected_interface = None  # Will use combined stats by default
+        # Initialize active_method attribute
+        self.active_method = "Monitoring all interfaces"
+        
+        self.intervals = {}
+        for name, key in COLLECTOR_INTERVAL_KEYS.items():
+            try:
+                self.intervals[name] = config.getfloat("Settings", key)
+            except (ValueError, configparser.Error) as e:
+                logging.warning(f"Invalid {key} in config, using default: {e}")
+                self.intervals[name] = float(DEFAULT_SETTINGS[key])
+        
+        self.windows_counters = False
+        self.last_system_times = None
+        # psutil.cpu_times() baselines of the cpu and cpu_per_core collectors
+        self.last_cpu_times = None
+        self.last_core_times = None
+        
+        # Spike detection on the total and per-interface rates, None when disabled
+        self.anomalies = create_anomaly_tracker(config)
+        # More than ~1 TB/s is likely an error
+        self.max_plausible_bps = MAX_PLAUSIBLE_BPS
+        
+        self.burst_interval = config.getfloat("Settings", "burst_interval", fallback=0.02)
+        self.burst_duration = config.getfloat("Settings", "burst_duration", fallback=10.0)
+        self.burst = None
+        
+        # Process sweeps and socket attribution can run in a worker process
+        self.worker = create_collector_worker(self, config, self.intervals)
+        # Per-process network usage, None where sockets can't be attributed
+        self.talker_collector = None if self.is_offloaded("talkers") else create_talker_collector()
+        
+        # One row per network sample, with the latest system stats alongside
+        history_length = config.getint("Settings", "history_length", fallback=7200)
+        self.store = SampleStore(max(history_length, 2), self.core_count)
+        # Smaller per-interface rings so switching interfaces shows past data
+        self.interface_history_length = max(config.getint("Settings", "interface_history_length", fallback=600), 2)
+        self.nic_stores = {}
+        # Consumers of every stored row, called on the net collector, e.g. the history
+        # writer, which only queues the row for its own writer thread
+        self.sinks = []
+        
+        # 1 s / 10 s / 1 min / 1 h aggregates for longer graph windows and exports
+        self.rollups = RollupSet()
+        self.add_sink(self.rollups)
+        
+        self.scheduler = SamplingScheduler()
+        self.scheduler.add("cpu", self.collect_cpu, self.intervals["cpu"])
+        self.scheduler.add("cpu_per_core", self.collect_cpu_per_core, self.intervals["cpu_per_core"])
+        self.scheduler.add("ram", self.collect_ram, self.intervals["ram"])
+        self.scheduler.add("processes", self.collect_processes, self.intervals["processes"])
+        if self.talker_collector is not None or self.is_offloaded("talkers"):
+            self.scheduler.add("talkers", self.collect_talkers, self.intervals["talkers"])
+        # Net runs after the others so the stored row sees the system stats from the same batch
+        self.scheduler.add("net", self.update_speeds, self.intervals["net"], stage=1)
+        # Snapshots for async subscribers, see subscribe()
+        self.add_sink(self.scheduler)
+    
+    def start(self):
+        """Start sampling on the scheduler thread"""
+        if self.running:
+            return
+        self.running = True
+        self.init_cpu_counters()
+        self.collect_ram()
+        if self.worker is not None:
+            try:
+                self.worker.start()
+            except (OSError, RuntimeError) as e:
+                logging.error(f"Could not start collector worker, collecting in-process: {e}")
+                self.collect_in_process()
+                self.worker = None
+        self.scheduler.start()
+    
+    def collect_in_process(self):
+        """Take over the worker's collectors when it could not start or has died"""
+        if self.is_offloaded("talkers"):
+            from bitmeter_talkers import create_talker_collector
+            self.talker_collector = create_talker_collector()
+    
+    def is_offloaded(self, collector):
+        """True if `collector` runs in the worker process"""
+        return self.worker is not None and collector in self.worker.collectors
+    
+    def update_speeds(self):
+        """Take one network sample and update the current speeds"""
+        # Stored samples carry wall-clock time, rates use the monotonic clock
+        current_time = time.time()
+        now = time.monotonic()
+        try:
+            # One kernel read covers every interface; the aggregate is derived from it
+            net_io_per_nic = self.counter_source.read()
+            
+            # Log active interfaces for debugging
+            logging.debug(f"Active interfaces: {list(net_io_per_nic.keys())}")
+            
+            time_delta = now - self.last_time
+            if time_delta <= 0:
+                return
+            
+            # A wrapped counter is corrected and a reset or new interface reads 0,
+            # without touching the other interfaces
+            rates = self.counter_tracker.update(net_io_per_nic, now)
+            total_download = 0.0
+            total_upload = 0.0
+            for download, upload in rates.values():
+                total_download += download
+                total_upload += upload
+            
+            # Log raw values for debugging
+            logging.debug(f"Time delta: {time_delta:.2f}s, Total: {total_download:.0f} bps down, {total_upload:.0f} bps up")
+            
+            # Add sanity check for abnormally high values
+            if total_download > self.max_plausible_bps:
+                logging.warning(f"Abnormally high download speed detected: {total_download} bps")
+                total_download = 0
+                
+            if total_upload > self.max_plausible_bps:
+                logging.warning(f"Abnormally high upload speed detected: {total_upload} bps")
+                total_upload = 0
+
+            with self.lock:
+                self.nic_counters = net_io_per_nic
+                self.nic_rates = rates
+                self.total_download = total_download
+                self.total_upload = total_upload
+                
+                # If a specific interface is selected, use its stats
+                if self.selected_interface and self.selected_interface in rates:
+                    self.download_speed, self.upload_speed = rates[self.selected_interface]
+                    self.active_method = f"Monitoring {self.selected_interface}"
+                else:
+                    self.download_speed = total_download
+                    self.upload_speed = total_upload
+                    self.active_method = "Monitoring all interfaces"
+                
+                # Log calculated speeds for debugging
+                dl_text, dl_unit = format_speed(self.download_speed)
+                ul_text, ul_unit = format_speed(self.upload_speed)
+                logging.debug(f"Download: {dl_text} {dl_unit}, Upload: {ul_text} {ul_unit}")
+
+            self.last_time = now
+            
+            # Plausible values that are still far outside each series' own normal range
+            anomalies = self.anomalies
+            for nic, (download, upload) in rates.items():
+                flags = anomalies.observe(current_time, download, upload, nic) if anomalies else 0
+                store = self.nic_stores.get(nic)
+                if store is None:
+                    from bitmeter_store import SampleStore
+                    store = SampleStore(self.interface_history_length,
+                                        columns=("timestamp", "download", "upload", "flags"))
+                    self.nic_stores[nic] = store
+                store.append_row((current_time, download, upload, flags))
+            # Interfaces the tracker expired (veth/VPN churn) take their history with them
+            tracked = self.counter_tracker.state
+            if len(self.nic_stores) > len(tracked):
+                for nic in [nic for nic in self.nic_stores if nic not in tracked]:
+                    del self.nic_stores[nic]
+                    if anomalies is not None:
+                        anomalies.forget(nic)
+            
+            flags = anomalies.observe(current_time, total_download, total_upload) if anomalies else 0
+            self.record_sample(current_time, flags)
+            
+        except Exception as e:
+            logging.error(f"Error getting network stats: {e}")
+    
+    def record_sample(self, timestamp, flags=0):
+        """Append the current values to the sample store (sampler thread only)"""
+        self.store.append(timestamp, self.total_download, self.total_upload,
+                          self.cpu_usage, self.ram_usage, self.cpu_per_core, flags)
+        row = self.store.last()
+        for sink in self.sinks:
+            try:
+                sink.on_sample(row)
+            except Exception as e:
+                logging.error(f"Error in sample sink {type(sink).__name__}: {e}")
+    
+    def subscribe(self, maxsize=16, policy="drop_oldest"):
+        """Async stream of stored rows, consumed on the scheduler loop via spawn()"""
+        return self.scheduler.subscribe(maxsize, policy)
+    
+    def add_sink(self, sink):
+        """Register an object with on_sample(row) and close(), fed from the net collector"""
+        self.sinks.append(sink)
+    
+    def init_cpu_counters(self):
+        # Baselines so the first readings are meaningful
+        self.last_core_times = psutil.cpu_times(percpu=True)
+        if platform.system() != "Windows":
+            self.last_cpu_times = psutil.cpu_times()
+            return
+        
+        try:
+            import win32pdh
+            
+            self.hq = win32pdh.OpenQuery()
+            self.processor_path = win32pdh.MakeCounterPath((None, "Processor", "_Total", None, 0, "% Processor Time"))
+            self.processor_counter = win32pdh.AddCounter(self.hq, self.processor_path)
+            win32pdh.CollectQueryData(self.hq)
+            self.windows_counters = True
+            
+            logging.info("Windows performance counters activated with Task Manager precision")
+        except Exception as e:
+            self.windows_counters = False
+            logging.warning(f"Windows performance counters unavailable: {e}")
+        self.last_cpu_times = psutil.cpu_times()
+    
+    def _read_system_times(self):
+        kernel32 = ctypes.windll.kernel32
+        idle_time = _FILETIME()
+        kernel_time = _FILETIME()
+        user_time = _FILETIME()
+        
+        kernel32.GetSystemTimes(ctypes.byref(idle_time), 
+                             ctypes.byref(kernel_time),
+                             ctypes.byref(user_time))
+        
+        return ((idle_time.dwHighDateTime << 32) + idle_time.dwLowDateTime,
+                (kernel_time.dwHighDateTime << 32) + kernel_time.dwLowDateTime,
+                (user_time.dwHighDateTime << 32) + user_time.dwLowDateTime)
+    
+    def _windows_cpu_percent(self):
+        """CPU usage since the previous call, the same way Task Manager measures it"""
+        if self.windows_counters:
+            try:
+                import win32pdh
+                # PDH reports the rate between this and the previous collection
+                win32pdh.CollectQueryData(self.hq)
+                _, processor_raw = win32pdh.GetFormattedCounterValue(self.processor_counter, win32pdh.PDH_FMT_DOUBLE)
+                return processor_raw
+            except Exception as e:
+                logging.warning(f"Windows performance counter read failed: {e}")
+                self.windows_counters = False
+        
+        try:
+            current = self._read_system_times()
+            previous = self.last_system_times
+            self.last_system_times = current
+            if previous is None:
+                return self.cpu_usage
+            
+            idle_delta = current[0] - previous[0]
+            system_delta = (current[1] - previous[1]) + (current[2] - previous[2])
+            
+            if system_delta > 0:
+                return 100.0 * (1.0 - idle_delta / float(system_delta))
+            return 0.0
+        except Exception as inner_e:
+            logging.error(f"All Windows-specific methods failed, using psutil: {inner_e}")
+            return self._psutil_cpu_percent()
+    
+    def _psutil_cpu_percent(self):
+        current = psutil.cpu_times()
+        previous, self.last_cpu_times = self.last_cpu_times, current
+        if previous is None:
+            return self.cpu_usage
+        return cpu_busy_percent(previous, current)
+    
+    def collect_cpu(self):
+        if platform.system() == "Windows":
+            cpu_percent = self._windows_cpu_percent()
+        else:
+            cpu_percent = self._psutil_cpu_percent()
+        
+        cpu_percent = max(0.0, min(100.0, cpu_percent))
+        with self.system_stats_lock:
+            self.cpu_usage = cpu_percent
+    
+    def collect_cpu_per_core(self):
+        try:
+            current = psutil.cpu_times(percpu=True)
+            previous, self.last_core_times = self.last_core_times, current
+            if previous is None or len(previous) != len(current):
+                cpu_per_core = [0.0] * len(current)
+            else:
+                cpu_per_core = [cpu_busy_percent(before, after) for before, after in zip(previous, current)]
+        except Exception as core_e:
+            logging.error(f"Error getting per-core CPU: {core_e}")
+            cpu_per_core = [0.0] * self.core_count
+        with self.system_stats_lock:
+            self.cpu_per_core = cpu_per_core
+    
+    def collect_ram(self):
+        try:
+            mem = psutil.virtual_memory()
+            ram_percent = mem.percent
+            ram_used = mem.used
+            ram_total = mem.total
+        except Exception as e:
+            logging.error(f"Error getting memory info: {e}")
+            ram_percent = 0.0
+            ram_used = 0
+            ram_total = 1
+        with self.system_stats_lock:
+            self.ram_usage = ram_percent
+            self.ram_used = ram_used
+            self.ram_total = ram_total
+    
+    def collect_processes(self):
+        if self.is_offloaded("processes"):
+            return
+        try:
+            top_processes = self.process_table.scan()
+        except Exception as e:
+            logging.error(f"Error getting process info: {e}")
+            top_processes = []
+        with self.system_stats_lock:
+            self.top_processes = top_processes
+    
+    def collect_talkers(self):
+        if self.is_offloaded("talkers") or self.talker_collector is None:
+            return
+        try:
+            top_talkers = self.talker_collector.collect()
+        except Exception as e:
+            logging.error(f"Error attributing network usage: {e}")
+            top_talkers = []
+        with self.system_stats_lock:
+            self.top_talkers = top_talkers
+    
+    def update_system_stats(self):
+        """Run every system collector once, outside of the scheduler"""
+        self.collect_cpu()
+        self.collect_cpu_per_core()
+        self.collect_ram()
+        self.collect_processes()
+        self.collect_talkers()
+    
+    def get_system_stats(self):
+        with self.system_stats_lock:
+            return {
+                "cpu_percent": self.cpu_usage,
+                "cpu_per_core": self.cpu_per_core,
+                "ram_percent": self.ram_usage,
+                "ram_used": self.ram_used,
+                "ram_total": self.ram_total,
+                "top_processes": self.top_processes,
+                "top_talkers": self.top_talkers
+            }
+    
+    def get_process_scan_stats(self):
+        """Returns the cost of the top-process scan"""
+        if self.is_offloaded("processes") and self.worker.scan_stats is not None:
+            return dict(self.worker.scan_stats)
+        with self.system_stats_lock:
+            return self.process_table.get_scan_stats()
+    
+    def get_self_stats(self, frame_timer=None):
+        """BitMeter's own CPU, memory, collector latencies and lock waits"""
+        from bitmeter_selfstats import collect_self_stats
+        return collect_self_stats(self, frame_timer)
+    
+    def talkers_available(self):
+        """False where per-process network usage can't be collected"""
+        if self.is_offloaded("talkers"):
+            # Assume it works until the worker reports otherwise
+            return self.worker.running_collectors is None or self.worker.is_running("talkers")
+        return self.talker_collector is not None
+    
+    def get_speeds(self):
+        with self.lock:
+            return self.download_speed, self.upload_speed
+    
+    def get_monitoring_method(self):
+        """Returns the current network monitoring method"""
+        return getattr(self, 'active_method', "Monitoring all interfaces")
+    
+    def start_burst(self, duration=None, interval=None, on_done=None):
+        """Start a high-resolution capture of the selected interface on its own thread.
+        
+        on_done(capture) is called from that thread; the result is in capture.result.
+        """
+        if self.burst is not None and self.burst.is_running():
+            raise RuntimeError("A burst capture is already running")
+        from bitmeter_sources import create_counter_source
+        from bitmeter_burst import BurstCapture
+        # The capture reads on its own thread, so it gets its own counter source
+        own_source = self.counter_settings is not None
+        source = create_counter_source(*self.counter_settings) if own_source else self.counter_source
+        interfaces = [self.selected_interface] if self.selected_interface else None
+        self.burst = BurstCapture(source, interval or self.burst_interval, duration or self.burst_duration,
+                                  interfaces, on_done, close_source=own_source)
+        return self.burst.start()
+    
+    def stop(self):
+        self.running = False
+        if self.burst is not None:
+            self.burst.stop()
+        self.scheduler.stop()
+        if self.worker is not None:
+            self.worker.stop()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logging.error(f"Error closing sample sink {type(sink).__name__}: {e}")
+        self.counter_source.close()
+        if self.talker_collector is not None:
+            self.talker_collector.close()
+    
+    # Add method to allow selecting a specific interface
+    def set_interface(self, interface_name=None):
+        """Set a specific network interface to monitor or None for all interfaces"""
+        self.selected_interface = interface_name
+        
+    def get_interface_rates(self):
+        """Returns {interface: (download_bps, upload_bps)} from the latest sample"""
+        with self.lock:
+            return self.nic_rates
+    
+    def get_interface_counters(self):
+        """Returns {interface: (bytes_recv, bytes_sent)} from the latest sample"""
+        with self.lock:
+            return self.nic_counters
+    
+    def get_interface_store(self, interface_name):
+        """Sample history of one interface, or None if it was never seen"""
+        return self.nic_stores.get(interface_name)
+    
+    def get_available_interfaces(self):
+        """Return a list of available network interfaces"""
+        try:
+            interfaces = self.nic_counters or self.counter_source.read()
+            # Filter out loopback interfaces
+            return [nic for nic in interfaces.keys() if not nic.startswith('lo')]
+        except Exception as e:
+            logging.error(f"Error getting interfaces: {e}")
+            return []
+
+
+def build_sample(monitor):
+    """Collects the current monitor values into a plain dict"""
+    dl_speed, ul_speed = monitor.get_speeds()
+    stats = monitor.get_system_stats()
+    last = monitor.store.last()
+    return {
+        "timestamp": time.time(),
+        "interface": monitor.selected_interface or "all",
+        "download_bps": dl_speed,
+        "upload_bps": ul_speed,
+        "cpu_percent": stats["cpu_percent"],
+        "cpu_per_core": list(stats["cpu_per_core"]),
+        "ram_percent": stats["ram_percent"],
+        "ram_used": stats["ram_used"],
+        "ram_total": stats["ram_total"],
+        "top_processes": [[round(cpu, 1), name] for cpu, name in stats["top_processes"]],
+        "top_talkers": [[round(dl, 1), round(ul, 1), name] for dl, ul, name in stats["top_talkers"]],
+        "anomaly_flags": int(last[monitor.store.index["flags"]]) if last is not None else 0
+    }
+
+def format_sample(sample, unit=None):
+    dl_text, dl_unit = format_speed(sample["download_bps"], unit)
+    ul_text, ul_unit = format_speed(sample["upload_bps"], unit)
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sample["timestamp"]))
+    return (f"{stamp}  D(↓) {dl_text} {dl_unit}  U(↑) {ul_text} {ul_unit}  "
+            f"CPU: {int(sample['cpu_percent'])}%  RAM: {int(sample['ram_percent'])}%")
+
+def format_burst(result, unit=None):
+    """Text summary of a burst capture result"""
+    lines = [f"{result['samples']} samples over {result['elapsed']:.2f} s "
+             f"every {result['interval'] * 1000:.0f} ms "
+             f"(max gap {result['max_gap'] * 1000:.1f} ms, {result['missed_slots']} missed)"]
+    for label, key in (("Download", "download"), ("Upload", "upload")):
+        stats = result[key]
+        peak, p99, mean = (" ".join(format_speed(stats[k], unit)) for k in ("peak_bps", "p99_bps", "mean_bps"))
+        lines.append(f"{label}: peak {peak}, p99 {p99}, mean {mean}, "
+                     f"burst {stats['burst_duration'] * 1000:.0f} ms ({stats['bursts']} bursts)")
+    return "\n".join(lines)
+
+def run_headless(argv=None):
+    """Runs the monitor without any UI and writes one sample per interval"""
+    config = load_config()
+
+    parser = argparse.ArgumentParser(prog="bitmeter --headless",
+                                     description="Collect BitMeter samples without the overlay")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--interval", type=float,
+                        default=config.getfloat("Settings", "update_interval", fallback=0.5),
+                        help="seconds between emitted samples")
+    parser.add_argument("--count", type=int, default=0,
+                        help="number of samples to take (printed unless --quiet), 0 runs until interrupted")
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    parser.add_argument("--interface", default=None, help="only monitor this interface")
+    parser.add_argument("--output", default="-", help="file to append samples to, - for stdout")
+    parser.add_argument("--exporter-port", type=int, default=None,
+                        help="serve Prometheus metrics on this port (overrides exporter_port)")
+    parser.add_argument("--fleet-server", metavar="HOST:PORT", default=None,
+                        help="push every sample to a fleet aggregator (overrides fleet_server)")
+    parser.add_argument("--agent-port", type=int, default=None,
+                        help="serve samples to remote overlays on this port (overrides agent_port)")
+    parser.add_argument("--quiet", action="store_true", help="do not emit samples, e.g. when only exporting")
+    parser.add_argument("--self-stats", metavar="FILE", default=None,
+                        help="write BitMeter's own overhead stats as JSON to FILE on exit")
+    parser.add_argument("--burst", type=float, metavar="SECONDS", default=None,
+                        help="run one high-resolution burst capture, print its summary and exit")
+    parser.add_argument("--burst-interval", type=float, metavar="SECONDS", default=None,
+                        help="sampling interval of the burst capture (overrides burst_interval)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from bitmeter_history import create_history_writer
+    from bitmeter_files import create_file_exporter
+    from bitmeter_fleet import create_fleet_agent
+    from bitmeter_remote import create_agent_server
+    from bitmeter_alerts import create_alert_engine
+    from bitmeter_exporter import create_exporter
+
+    unit = config.get("Settings", "speed_unit", fallback="None")
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+
+    monitor = EnhancedNetworkMonitor(config)
+    monitor.set_interface(args.interface)
+    history_writer = create_history_writer(config)
+    if history_writer is not None:
+        monitor.add_sink(history_writer)
+    file_exporter = create_file_exporter(config, monitor.core_count)
+    if file_exporter is not None:
+        monitor.add_sink(file_exporter)
+    fleet_agent = create_fleet_agent(config, args.fleet_server)
+    if fleet_agent is not None:
+        monitor.add_sink(fleet_agent)
+    create_agent_server(monitor, config, args.agent_port)
+    create_alert_engine(monitor, config)
+    create_exporter(monitor, config, args.exporter_port)
+
+    done = threading.Event()
+    emitted = 0
+
+    def emit():
+        nonlocal emitted
+        # --count limits samples taken, printed or not
+        if not args.quiet:
+            sample = build_sample(monitor)
+            if args.format == "json":
+                out.write(json.dumps(sample) + "\n")
+            else:
+                out.write(format_sample(sample, unit) + "\n")
+            out.flush()
+        emitted += 1
+        if args.count > 0 and emitted >= args.count:
+            done.set()
+
+    # Emitting is just another collector, so output stays aligned with sampling
+    monitor.scheduler.add("emit", emit, args.interval, stage=2)
+    monitor.start()
+    
+    if args.burst is not None:
+        def report_burst(capture):
+            if capture.result is not None:
+                if args.format == "json":
+                    out.write(json.dumps({"burst": capture.result}) + "\n")
+                else:
+                    out.write(format_burst(capture.result, unit) + "\n")
+                out.flush()
+            done.set()
+        
+        monitor.start_burst(args.burst, args.burst_interval, report_burst)
+
+    try:
+        while not done.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        if out is not sys.stdout:
+            out.close()
+        if args.self_stats:
+            with open(args.self_stats, "w") as f:
+                json.dump(monitor.get_self_stats(), f, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(run_headless())
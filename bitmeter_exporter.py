@@ -0,0 +1,195 @@
+"""Prometheus text-format exporter for EnhancedNetworkMonitor.
+
+The exporter is a sample sink: each new sample only bumps a generation
+counter. The first scrape after that renders the payload once; every other
+scrape of the same sample gets the cached bytes (plain or gzip) without
+touching the monitor's locks.
+"""
+import gzip
+import logging
+import threading
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsExporter:
+    def __init__(self, monitor, address="127.0.0.1", port=9101):
+        self.monitor = monitor
+        self.address = address
+        self.port = port
+
+        self.generation = 0
+        self._built_generation = -1
+        self._payload = (b"", b"")
+        self._build_lock = threading.Lock()
+
+        self.server = None
+        self.thread = None
+        self.scrapes = 0
+        self.renders = 0
+
+    def on_sample(self, row):
+        self.generation += 1
+
+    def close(self):
+        self.stop()
+
+    def start(self):
+        # Imported here so a disabled exporter costs nothing at startup
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                plain, compressed = exporter.get_payload()
+                use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+                body = compressed if use_gzip else plain
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                if use_gzip:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.address, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="bitmeter-exporter", daemon=True)
+        self.thread.start()
+        logging.info(f"Metrics exporter listening on http://{self.address}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def get_payload(self):
+        """Returns (plain, gzip) bytes for the latest sample, rendering at most once per sample"""
+        self.scrapes += 1
+        generation = self.generation
+        if self._built_generation != generation:
+            with self._build_lock:
+                # Another scrape may have rendered it while we waited
+                if self._built_generation != generation:
+                    text = self.render().encode("utf-8")
+                    self._payload = (text, gzip.compress(text, compresslevel=5))
+                    self._built_generation = generation
+                    self.renders += 1
+        return self._payload
+
+    def render(self):
+        monitor = self.monitor
+        counters = monitor.get_interface_counters()
+        rates = monitor.get_interface_rates()
+        stats = monitor.get_system_stats()
+        last = monitor.store.last()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if labels:
+                    label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+
+        metric("bitmeter_interface_receive_bytes_total", "counter",
+               "Bytes received per interface.",
+               [((("interface", nic),), c[0]) for nic, c in counters.items()])
+        metric("bitmeter_interface_transmit_bytes_total", "counter",
+               "Bytes sent per interface.",
+               [((("interface", nic),), c[1]) for nic, c in counters.items()])
+        metric("bitmeter_interface_receive_bits_per_second", "gauge",
+               "Download rate per interface.",
+               [((("interface", nic),), f"{r[0]:.1f}") for nic, r in rates.items()])
+        metric("bitmeter_interface_transmit_bits_per_second", "gauge",
+               "Upload rate per interface.",
+               [((("interface", nic),), f"{r[1]:.1f}") for nic, r in rates.items()])
+
+        if last is not None:
+            metric("bitmeter_download_bits_per_second", "gauge",
+                   "Download rate over all interfaces.", [((), f"{last[1]:.1f}")])
+            metric("bitmeter_upload_bits_per_second", "gauge",
+                   "Upload rate over all interfaces.", [((), f"{last[2]:.1f}")])
+            metric("bitmeter_sample_timestamp_seconds", "gauge",
+                   "Time of the latest sample.", [((), f"{last[0]:.3f}")])
+
+        metric("bitmeter_cpu_percent", "gauge", "Total CPU usage.",
+               [((), f"{stats['cpu_percent']:.1f}")])
+        metric("bitmeter_cpu_core_percent", "gauge", "CPU usage per logical core.",
+               [((("core", i),), f"{v:.1f}") for i, v in enumerate(stats["cpu_per_core"])])
+        metric("bitmeter_memory_percent", "gauge", "RAM usage.",
+               [((), f"{stats['ram_percent']:.1f}")])
+        metric("bitmeter_memory_used_bytes", "gauge", "RAM in use.", [((), stats["ram_used"])])
+        metric("bitmeter_memory_total_bytes", "gauge", "Installed RAM.", [((), stats["ram_total"])])
+        metric("bitmeter_top_process_cpu_percent", "gauge", "CPU usage of the busiest processes.",
+               [((("rank", i + 1), ("name", name)), f"{cpu:.1f}")
+                for i, (cpu, name) in enumerate(stats["top_processes"])])
+        metric("bitmeter_top_talker_receive_bits_per_second", "gauge", "Download rate of the busiest processes.",
+               [((("rank", i + 1), ("name", name)), f"{dl:.1f}")
+                for i, (dl, ul, name) in enumerate(stats["top_talkers"])])
+        metric("bitmeter_top_talker_transmit_bits_per_second", "gauge", "Upload rate of the busiest processes.",
+               [((("rank", i + 1), ("name", name)), f"{ul:.1f}")
+                for i, (dl, ul, name) in enumerate(stats["top_talkers"])])
+
+        scan = monitor.get_process_scan_stats()
+        metric("bitmeter_process_scan_seconds", "gauge", "Cost of the last top-process scan.",
+               [((), f"{scan['last_scan_ms'] / 1000.0:.6f}")])
+
+        own = monitor.get_self_stats()
+        process = own["process"]
+        metric("bitmeter_self_cpu_seconds_total", "counter", "CPU time used by BitMeter itself.",
+               [((("mode", "user"),), f"{process['cpu_user_seconds']:.3f}"),
+                ((("mode", "system"),), f"{process['cpu_system_seconds']:.3f}")])
+        metric("bitmeter_self_resident_memory_bytes", "gauge", "Resident memory of BitMeter.",
+               [((), process["rss_bytes"])])
+        metric("bitmeter_self_threads", "gauge", "Threads in the BitMeter process.",
+               [((), process["threads"])])
+        metric("bitmeter_collector_seconds_total", "counter", "Total run time per collector.",
+               [((("collector", name),), f"{hist['total_ms'] / 1000.0:.6f}")
+                for name, hist in own["collectors"].items()])
+        metric("bitmeter_collector_runs_total", "counter", "Runs per collector.",
+               [((("collector", name),), hist["count"]) for name, hist in own["collectors"].items()])
+        metric("bitmeter_collector_max_seconds", "gauge", "Slowest run per collector.",
+               [((("collector", name),), f"{hist['max_ms'] / 1000.0:.6f}")
+                for name, hist in own["collectors"].items()])
+        metric("bitmeter_scheduler_late_ticks_total", "counter", "Ticks that started late.",
+               [((), own["scheduler"]["late_ticks"])])
+        metric("bitmeter_scheduler_skipped_ticks_total", "counter", "Ticks skipped after falling behind.",
+               [((), own["scheduler"]["skipped_ticks"])])
+        metric("bitmeter_lock_wait_seconds_total", "counter", "Total time spent waiting for monitor locks.",
+               [((("lock", name),), f"{hist['total_ms'] / 1000.0:.6f}") for name, hist in own["locks"].items()])
+
+        return "\n".join(lines) + "\n"
+
+
+def create_exporter(monitor, config, port=None):
+    """Starts a MetricsExporter if a port is configured, returns it or None"""
+    if port is None:
+        port = config.getint("Settings", "exporter_port", fallback=0)
+    if port <= 0:
+        return None
+    exporter = MetricsExporter(monitor, config.get("Settings", "exporter_address", fallback="127.0.0.1"), port)
+    try:
+        exporter.start()
+    except OSError as e:
+        logging.error(f"Could not start metrics exporter on port {port}: {e}")
+        return None
+    monitor.add_sink(exporter)
+    return exporter
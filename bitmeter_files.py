@@ -0,0 +1,252 @@
+"""Streaming export of samples to rotating CSV, NDJSON or Parquet files.
+
+on_sample() only copies the row into a bounded queue; when the queue is full
+the row is dropped and counted, so the sampler never waits on the disk. A
+flush thread drains the queue in batches, writes them to the current file and
+rotates it by age or size. Parquet needs pyarrow and falls back to CSV
+without it.
+
+fsync policy: "none" leaves flushing to the OS, "batch" syncs after every
+written batch, "rotate" syncs only when a file is closed.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+
+FORMATS = ("csv", "ndjson", "parquet")
+FSYNC_POLICIES = ("none", "batch", "rotate")
+BASE_COLUMNS = ("timestamp", "download_bps", "upload_bps", "cpu_percent", "ram_percent", "anomaly_flags")
+# Stored as a float in the SampleStore, written as an integer like the history CSV
+FLAGS_INDEX = BASE_COLUMNS.index("anomaly_flags")
+
+
+class _TextFile:
+    """CSV and NDJSON: append lines, one write per batch"""
+
+    def __init__(self, path, fmt, columns):
+        self.fmt = fmt
+        self.columns = columns
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        if fmt == "csv":
+            self.file.write(",".join(columns) + "\n")
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            lines = [",".join(map(repr, row)) for row in rows]
+        else:
+            cores = len(self.columns) - len(BASE_COLUMNS)
+            lines = []
+            for row in rows:
+                record = dict(zip(BASE_COLUMNS, row))
+                if cores:
+                    record["cpu_per_core"] = row[len(BASE_COLUMNS):]
+                lines.append(json.dumps(record))
+        self.file.write("\n".join(lines) + "\n")
+        self.file.flush()
+        return sum(map(len, lines)) + len(lines)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetFile:
+    """One row group per batch; the footer is written on close"""
+
+    def __init__(self, path, columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.columns = columns
+        types = [pyarrow.float64()] * 3 + [pyarrow.float32()] * (len(columns) - 3)
+        types[FLAGS_INDEX] = pyarrow.uint8()
+        self.schema = pyarrow.schema(list(zip(columns, types)))
+        self.file = open(path, "wb")
+        self.writer = pyarrow.parquet.ParquetWriter(self.file, self.schema)
+
+    def write(self, rows):
+        arrays = [self.pa.array(values, type=field.type)
+                  for values, field in zip(zip(*rows), self.schema)]
+        table = self.pa.Table.from_arrays(arrays, schema=self.schema)
+        self.writer.write_table(table)
+        return table.nbytes
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.writer.close()
+        self.file.close()
+
+
+class FileExporter:
+    """Sample sink writing batches to rotating files from a background thread"""
+
+    def __init__(self, directory, fmt="csv", cores=0, rotate_seconds=3600, max_bytes=64 * 2**20,
+                 fsync="batch", queue_size=1000, flush_interval=1.0, batch_size=500):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown export fsync policy '{fsync}'")
+        if fmt == "parquet":
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                logging.warning("Parquet export needs pyarrow, writing CSV instead")
+                fmt = "csv"
+
+        self.directory = directory
+        self.fmt = fmt
+        self.columns = BASE_COLUMNS + tuple(f"cpu_core{i}" for i in range(cores))
+        self.rotate_seconds = rotate_seconds
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.rows_written = 0
+        self.files_written = 0
+
+        self.file = None
+        self.path = None
+        self.file_bytes = 0
+        self.file_deadline = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="bitmeter-file-export", daemon=True)
+        self.thread.start()
+
+    def on_sample(self, row):
+        """Sink callback: queue a copy of the row, dropping it if the writer is behind"""
+        values = row.tolist()
+        values[FLAGS_INDEX] = int(values[FLAGS_INDEX])
+        try:
+            self.queue.put_nowait(values)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        suffix = ".ndjson" if self.fmt == "ndjson" else "." + self.fmt
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"bitmeter-{stamp}{suffix}")
+        index = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"bitmeter-{stamp}-{index}{suffix}")
+            index += 1
+        if self.fmt == "parquet":
+            self.file = _ParquetFile(path, self.columns)
+        else:
+            self.file = _TextFile(path, self.fmt, self.columns)
+        self.path = path
+        self.file_bytes = 0
+        self.file_deadline = time.monotonic() + self.rotate_seconds if self.rotate_seconds > 0 else float("inf")
+        self.files_written += 1
+
+    def _close(self):
+        if self.file is None:
+            return
+        try:
+            if self.fsync != "none" and self.fmt != "parquet":
+                os.fsync(self.file.fileno())
+            self.file.close()
+            if self.fsync != "none" and self.fmt == "parquet":
+                # The footer is only written by close(), so sync the finished file
+                fd = os.open(self.path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            logging.error(f"Error closing export file {self.path}: {e}")
+        self.file = None
+
+    def _write(self, rows):
+        if self.file is not None and (time.monotonic() >= self.file_deadline or
+                                      (self.max_bytes > 0 and self.file_bytes >= self.max_bytes)):
+            self._close()
+        if self.file is None:
+            self._open()
+        self.file_bytes += self.file.write(rows)
+        if self.fsync == "batch":
+            os.fsync(self.file.fileno())
+        self.rows_written += len(rows)
+
+    def _drain(self, block):
+        rows = []
+        try:
+            if block:
+                rows.append(self.queue.get(timeout=self.flush_interval))
+            while len(rows) < self.batch_size:
+                rows.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return rows
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            # Wait for the first row, then give the batch flush_interval to fill up
+            rows = self._drain(block=True)
+            if rows and len(rows) < self.batch_size and not self.stop_event.wait(self.flush_interval):
+                rows += self._drain(block=False)
+            if rows:
+                try:
+                    self._write(rows)
+                except (OSError, ValueError) as e:
+                    logging.error(f"Error writing export file {self.path}: {e}")
+                    self._close()
+        # Write out whatever is still queued
+        while True:
+            rows = self._drain(block=False)
+            if not rows:
+                break
+            try:
+                self._write(rows)
+            except (OSError, ValueError) as e:
+                logging.error(f"Error writing export file {self.path}: {e}")
+                break
+        self._close()
+
+    def get_stats(self):
+        return {
+            "format": self.fmt,
+            "path": self.path,
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "rows_written": self.rows_written,
+            "files_written": self.files_written
+        }
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(self.flush_interval + 5.0)
+
+
+def create_file_exporter(config, cores=0):
+    """Builds a FileExporter from config.ini, or None when export_format is none"""
+    fmt = config.get("Settings", "export_format", fallback="none").strip().lower()
+    if fmt in ("", "none"):
+        return None
+    try:
+        return FileExporter(
+            config.get("Settings", "export_dir", fallback="export"),
+            fmt=fmt,
+            cores=cores,
+            rotate_seconds=config.getfloat("Settings", "export_rotate_minutes", fallback=60.0) * 60,
+            max_bytes=int(config.getfloat("Settings", "export_max_mb", fallback=64.0) * 2**20),
+            fsync=config.get("Settings", "export_fsync", fallback="batch").strip().lower(),
+            queue_size=config.getint("Settings", "export_queue_size", fallback=1000),
+            flush_interval=config.getfloat("Settings", "export_flush_interval", fallback=1.0)
+        )
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not start file export: {e}")
+        return None
@@ -0,0 +1,403 @@
+"""Fleet aggregation: many headless agents pushing samples to one server.
+
+An agent is a sample sink that sends every row as one small UDP datagram
+(PACKET followed by the UTF-8 host name). Sending is non-blocking and a
+failed send is only counted, so a missing server never slows the sampler.
+
+The aggregator receives on one thread. Each host gets a raw SampleStore
+ring and a RollupSet with coarser, smaller tiers than the overlay's, so a
+few hundred hosts stay within tens of megabytes. Queries read the rings
+without locks: the latest values for top-N, and a window of raw samples
+(or rollup averages for longer windows) for percentiles. Per-host sequence
+numbers count lost datagrams.
+
+    python bitmeter_fleet.py serve --port 9102 --http-port 9103
+    python bitmeter_fleet.py loopback --agents 300 --seconds 10
+"""
+import sys
+import json
+import time
+import heapq
+import socket
+import struct
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+from bitmeter_store import SampleStore
+from bitmeter_rollup import RollupSet
+
+
+# magic, version, host name length, sequence, timestamp, download, upload, cpu, ram
+PACKET = struct.Struct("<2sBBIdddff")
+MAGIC = b"BM"
+VERSION = 1
+MAX_DATAGRAM = 1024
+
+METRICS = ("download", "upload", "cpu", "ram")
+
+# (bucket seconds, buckets kept): 1 hour, 1 day, 1 week
+FLEET_TIERS = (
+    (10, 360),
+    (60, 1440),
+    (3600, 168)
+)
+
+DEFAULT_PORT = 9102
+
+
+def encode_sample(host, seq, row):
+    raw = host.encode("utf-8", "replace")[:255]
+    return PACKET.pack(MAGIC, VERSION, len(raw), seq & 0xFFFFFFFF,
+                       row[0], row[1], row[2], row[3], row[4]) + raw
+
+def decode_sample(data):
+    """Returns (host, seq, (timestamp, download, upload, cpu, ram))"""
+    magic, version, length, seq, *values = PACKET.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a BitMeter sample")
+    host = data[PACKET.size:PACKET.size + length].decode("utf-8", "replace")
+    return host, seq, values
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        return text, default_port
+    return host.strip("[]"), int(port)
+
+
+class FleetAgent:
+    """Sample sink pushing every row to an aggregator over UDP
+
+    The server name is resolved once here. A failed send re-resolves it on
+    a background thread (at most every RESOLVE_INTERVAL seconds), so a DNS
+    lookup never runs on the collector thread.
+    """
+    RESOLVE_INTERVAL = 30.0
+
+    def __init__(self, address, host=None):
+        self.address = address
+        self.host = host or socket.gethostname()
+        # (socket, sockaddr) swapped as one reference by the resolver thread
+        self.route = self._connect()
+        self.resolved_at = time.monotonic()
+        self.resolving = False
+        self.seq = 0
+        self.sent = 0
+        self.failed = 0
+
+    def _connect(self):
+        family, _, _, _, sockaddr = socket.getaddrinfo(*self.address, type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        return sock, sockaddr
+
+    def _resolve(self):
+        try:
+            route = self._connect()
+        except OSError as e:
+            logging.debug(f"Could not resolve fleet server {self.address[0]}: {e}")
+        else:
+            old, self.route = self.route, route
+            old[0].close()
+        finally:
+            self.resolved_at = time.monotonic()
+            self.resolving = False
+
+    def on_sample(self, row):
+        self.seq += 1
+        sock, sockaddr = self.route
+        try:
+            sock.sendto(encode_sample(self.host, self.seq, row), sockaddr)
+            self.sent += 1
+        except OSError:
+            # Full buffer, no route or a stale address: drop this one
+            self.failed += 1
+            if not self.resolving and time.monotonic() - self.resolved_at >= self.RESOLVE_INTERVAL:
+                self.resolving = True
+                threading.Thread(target=self._resolve, name="bitmeter-fleet-resolve", daemon=True).start()
+
+    def close(self):
+        self.route[0].close()
+
+
+class HostState:
+    __slots__ = ("store", "rollups", "latest", "last_seen", "last_seq", "received", "lost")
+
+    def __init__(self, capacity, tiers):
+        self.store = SampleStore(capacity)
+        self.rollups = RollupSet(tiers)
+        self.latest = None
+        self.last_seen = 0.0
+        self.last_seq = None
+        self.received = 0
+        self.lost = 0
+
+
+class FleetAggregator:
+    def __init__(self, address="0.0.0.0", port=DEFAULT_PORT, capacity=600, tiers=FLEET_TIERS,
+                 stale_after=10.0):
+        self.address = address
+        self.port = port
+        self.capacity = max(capacity, 2)
+        self.tiers = tiers
+        self.stale_after = stale_after
+
+        self.hosts = {}
+        self.packets = 0
+        self.bad_packets = 0
+        self.busy_seconds = 0.0
+
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self.server = None
+
+    def start(self):
+        family = socket.AF_INET6 if ":" in self.address else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 2**20)
+        self.sock.bind((self.address, self.port))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._receive, name="bitmeter-fleet", daemon=True)
+        self.thread.start()
+        logging.info(f"Fleet aggregator listening on udp://{self.address}:{self.port}")
+        return self
+
+    def _receive(self):
+        recv = self.sock.recvfrom
+        clock = time.perf_counter
+        while self.running:
+            try:
+                data, _ = recv(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            start = clock()
+            self.ingest(data)
+            self.busy_seconds += clock() - start
+
+    def ingest(self, data, now=None):
+        """Apply one datagram; also the entry point for stand-ins and tests"""
+        try:
+            host, seq, values = decode_sample(data)
+        except (struct.error, ValueError):
+            self.bad_packets += 1
+            return
+        self.packets += 1
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.capacity, self.tiers)
+        if state.last_seq is not None:
+            gap = (seq - state.last_seq) & 0xFFFFFFFF
+            if gap == 0 or gap > 0x7FFFFFFF:
+                if values[0] <= state.latest[0]:
+                    # Duplicate or reordered datagram; the ring must stay in time order
+                    return
+                # The agent restarted and counts from 1 again
+            else:
+                state.lost += gap - 1
+        state.last_seq = seq
+        state.received += 1
+        state.last_seen = now or time.time()
+        state.store.append(*values)
+        state.rollups.on_sample(values)
+        state.latest = values
+
+    def live_hosts(self, now=None):
+        """Hosts that reported within stale_after seconds"""
+        cutoff = (now or time.time()) - self.stale_after
+        return {host: state for host, state in list(self.hosts.items()) if state.last_seen >= cutoff}
+
+    def top_hosts(self, metric="download", n=10):
+        """[(value, host)] of the n live hosts with the highest current value"""
+        column = 1 + METRICS.index(metric)
+        return heapq.nlargest(n, ((state.latest[column], host)
+                                  for host, state in self.live_hosts().items()))
+
+    def window(self, host, metric, seconds):
+        """Values of one host's metric over the last `seconds`, raw when the ring covers it"""
+        state = self.hosts[host]
+        cutoff = time.time() - seconds
+        store = state.store
+        times = store.column("timestamp")
+        # Until the ring wraps it holds the host's whole history
+        if len(times) and (times[0] <= cutoff or store.generation < store.capacity - 1):
+            values = store.column(metric)
+        else:
+            resolution = state.rollups.tier_for_window(seconds, 360)
+            times = state.rollups.timestamps(resolution)
+            values = state.rollups.series(resolution, metric, "avg")
+        return values[np.searchsorted(times, cutoff):]
+
+    def percentile(self, host, metric="download", q=95.0, seconds=300.0):
+        values = self.window(host, metric, seconds)
+        return float(np.percentile(values, q)) if len(values) else None
+
+    def percentiles(self, metric="download", q=95.0, seconds=300.0):
+        """{host: q-th percentile over the window} for every live host"""
+        return {host: self.percentile(host, metric, q, seconds) for host in self.live_hosts()}
+
+    def get_stats(self):
+        return {
+            "hosts": len(self.hosts),
+            "live_hosts": len(self.live_hosts()),
+            "packets": self.packets,
+            "bad_packets": self.bad_packets,
+            "lost_packets": sum(state.lost for state in list(self.hosts.values())),
+            "busy_seconds": self.busy_seconds
+        }
+
+    def serve_http(self, address="127.0.0.1", port=0):
+        """JSON queries: /hosts, /top?metric=&n=, /percentile?metric=&q=&window=[&host=]"""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        from urllib.parse import urlsplit, parse_qs
+        aggregator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    body = aggregator.query(url.path, params)
+                except (KeyError, ValueError) as e:
+                    self.send_error(400, str(e))
+                    return
+                if body is None:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="bitmeter-fleet-http", daemon=True).start()
+        logging.info(f"Fleet queries on http://{address}:{self.server.server_address[1]}/")
+        return self.server.server_address[1]
+
+    def query(self, path, params):
+        metric = params.get("metric", "download")
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric '{metric}'")
+        if path == "/hosts":
+            now = time.time()
+            return {host: {"last_seen": state.last_seen, "age": now - state.last_seen,
+                           "received": state.received, "lost": state.lost}
+                    for host, state in list(self.hosts.items())}
+        if path == "/top":
+            return [{"host": host, metric: value}
+                    for value, host in self.top_hosts(metric, int(params.get("n", 10)))]
+        if path == "/percentile":
+            q = float(params.get("q", 95))
+            seconds = float(params.get("window", 300))
+            if "host" in params:
+                return {params["host"]: self.percentile(params["host"], metric, q, seconds)}
+            return self.percentiles(metric, q, seconds)
+        if path == "/stats":
+            return self.get_stats()
+        return None
+
+    def stop(self):
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.thread is not None:
+            self.thread.join(2.0)
+        if self.sock is not None:
+            self.sock.close()
+
+
+def create_fleet_agent(config, server=None):
+    """FleetAgent pushing to fleet_server, or None when it is not set"""
+    server = server or config.get("Settings", "fleet_server", fallback="").strip()
+    if not server:
+        return None
+    try:
+        return FleetAgent(parse_address(server))
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not start fleet agent for {server}: {e}")
+        return None
+
+
+def run_loopback(agents, seconds, rate):
+    """Stand-in fleet: `agents` fake hosts pushing to a local aggregator over UDP"""
+    aggregator = FleetAggregator("127.0.0.1", 0).start()
+    senders = [FleetAgent(("127.0.0.1", aggregator.port), host=f"agent-{i:03d}") for i in range(agents)]
+    rng = np.random.default_rng(1)
+    cpu_start = time.process_time()
+    start = time.time()
+    tick = 0
+    while time.time() - start < seconds:
+        now = time.time()
+        for i, agent in enumerate(senders):
+            download = rng.lognormal(12 + i % 7, 1.0)
+            agent.on_sample((now, download, download / 4, rng.uniform(0, 100), rng.uniform(20, 80)))
+        tick += 1
+        time.sleep(max(0.0, start + tick / rate - time.time()))
+    time.sleep(0.2)
+    elapsed = time.time() - start
+
+    stats = aggregator.get_stats()
+    sent = sum(agent.sent for agent in senders)
+    print(f"{agents} agents at {rate:g} Hz for {elapsed:.1f} s: {stats['packets']}/{sent} packets received")
+    print(f"Aggregator busy {stats['busy_seconds'] / elapsed * 100:.2f}% of one core "
+          f"({stats['busy_seconds'] / max(stats['packets'], 1) * 1e6:.1f} us per packet); "
+          f"whole process {(time.process_time() - cpu_start) / elapsed * 100:.1f}% incl. senders")
+    print("Top 3 by download:", [(host, round(value)) for value, host in aggregator.top_hosts("download", 3)])
+    host = senders[0].host
+    print(f"p99 download of {host} over 60 s: {aggregator.percentile(host, 'download', 99, 60):.0f} bps")
+    for agent in senders:
+        agent.close()
+    aggregator.stop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BitMeter fleet aggregator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="receive samples from agents")
+    serve.add_argument("--address", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port agents push to")
+    serve.add_argument("--http-address", default="127.0.0.1")
+    serve.add_argument("--http-port", type=int, default=9103, help="JSON query port, 0 disables it")
+    serve.add_argument("--capacity", type=int, default=600, help="raw samples kept per host")
+    loopback = sub.add_parser("loopback", help="simulate a fleet over loopback")
+    loopback.add_argument("--agents", type=int, default=300)
+    loopback.add_argument("--seconds", type=float, default=10.0)
+    loopback.add_argument("--rate", type=float, default=1.0, help="samples per second per agent")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "loopback":
+        return run_loopback(args.agents, args.seconds, args.rate)
+
+    aggregator = FleetAggregator(args.address, args.port, args.capacity).start()
+    if args.http_port > 0:
+        aggregator.serve_http(args.http_address, args.http_port)
+    try:
+        while True:
+            time.sleep(60)
+            logging.info(f"Fleet stats: {aggregator.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""On-disk sample history.
+
+Samples are appended to fixed-width binary segment files, one directory per
+host, rotated on a fixed period and pruned after a retention period. The
+reader memory-maps segments so a long range can be queried without reading
+whole files into memory.
+"""
+import os
+import sys
+import mmap
+import time
+import queue
+import socket
+import calendar
+import struct
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+
+SEGMENT_MAGIC = b"BMHS"
+SEGMENT_VERSION = 2
+SEGMENT_SUFFIX = ".bmh"
+# magic, version, record size, segment start time
+HEADER = struct.Struct("<4sHHd")
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("download", "<f8"),
+    ("upload", "<f8"),
+    ("cpu", "<f4"),
+    ("ram", "<f4"),
+    ("flags", "u1")
+])
+RECORD = struct.Struct("<dddffB")
+
+# Version 1 segments have no flags byte; they are still read, and appended to until they rotate
+RECORD_DTYPE_V1 = np.dtype(RECORD_DTYPE.descr[:-1])
+RECORD_V1 = struct.Struct("<dddff")
+RECORDS = {1: (RECORD_V1, RECORD_DTYPE_V1), 2: (RECORD, RECORD_DTYPE)}
+
+
+def segment_name(start):
+    return time.strftime("%Y%m%d-%H%M%S", time.gmtime(start)) + SEGMENT_SUFFIX
+
+def segment_start(path):
+    """Start time encoded in a segment file name (ignoring a -N rotation suffix)"""
+    stem = os.path.basename(path)[:len("YYYYmmdd-HHMMSS")]
+    return calendar.timegm(time.strptime(stem, "%Y%m%d-%H%M%S"))
+
+def segment_key(path):
+    """(start time, rotation suffix) so a -N segment sorts after its base segment"""
+    stem = os.path.basename(path)[:-len(SEGMENT_SUFFIX)]
+    suffix = stem[len("YYYYmmdd-HHMMSS") + 1:]
+    return segment_start(path), int(suffix) if suffix else 0
+
+def segment_version(path):
+    """Record layout version of an existing segment, or None when it is not one we can read"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    magic, version, record_size, _ = HEADER.unpack(header)
+    if magic != SEGMENT_MAGIC or version not in RECORDS or record_size != RECORDS[version][0].size:
+        return None
+    return version
+
+def list_segments(directory):
+    """Returns segment paths in a directory, oldest first"""
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            segments.append((segment_key(path), path))
+        except ValueError:
+            logging.warning(f"Ignoring {path}: not a history segment name")
+    return [path for _, path in sorted(segments)]
+
+
+class HistoryWriter:
+    """Appends monitor samples to rotating segment files.
+
+    on_sample() only queues the values; a writer thread rotates, prunes and
+    writes the segments, batching records for flush_interval seconds, so the
+    sampler never waits on the disk. When the queue is full the record is
+    dropped and counted.
+    """
+
+    def __init__(self, directory, host=None, segment_seconds=3600, retention_days=7.0,
+                 flush_interval=5.0, queue_size=1000):
+        self.host = host or socket.gethostname()
+        self.directory = os.path.join(directory, self.host)
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_days * 86400
+        self.flush_interval = flush_interval
+
+        self.file = None
+        self.version = SEGMENT_VERSION
+        self.segment_end = 0.0
+        self.buffer = bytearray()
+        self.last_flush = time.monotonic()
+        self.records_written = 0
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="bitmeter-history", daemon=True)
+        self.thread.start()
+
+    def _open_segment(self, timestamp):
+        self._close_segment()
+        start = timestamp - (timestamp % self.segment_seconds)
+        name = segment_name(start)
+        path = os.path.join(self.directory, name)
+        suffix = 0
+        while True:
+            exists = os.path.exists(path) and os.path.getsize(path) > 0
+            self.version = segment_version(path) if exists else SEGMENT_VERSION
+            if self.version is not None:
+                break
+            # Not a segment this writer can append to: leave it alone
+            suffix += 1
+            path = os.path.join(self.directory, f"{name[:-len(SEGMENT_SUFFIX)]}-{suffix}{SEGMENT_SUFFIX}")
+        record = RECORDS[self.version][0]
+        self.file = open(path, "ab")
+        if exists:
+            # Drop a torn record left behind by a crash
+            size = os.path.getsize(path)
+            whole = HEADER.size + (size - HEADER.size) // record.size * record.size
+            if whole != size:
+                self.file.truncate(whole)
+        else:
+            self.file.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, RECORD.size, start))
+        self.segment_end = start + self.segment_seconds
+        self.prune(timestamp)
+
+    def _close_segment(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def on_sample(self, row):
+        """Sink callback: row is a SampleStore row (timestamp, dl, ul, cpu, ram, flags, ...)"""
+        try:
+            self.queue.put_nowait((row[0], row[1], row[2], row[3], row[4], int(row[5])))
+        except queue.Full:
+            self.dropped += 1
+
+    def _append(self, record):
+        timestamp = record[0]
+        if self.file is None or timestamp >= self.segment_end:
+            self._open_segment(timestamp)
+        if self.version == SEGMENT_VERSION:
+            self.buffer += RECORD.pack(*record)
+        else:
+            self.buffer += RECORD_V1.pack(*record[:5])
+        self.records_written += 1
+
+    def _run(self):
+        while True:
+            stopping = self.stop_event.is_set()
+            timeout = 0 if stopping else max(self.last_flush + self.flush_interval - time.monotonic(), 0.01)
+            try:
+                # None is the wake-up close() sends
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            try:
+                while record is not None:
+                    self._append(record)
+                    record = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            except (OSError, ValueError) as e:
+                logging.error(f"Error writing history segment: {e}")
+                self._close_segment()
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+            # One more pass after the stop request picks up the last queued records
+            if stopping:
+                break
+        self._close_segment()
+
+    def flush(self):
+        if self.file is not None and self.buffer:
+            try:
+                self.file.write(self.buffer)
+                self.file.flush()
+            except OSError as e:
+                logging.error(f"Error writing history segment: {e}")
+            self.buffer.clear()
+        self.last_flush = time.monotonic()
+
+    def prune(self, now=None):
+        """Delete segments that ended before the retention window"""
+        if self.retention_seconds <= 0:
+            return
+        cutoff = (now or time.time()) - self.retention_seconds
+        for path in list_segments(self.directory):
+            try:
+                if segment_start(path) + self.segment_seconds < cutoff:
+                    os.remove(path)
+                    logging.info(f"Removed expired history segment {path}")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not prune history segment {path}: {e}")
+
+    def get_stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "records_written": self.records_written
+        }
+
+    def close(self):
+        self.stop_event.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join(self.flush_interval + 5.0)
+
+
+class HistoryReader:
+    """Range queries over the segments of one host, backed by mmap"""
+
+    def __init__(self, directory, host=None):
+        self.host = host or socket.gethostname()
+        self.directory = os.path.join(directory, self.host)
+        self._maps = {}
+
+    def _records(self, path):
+        """Structured array view over a segment file"""
+        cached = self._maps.get(path)
+        size = os.path.getsize(path)
+        if cached is not None and cached[0] == size:
+            return cached[2]
+        if cached is not None:
+            # The segment grew; remap it. Old views keep the old map alive.
+            del self._maps[path]
+
+        if size <= HEADER.size:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, _ = HEADER.unpack_from(mm, 0)
+        record, dtype = RECORDS.get(version, (None, None))
+        if magic != SEGMENT_MAGIC or record is None or record_size != record.size:
+            mm.close()
+            raise ValueError(f"{path} is not a version 1 or {SEGMENT_VERSION} history segment")
+        count = (size - HEADER.size) // record.size
+        records = np.frombuffer(mm, dtype=dtype, count=count, offset=HEADER.size)
+        if dtype is not RECORD_DTYPE:
+            # Old layout: copy into the current one with the flags left at zero
+            converted = np.zeros(count, dtype=RECORD_DTYPE)
+            for name in dtype.names:
+                converted[name] = records[name]
+            records = converted
+        self._maps[path] = (size, mm, records)
+        return records
+
+    def iter_range(self, start=None, end=None):
+        """Yields zero-copy record views covering start <= timestamp < end"""
+        segments = list_segments(self.directory)
+        for i, path in enumerate(segments):
+            seg_start = segment_start(path)
+            next_start = segment_start(segments[i + 1]) if i + 1 < len(segments) else None
+            if end is not None and seg_start >= end:
+                break
+            # A -N segment shares its base segment's start, so only a later one can cover `start`
+            if start is not None and next_start is not None and seg_start < next_start <= start:
+                continue
+
+            try:
+                records = self._records(path)
+            except ValueError as e:
+                logging.warning(f"Skipping history segment: {e}")
+                continue
+            times = records["timestamp"]
+            lo = 0 if start is None else np.searchsorted(times, start, side="left")
+            hi = len(records) if end is None else np.searchsorted(times, end, side="left")
+            if hi > lo:
+                yield records[lo:hi]
+
+    def query(self, start=None, end=None):
+        """Returns the records in range as one array (only the range is copied)"""
+        parts = list(self.iter_range(start, end))
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def close(self):
+        for _, mm, _ in self._maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                # A caller still holds a view; the map goes away with it
+                pass
+        self._maps.clear()
+
+
+def create_history_writer(config):
+    """Builds a HistoryWriter from config.ini, or None when disabled"""
+    if not config.getboolean("Settings", "history_enabled", fallback=True):
+        return None
+    try:
+        return HistoryWriter(
+            config.get("Settings", "history_dir", fallback="history"),
+            segment_seconds=config.getfloat("Settings", "history_segment_minutes", fallback=60.0) * 60,
+            retention_days=config.getfloat("Settings", "history_retention_days", fallback=7.0)
+        )
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not start history writer: {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print BitMeter history as CSV")
+    parser.add_argument("--dir", default="history")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--hours", type=float, default=1.0, help="how far back to read")
+    args = parser.parse_args(argv)
+
+    reader = HistoryReader(args.dir, args.host)
+    print("timestamp,download_bps,upload_bps,cpu_percent,ram_percent,anomaly_flags")
+    for records in reader.iter_range(time.time() - args.hours * 3600):
+        for r in records:
+            print(f"{r['timestamp']:.3f},{r['download']:.0f},{r['upload']:.0f},{r['cpu']:.1f},{r['ram']:.1f},"
+                  f"{r['flags']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,471 @@
+"""Remote overlay: stream one host's samples to another host's BitMeter.
+
+An agent (RemoteAgentServer, a sample sink) accepts TCP clients. Rows are
+numbered by their store sequence (SampleStore.since), not by timestamp, so a
+wall-clock step on the agent can't drop or repeat rows. A client says which
+sequence it needs next from which agent run; the agent answers with every
+stored row from there on (backfill, or all of them when the agent has
+restarted since), then keeps sending new rows as they arrive. Each
+client thread sends whatever accumulated since its last send as one batch,
+so a slow link gets fewer, larger frames instead of an unbounded queue.
+
+Rows are quantized (ms timestamps, whole bps, 0.1 % CPU/RAM) and each value
+is sent as a zigzag varint delta against the previous row of the same
+connection, typically 10-20 bytes per row. System stats that change rarely
+(RAM bytes, top processes and talkers) are sent as JSON only when changed.
+
+RemoteMonitor is the client side. It provides the parts of
+EnhancedNetworkMonitor that NetworkSpeedApp uses, reconnects with backoff
+and asks for the rows after its newest one, so the graph has no gaps.
+
+ROWS payloads start with the sequence of their first row as a varint.
+
+Frame layout: FRAME (kind, payload length), then the payload.
+"""
+import os
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+
+import numpy as np
+
+from bitmeter_store import SampleStore
+from bitmeter_rollup import RollupSet
+from bitmeter_fleet import parse_address
+from bitmeter_selfstats import process_stats
+
+
+FRAME = struct.Struct("<BI")
+KIND_HELLO = 0
+KIND_INFO = 1
+KIND_ROWS = 2
+KIND_STATS = 3
+KIND_PING = 4
+
+PROTOCOL_VERSION = 3
+DEFAULT_PORT = 9104
+# Multipliers applied before rounding: timestamp, download, upload, cpu, ram, flags, then cores
+BASE_SCALES = (1000, 1, 1, 10, 10, 1)
+CORE_SCALE = 10
+MAX_ROWS_PER_FRAME = 2000
+PING_INTERVAL = 5.0
+READ_TIMEOUT = 3 * PING_INTERVAL
+
+
+def _scales(width):
+    return np.array(BASE_SCALES + (CORE_SCALE,) * (width - len(BASE_SCALES)), dtype=np.float64)
+
+def _put_varint(out, value):
+    # Zigzag so small negative deltas stay small
+    value = value << 1 if value >= 0 else ((-value) << 1) - 1
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+def encode_rows(rows, previous):
+    """Delta-encodes rows (n, width) against `previous` (quantized ints, updated in place)"""
+    out = bytearray()
+    width = rows.shape[1]
+    _put_varint(out, len(rows))
+    _put_varint(out, width)
+    quantized = np.rint(rows * _scales(width)).astype(np.int64).tolist()
+    for row in quantized:
+        for i, value in enumerate(row):
+            _put_varint(out, value - previous[i])
+            previous[i] = value
+    return bytes(out)
+
+def decode_rows(data, previous):
+    """Inverse of encode_rows; returns an (n, width) float array"""
+    count, pos = _get_varint(data, 0)
+    width, pos = _get_varint(data, pos)
+    if len(previous) != width:
+        previous[:] = [0] * width
+    values = np.empty((count, width), dtype=np.int64)
+    for r in range(count):
+        for i in range(width):
+            delta, pos = _get_varint(data, pos)
+            previous[i] += delta
+            values[r, i] = previous[i]
+    return values / _scales(width)
+
+def encode_row_frame(first, rows, previous):
+    out = bytearray()
+    _put_varint(out, first)
+    return bytes(out) + encode_rows(rows, previous)
+
+def decode_row_frame(data, previous):
+    """Returns (sequence of the first row, rows)"""
+    first, pos = _get_varint(data, 0)
+    return first, decode_rows(data[pos:], previous)
+
+def send_frame(sock, kind, payload=b""):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("connection closed")
+        received += count
+    return bytes(buffer)
+
+def recv_frame(sock):
+    kind, length = FRAME.unpack(_recv_exact(sock, FRAME.size))
+    return kind, _recv_exact(sock, length) if length else b""
+
+
+class RemoteAgentServer:
+    """Serves the monitor's stored rows to remote overlays"""
+
+    def __init__(self, monitor, address="127.0.0.1", port=DEFAULT_PORT):
+        self.monitor = monitor
+        self.address = address
+        self.port = port
+        self.host = socket.gethostname()
+        # Sequences restart with the agent; clients resuming another run start over
+        self.agent_id = os.urandom(8).hex()
+        self.changed = threading.Condition()
+        self.running = False
+        self.sock = None
+        self.clients = 0
+        self.bytes_sent = 0
+
+    def start(self):
+        family = socket.AF_INET6 if ":" in self.address else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.address, self.port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept, name="bitmeter-agent", daemon=True).start()
+        logging.info(f"Remote agent listening on {self.address}:{self.port}")
+        return self
+
+    def on_sample(self, row):
+        with self.changed:
+            self.changed.notify_all()
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, peer = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn, peer), name="bitmeter-agent-client",
+                             daemon=True).start()
+
+    def _stats_payload(self):
+        stats = self.monitor.get_system_stats()
+        return json.dumps({
+            "ram_used": stats["ram_used"],
+            "ram_total": stats["ram_total"],
+            "top_processes": stats["top_processes"],
+            "top_talkers": stats["top_talkers"],
+            "talkers_available": self.monitor.talkers_available(),
+            "method": self.monitor.get_monitoring_method()
+        }).encode()
+
+    def _serve(self, conn, peer):
+        store = self.monitor.store
+        self.clients += 1
+        logging.info(f"Remote overlay connected from {peer[0]}")
+        try:
+            conn.settimeout(READ_TIMEOUT)
+            kind, payload = recv_frame(conn)
+            if kind != KIND_HELLO:
+                return
+            hello = json.loads(payload)
+            next_seq = int(hello.get("next", 0)) if hello.get("agent") == self.agent_id else 0
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            send_frame(conn, KIND_INFO, json.dumps({
+                "version": PROTOCOL_VERSION, "host": self.host, "agent": self.agent_id,
+                "cores": store.cores, "capacity": store.capacity}).encode())
+
+            previous = [0] * store.width
+            last_stats = None
+            last_frame = time.monotonic()
+            generation = -1
+            while self.running:
+                with self.changed:
+                    if store.generation == generation:
+                        self.changed.wait(PING_INTERVAL)
+                generation = store.generation
+                # Everything the client doesn't have yet, copied before the writer wraps
+                first, new = store.since(next_seq)
+                new = new.copy()
+                for start in range(0, len(new), MAX_ROWS_PER_FRAME):
+                    chunk = new[start:start + MAX_ROWS_PER_FRAME]
+                    payload = encode_row_frame(first + start, chunk, previous)
+                    send_frame(conn, KIND_ROWS, payload)
+                    self.bytes_sent += FRAME.size + len(payload)
+                    next_seq = first + start + len(chunk)
+                    last_frame = time.monotonic()
+
+                stats = self._stats_payload()
+                if stats != last_stats:
+                    send_frame(conn, KIND_STATS, stats)
+                    self.bytes_sent += FRAME.size + len(stats)
+                    last_stats = stats
+                    last_frame = time.monotonic()
+                elif time.monotonic() - last_frame >= PING_INTERVAL:
+                    send_frame(conn, KIND_PING)
+                    last_frame = time.monotonic()
+        except (OSError, ValueError, ConnectionError) as e:
+            logging.info(f"Remote overlay {peer[0]} disconnected: {e}")
+        finally:
+            self.clients -= 1
+            conn.close()
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        with self.changed:
+            self.changed.notify_all()
+
+    def close(self):
+        self.stop()
+
+
+class RemoteMonitor:
+    """Stand-in for EnhancedNetworkMonitor fed by a RemoteAgentServer"""
+
+    def __init__(self, address, config=None, history_length=7200):
+        self.address = address
+        if config is not None:
+            history_length = config.getint("Settings", "history_length", fallback=history_length)
+        self.history_length = max(history_length, 2)
+        self.lock = threading.Lock()
+        self.system_stats_lock = self.lock
+
+        self.core_count = 0
+        self.store = SampleStore(self.history_length, 0)
+        self.rollups = RollupSet()
+        self.sinks = [self.rollups]
+        self.selected_interface = None
+        self.burst = None
+
+        self.download_speed = 0.0
+        self.upload_speed = 0.0
+        self.cpu_usage = 0.0
+        self.cpu_per_core = []
+        self.ram_usage = 0.0
+        self.stats = {"ram_used": 0, "ram_total": 0, "top_processes": [], "top_talkers": [],
+                      "talkers_available": False, "method": ""}
+
+        self.remote_host = f"{address[0]}:{address[1]}"
+        # Agent run and sequence of the next row we need from it
+        self.agent_id = None
+        self.next_seq = 0
+        self.connected = False
+        self.connects = 0
+        self.bytes_received = 0
+        self.rows_received = 0
+        self.last_error = None
+
+        self.running = False
+        self.stop_event = threading.Event()
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="bitmeter-remote", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                self._session()
+                backoff = 1.0
+            except (OSError, ValueError, ConnectionError, struct.error) as e:
+                if self.stop_event.is_set():
+                    break
+                if self.connected or self.last_error != str(e):
+                    logging.warning(f"Remote agent {self.remote_host}: {e}")
+                self.last_error = str(e)
+            self.connected = False
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            # Reconnect with backoff; the next HELLO backfills what was missed
+            if self.stop_event.wait(backoff):
+                break
+            backoff = min(backoff * 2, 30.0)
+
+    def _session(self):
+        self.sock = sock = socket.create_connection(self.address, timeout=5.0)
+        sock.settimeout(READ_TIMEOUT)
+        send_frame(sock, KIND_HELLO, json.dumps({"version": PROTOCOL_VERSION, "agent": self.agent_id,
+                                                 "next": self.next_seq}).encode())
+        previous = []
+        while not self.stop_event.is_set():
+            kind, payload = recv_frame(sock)
+            self.bytes_received += FRAME.size + len(payload)
+            if kind == KIND_ROWS:
+                self._apply_rows(*decode_row_frame(payload, previous))
+            elif kind == KIND_STATS:
+                stats = json.loads(payload)
+                with self.lock:
+                    self.stats = stats
+            elif kind == KIND_INFO:
+                self._apply_info(json.loads(payload))
+
+    def _apply_info(self, info):
+        if info.get("version") != PROTOCOL_VERSION:
+            raise ValueError(f"agent speaks protocol {info.get('version')}, expected {PROTOCOL_VERSION}")
+        self.remote_host = info.get("host", self.remote_host)
+        if info.get("agent") != self.agent_id:
+            # A new agent run numbers its rows from 0 again and resends them all
+            self.agent_id = info.get("agent")
+            self.next_seq = 0
+        cores = int(info.get("cores", 0))
+        if cores != self.store.cores:
+            # Different layout (or first connection): start a fresh history
+            self.store = SampleStore(self.history_length, cores)
+            self.core_count = cores
+        self.connected = True
+        self.connects += 1
+        if self.connects > 1:
+            logging.info(f"Reconnected to remote agent {self.remote_host}")
+
+    def _apply_rows(self, first, rows):
+        store = self.store
+        for seq, row in enumerate(rows, first):
+            # Rows resent after a reconnect are already stored
+            if seq < self.next_seq or len(row) != store.width:
+                continue
+            store.append_row(row)
+            self.next_seq = seq + 1
+            self.rows_received += 1
+            stored = store.last()
+            for sink in self.sinks:
+                try:
+                    sink.on_sample(stored)
+                except Exception as e:
+                    logging.error(f"Error in sample sink {type(sink).__name__}: {e}")
+        if store.generation:
+            row = store.last()
+            with self.lock:
+                self.download_speed, self.upload_speed = row[1], row[2]
+                self.cpu_usage, self.ram_usage = row[3], row[4]
+                self.cpu_per_core = row[len(BASE_SCALES):].tolist()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def get_speeds(self):
+        with self.lock:
+            return self.download_speed, self.upload_speed
+
+    def get_system_stats(self):
+        with self.lock:
+            return {
+                "cpu_percent": self.cpu_usage,
+                "cpu_per_core": self.cpu_per_core,
+                "ram_percent": self.ram_usage,
+                "ram_used": self.stats["ram_used"],
+                "ram_total": self.stats["ram_total"],
+                "top_processes": self.stats["top_processes"],
+                "top_talkers": self.stats["top_talkers"]
+            }
+
+    def talkers_available(self):
+        return self.stats.get("talkers_available", False)
+
+    def get_monitoring_method(self):
+        if not self.connected:
+            return f"{self.remote_host} (reconnecting)"
+        return f"{self.remote_host}: {self.stats.get('method') or 'connected'}"
+
+    def get_remote_stats(self):
+        return {
+            "agent": self.remote_host,
+            "connected": self.connected,
+            "connects": self.connects,
+            "rows_received": self.rows_received,
+            "bytes_received": self.bytes_received,
+            "bytes_per_row": self.bytes_received / self.rows_received if self.rows_received else 0.0,
+            "last_error": self.last_error
+        }
+
+    def get_self_stats(self, frame_timer=None):
+        stats = {"timestamp": time.time(), "process": process_stats(), "remote": self.get_remote_stats()}
+        if frame_timer is not None:
+            stats["frames"] = frame_timer.get_frame_stats()
+            stats["frames"]["histogram"] = frame_timer.histogram.snapshot()
+        return stats
+
+    # Interface selection and bursts only exist on the agent itself
+    def set_interface(self, interface_name=None):
+        pass
+
+    def get_interface_store(self, interface_name):
+        return None
+
+    def get_available_interfaces(self):
+        return []
+
+    def start_burst(self, duration=None, interval=None, on_done=None):
+        raise RuntimeError("Burst capture is not available for a remote host")
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(2.0)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logging.error(f"Error closing sample sink {type(sink).__name__}: {e}")
+
+
+def create_agent_server(monitor, config, port=None):
+    """Starts a RemoteAgentServer if agent_port is set, returns it or None"""
+    if port is None:
+        port = config.getint("Settings", "agent_port", fallback=0)
+    if port <= 0:
+        return None
+    server = RemoteAgentServer(monitor, config.get("Settings", "agent_address", fallback="127.0.0.1"), port)
+    try:
+        server.start()
+    except OSError as e:
+        logging.error(f"Could not start remote agent on port {port}: {e}")
+        return None
+    monitor.add_sink(server)
+    return server
+
+
+def create_remote_monitor(target, config):
+    """RemoteMonitor for a host[:port] target"""
+    return RemoteMonitor(parse_address(target, DEFAULT_PORT), config)
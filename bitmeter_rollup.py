@@ -0,0 +1,136 @@
+"""Multi-resolution rollups of the sampled metrics.
+
+Raw samples feed a 1 s tier; every closed bucket feeds the next, coarser
+tier, so each sample is touched once and nothing is ever rescanned. Every
+tier keeps min/avg/max/p95 per metric in its own SampleStore ring.
+"""
+import math
+
+from bitmeter_store import SampleStore
+
+
+METRICS = ("download", "upload", "cpu", "ram")
+STATS = ("min", "avg", "max", "p95")
+
+# (bucket seconds, buckets kept)
+DEFAULT_TIERS = (
+    (1, 3600),      # 1 hour
+    (10, 2160),     # 6 hours
+    (60, 2880),     # 2 days
+    (3600, 720)     # 30 days
+)
+
+# Bound on the values a bucket keeps for its p95; coarser tiers only see
+# one value per child bucket, so this is never reached at 1 s resolution.
+P95_INPUTS = 256
+
+
+def tier_columns():
+    return ("timestamp",) + tuple(f"{m}_{s}" for m in METRICS for s in STATS)
+
+def percentile_95(values):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class _Bucket:
+    __slots__ = ("start", "count", "mins", "maxs", "sums", "p95_inputs")
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.mins = [math.inf] * len(METRICS)
+        self.maxs = [-math.inf] * len(METRICS)
+        self.sums = [0.0] * len(METRICS)
+        self.p95_inputs = [[] for _ in METRICS]
+
+    def add(self, mins, maxs, sums, count, p95s):
+        self.count += count
+        for i in range(len(METRICS)):
+            if mins[i] < self.mins[i]:
+                self.mins[i] = mins[i]
+            if maxs[i] > self.maxs[i]:
+                self.maxs[i] = maxs[i]
+            self.sums[i] += sums[i]
+            inputs = self.p95_inputs[i]
+            if len(inputs) < P95_INPUTS:
+                inputs.append(p95s[i])
+
+    def row(self):
+        values = [self.start]
+        for i in range(len(METRICS)):
+            values += (self.mins[i], self.sums[i] / self.count, self.maxs[i],
+                       percentile_95(self.p95_inputs[i]))
+        return values
+
+
+class RollupTier:
+    """One resolution: an open bucket plus a ring of closed buckets"""
+
+    def __init__(self, seconds, capacity, parent=None):
+        self.seconds = seconds
+        self.parent = parent
+        self.store = SampleStore(capacity, columns=tier_columns())
+        self.bucket = None
+
+    def add(self, timestamp, mins, maxs, sums, count, p95s):
+        start = timestamp - (timestamp % self.seconds)
+        if self.bucket is not None and start != self.bucket.start:
+            self.close_bucket()
+        if self.bucket is None:
+            self.bucket = _Bucket(start)
+        self.bucket.add(mins, maxs, sums, count, p95s)
+
+    def close_bucket(self):
+        bucket = self.bucket
+        self.bucket = None
+        if bucket is None or bucket.count == 0:
+            return
+        row = bucket.row()
+        self.store.append_row(row)
+        if self.parent is not None:
+            # The parent sees this bucket as a single pre-aggregated input;
+            # its p95 is therefore the p95 of child p95s.
+            p95s = [row[1 + i * len(STATS) + 3] for i in range(len(METRICS))]
+            self.parent.add(bucket.start, bucket.mins, bucket.maxs, bucket.sums,
+                            bucket.count, p95s)
+
+
+class RollupSet:
+    """Sample sink maintaining every tier incrementally"""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = {}
+        parent = None
+        for seconds, capacity in sorted(tiers, reverse=True):
+            parent = RollupTier(seconds, capacity, parent)
+            self.tiers[seconds] = parent
+        self.first = parent
+
+    def on_sample(self, row):
+        values = (row[1], row[2], row[3], row[4])
+        self.first.add(row[0], values, values, values, 1, values)
+
+    def close(self):
+        pass
+
+    def tier(self, seconds):
+        return self.tiers[seconds]
+
+    def resolutions(self):
+        return sorted(self.tiers)
+
+    def tier_for_window(self, window_seconds, points):
+        """Finest tier that covers window_seconds in at most `points` buckets"""
+        for seconds in self.resolutions():
+            if seconds * points >= window_seconds:
+                return seconds
+        return self.resolutions()[-1]
+
+    def series(self, seconds, metric, stat="avg", n=None):
+        """Zero-copy view of one metric/stat column of a tier, oldest first"""
+        store = self.tiers[seconds].store
+        return store.column(f"{metric}_{stat}", n)
+
+    def timestamps(self, seconds, n=None):
+        return self.tiers[seconds].store.column("timestamp", n)
@@ -0,0 +1,123 @@
+"""Measurements of BitMeter's own overhead.
+
+Collectors, frames and lock waits are recorded into fixed-bucket latency
+histograms (one bisect and three additions per observation), and process
+CPU time, RSS and thread count are read from psutil on demand. Everything
+is exposed as one plain dict by collect_self_stats().
+"""
+import os
+import time
+import bisect
+import threading
+
+import psutil
+
+
+# Upper bucket bounds in milliseconds; the last bucket is open ended
+BUCKET_BOUNDS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                    25.0, 50.0, 100.0, 250.0, 500.0, 1000.0)
+
+
+class LatencyHistogram:
+    def __init__(self, bounds_ms=BUCKET_BOUNDS_MS):
+        self.bounds = [b / 1000.0 for b in bounds_ms]
+        self.bounds_ms = bounds_ms
+        self.counts = [0] * (len(bounds_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound in ms of the bucket holding the q-quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds_ms[i] if i < len(self.bounds_ms) else self.max * 1000.0
+        return self.max * 1000.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000.0,
+            "mean_ms": self.total / self.count * 1000.0 if self.count else 0.0,
+            "max_ms": self.max * 1000.0,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {(f"le_{b:g}ms" if i < len(self.bounds_ms) else "inf"): c
+                        for i, (b, c) in enumerate(zip(self.bounds_ms + (None,), self.counts))}
+        }
+
+
+class InstrumentedLock:
+    """Wraps a Lock or RLock and records how long callers waited to acquire it"""
+
+    def __init__(self, lock=None):
+        self.lock = lock if lock is not None else threading.Lock()
+        self.wait = LatencyHistogram()
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            self.wait.record(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def process_stats(process=None):
+    """CPU time, RSS and thread count of this process"""
+    process = process or psutil.Process(os.getpid())
+    with process.oneshot():
+        cpu = process.cpu_times()
+        return {
+            "cpu_user_seconds": cpu.user,
+            "cpu_system_seconds": cpu.system,
+            "rss_bytes": process.memory_info().rss,
+            "threads": process.num_threads(),
+            "uptime_seconds": time.time() - process.create_time()
+        }
+
+
+def collect_self_stats(monitor, frame_timer=None):
+    """Everything known about BitMeter's own overhead, as a JSON-ready dict"""
+    stats = {
+        "timestamp": time.time(),
+        "process": process_stats(),
+        "scheduler": monitor.scheduler.get_stats(),
+        "collectors": {name: hist.snapshot() for name, hist in monitor.scheduler.latency.items()},
+        "locks": {
+            "lock": monitor.lock.wait.snapshot(),
+            "system_stats_lock": monitor.system_stats_lock.wait.snapshot()
+        },
+        "process_scan": monitor.get_process_scan_stats(),
+        "counters": monitor.counter_tracker.get_stats()
+    }
+    if monitor.worker is not None:
+        stats["worker"] = {
+            "collectors": sorted(monitor.worker.running_collectors or ()),
+            "records": monitor.worker.records
+        }
+    if frame_timer is not None:
+        stats["frames"] = frame_timer.get_frame_stats()
+        stats["frames"]["histogram"] = frame_timer.histogram.snapshot()
+    return stats
@@ -0,0 +1,371 @@
+"""Network counter sources for EnhancedNetworkMonitor.
+
+A source has read() returning {interface: (bytes_recv, bytes_sent)} and
+close(). psutil works everywhere; on Linux the procfs and sysfs sources keep
+their files open and re-read them with pread into a reusable buffer, which
+avoids psutil building a namedtuple per interface on every tick.
+
+CounterTracker turns successive reads into per-interface rates. The raw
+procfs/sysfs counters can wrap at 32 or 64 bits and restart from zero when an
+interface is re-created, so it checks every interface on its own.
+
+Run `python bitmeter_sources.py record trace.ndjson` to record the counters of
+this host and `python bitmeter_sources.py replay trace.ndjson` to feed a
+recording back through CounterTracker.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import psutil
+
+from bitmeter_anomaly import MAX_PLAUSIBLE_BPS
+
+
+# Widths of the kernel byte counters, narrowest first
+COUNTER_BITS = (32, 64)
+# Fastest link a wrap is believed on. A 32-bit counter at 10 Gbps wraps every
+# 3.4 s, so anything faster is not counting in 32 bits.
+MAX_WRAP_BPS = 10e9
+
+
+class PsutilCounterSource:
+    name = "psutil"
+    # psutil's nowrap counters keep counting across kernel counter wraps
+    counter_bits = 64
+
+    def __init__(self, interfaces=None):
+        self.interfaces = set(interfaces) if interfaces else None
+
+    def read(self):
+        wanted = self.interfaces
+        return {nic: (stats.bytes_recv, stats.bytes_sent)
+                for nic, stats in psutil.net_io_counters(pernic=True).items()
+                if wanted is None or nic in wanted}
+
+    def close(self):
+        pass
+
+
+class ProcNetDevSource:
+    """Parses /proc/net/dev, reading only rx/tx bytes of the wanted interfaces"""
+
+    name = "procfs"
+
+    def __init__(self, interfaces=None, path="/proc/net/dev"):
+        self.path = path
+        self.interfaces = {nic.encode() for nic in interfaces} if interfaces else None
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(8192)
+
+    def _fill(self):
+        size = 0
+        while True:
+            view = memoryview(self.buffer)[size:]
+            count = os.preadv(self.fd, [view], size)
+            view.release()
+            if count == 0:
+                return size
+            size += count
+            if size == len(self.buffer):
+                # Lots of interfaces: grow once and keep the bigger buffer
+                self.buffer.extend(bytes(len(self.buffer)))
+
+    def read(self):
+        size = self._fill()
+        counters = {}
+        wanted = self.interfaces
+        # One copy out of the buffer; bytes lines so names can be looked up in `wanted`
+        with memoryview(self.buffer) as view:
+            data = bytes(view[:size])
+        # The first two lines are column headers
+        for line in data.split(b"\n")[2:]:
+            name, sep, rest = line.partition(b":")
+            if not sep:
+                continue
+            name = name.strip()
+            if wanted is not None and name not in wanted:
+                continue
+            # rx bytes is field 0 and tx bytes field 8; leave the rest unsplit
+            fields = rest.split(None, 9)
+            counters[name.decode()] = (int(fields[0]), int(fields[8]))
+        return counters
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SysfsCounterSource:
+    """Reads /sys/class/net/<nic>/statistics for an explicit interface list"""
+
+    name = "sysfs"
+
+    def __init__(self, interfaces, root="/sys/class/net"):
+        self.root = root
+        self.interfaces = list(interfaces)
+        self.fds = {}
+
+    def _open(self, nic):
+        base = os.path.join(self.root, nic, "statistics")
+        rx = os.open(os.path.join(base, "rx_bytes"), os.O_RDONLY)
+        try:
+            tx = os.open(os.path.join(base, "tx_bytes"), os.O_RDONLY)
+        except OSError:
+            os.close(rx)
+            raise
+        self.fds[nic] = (rx, tx)
+        return rx, tx
+
+    def read(self):
+        counters = {}
+        for nic in self.interfaces:
+            try:
+                fds = self.fds.get(nic) or self._open(nic)
+                counters[nic] = (int(os.pread(fds[0], 32, 0)), int(os.pread(fds[1], 32, 0)))
+            except (OSError, ValueError):
+                # Interface went away; try to reopen it on the next tick
+                self._close_nic(nic)
+        return counters
+
+    def _close_nic(self, nic):
+        fds = self.fds.pop(nic, None)
+        if fds:
+            for fd in fds:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def close(self):
+        for nic in list(self.fds):
+            self._close_nic(nic)
+
+
+class TraceCounterSource:
+    """Replays a recorded trace; read() returns the next recorded reading.
+
+    A trace is NDJSON with one {"t": seconds, "counters": {nic: [recv, sent]}}
+    line per read, as written by `record`; `trace` is its path or the list of
+    decoded lines. An optional {"expect": {...}} line holds the totals and
+    wrap/reset counts a replay should produce. `clock` is the recorded time of
+    the last reading, for callers that replay at recorded rather than real speed.
+    """
+
+    name = "trace"
+
+    def __init__(self, trace):
+        if isinstance(trace, str):
+            with open(trace, encoding="utf-8") as f:
+                trace = [json.loads(line) for line in f if line.strip()]
+        self.readings = [line for line in trace if "t" in line]
+        self.expect = next((line["expect"] for line in trace if "expect" in line), None)
+        if not self.readings:
+            raise ValueError("counter trace holds no readings")
+        self.position = 0
+        self.clock = self.readings[0]["t"]
+
+    def done(self):
+        return self.position >= len(self.readings)
+
+    def read(self):
+        reading = self.readings[min(self.position, len(self.readings) - 1)]
+        self.position += 1
+        self.clock = reading["t"]
+        return {nic: tuple(values) for nic, values in reading["counters"].items()}
+
+    def close(self):
+        pass
+
+
+def counter_delta(previous, current, widths=COUNTER_BITS, limit=None):
+    """Bytes counted between two readings of one counter, or None after a reset.
+
+    A counter that went backwards has wrapped if the old value fits in one of
+    `widths` bits and the distance across the wrap is at most `limit` bytes
+    (and under half the counter range). Anything else, e.g. 5 GB dropping to
+    2 MB, or 3 GB dropping to 1 KB faster than a link could count, is a reset.
+    """
+    if current >= previous:
+        return current - previous
+    for bits in widths:
+        if previous < 1 << bits:
+            delta = (current - previous) % (1 << bits)
+            if delta < 1 << (bits - 1) and (limit is None or delta <= limit):
+                return delta
+    return None
+
+
+class CounterTracker:
+    """Per-interface rates from successive counter reads.
+
+    Every interface keeps its own last reading and read time, so one that
+    skipped a few reads gets its rate over its own gap, and a reset or an
+    implausible jump on one interface only zeroes that interface. Interfaces
+    unseen for `expire` seconds are forgotten and start from a new baseline
+    when they come back. Times must come from a monotonic clock.
+
+    A backwards step is only taken for a wrap if it implies no more than
+    `wrap_bps`. 32-bit wraps are ruled out when the source has 64-bit
+    counters (`counter_bits`) and for an interface once one of its counters
+    went past 2**32.
+    """
+
+    def __init__(self, expire=30.0, max_bps=MAX_PLAUSIBLE_BPS, wrap_bps=MAX_WRAP_BPS, counter_bits=None):
+        self.expire = expire
+        self.max_bps = max_bps
+        self.wrap_bps = wrap_bps
+        self.counter_bits = counter_bits
+        # nic -> (bytes_recv, bytes_sent, read time)
+        self.state = {}
+        # Interfaces known to count in 64 bits
+        self.wide = set()
+        self.wraps = 0
+        self.resets = 0
+
+    def update(self, counters, now):
+        """Returns {nic: (download_bps, upload_bps)}; new and reset interfaces read 0"""
+        rates = {}
+        state = self.state
+        for nic, (received, sent) in counters.items():
+            previous = state.get(nic)
+            if previous is not None and now <= previous[2]:
+                continue
+            state[nic] = (received, sent, now)
+            if nic not in self.wide and (received >= 1 << 32 or sent >= 1 << 32):
+                self.wide.add(nic)
+            if previous is None:
+                # New or returning interface: this read only sets its baseline
+                rates[nic] = (0.0, 0.0)
+                continue
+            
+            elapsed = now - previous[2]
+            widths = (64,) if self.counter_bits == 64 or nic in self.wide else COUNTER_BITS
+            limit = self.wrap_bps / 8 * elapsed
+            download = counter_delta(previous[0], received, widths, limit)
+            upload = counter_delta(previous[1], sent, widths, limit)
+            if download is None or upload is None:
+                self.resets += 1
+                logging.warning(f"Network counter reset detected on {nic}")
+                rates[nic] = (0.0, 0.0)
+                continue
+            
+            download = download * 8 / elapsed
+            upload = upload * 8 / elapsed
+            if download > self.max_bps or upload > self.max_bps:
+                self.resets += 1
+                logging.warning(f"Implausible counter jump on {nic}: {download:.0f}/{upload:.0f} bps")
+                rates[nic] = (0.0, 0.0)
+                continue
+            if received < previous[0] or sent < previous[1]:
+                self.wraps += 1
+                logging.info(f"Network counter wrapped on {nic}")
+            rates[nic] = (download, upload)
+        
+        if len(state) > len(counters):
+            for nic in [nic for nic, entry in state.items()
+                        if nic not in counters and now - entry[2] > self.expire]:
+                del state[nic]
+                self.wide.discard(nic)
+        return rates
+
+    def get_stats(self):
+        return {"interfaces": len(self.state), "wraps": self.wraps, "resets": self.resets}
+
+
+def create_counter_source(mode="auto", interfaces=None):
+    """Pick a counter source: auto, psutil, procfs or sysfs"""
+    interfaces = [nic for nic in (interfaces or []) if nic]
+    linux = sys.platform.startswith("linux")
+
+    if mode == "auto":
+        if not linux:
+            mode = "psutil"
+        else:
+            mode = "sysfs" if interfaces else "procfs"
+
+    try:
+        if mode == "procfs":
+            return ProcNetDevSource(interfaces or None)
+        if mode == "sysfs":
+            if not interfaces:
+                raise ValueError("the sysfs source needs counter_interfaces")
+            return SysfsCounterSource(interfaces)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Counter source '{mode}' unavailable, using psutil: {e}")
+        return PsutilCounterSource(interfaces)
+
+    if mode != "psutil":
+        logging.warning(f"Unknown counter source '{mode}', using psutil")
+    return PsutilCounterSource(interfaces)
+
+
+def record(path, seconds, interval, mode="auto", interfaces=None):
+    """Appends counter readings with monotonic timestamps to an NDJSON trace"""
+    source = create_counter_source(mode, interfaces)
+    deadline = time.monotonic() + seconds
+    count = 0
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            while True:
+                now = time.monotonic()
+                f.write(json.dumps({"t": now, "counters": source.read()}) + "\n")
+                count += 1
+                if now + interval > deadline:
+                    break
+                time.sleep(interval)
+    finally:
+        source.close()
+    return count
+
+
+def replay(trace, expire=30.0):
+    """Runs a trace through CounterTracker; returns per-interface byte totals, the tracker stats
+    and the trace's expectations, if it has any"""
+    source = TraceCounterSource(trace)
+    tracker = CounterTracker(expire)
+    totals = {}
+    while not source.done():
+        counters = source.read()
+        # Each rate covers the gap since that interface's own previous reading
+        seen = {nic: entry[2] for nic, entry in tracker.state.items()}
+        rates = tracker.update(counters, source.clock)
+        for nic, (download, upload) in rates.items():
+            elapsed = source.clock - seen.get(nic, source.clock)
+            entry = totals.setdefault(nic, [0.0, 0.0])
+            entry[0] += download / 8 * elapsed
+            entry[1] += upload / 8 * elapsed
+    return totals, tracker.get_stats(), source.expect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay network counter traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="record this host's counters")
+    rec.add_argument("path")
+    rec.add_argument("--seconds", type=float, default=60.0)
+    rec.add_argument("--interval", type=float, default=0.5)
+    rec.add_argument("--source", default="auto", help="auto, psutil, procfs or sysfs")
+    rec.add_argument("--interfaces", nargs="*", default=None)
+    rep = commands.add_parser("replay", help="print what CounterTracker makes of a trace")
+    rep.add_argument("path")
+    rep.add_argument("--expire", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if args.command == "record":
+        count = record(args.path, args.seconds, args.interval, args.source, args.interfaces)
+        print(f"Recorded {count} readings to {args.path}")
+        return 0
+    totals, stats = replay(args.path, args.expire)[:2]
+    for nic, (received, sent) in sorted(totals.items()):
+        print(f"{nic}: {received:.0f} bytes received, {sent:.0f} bytes sent")
+    print(json.dumps(stats))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
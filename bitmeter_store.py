@@ -0,0 +1,90 @@
+"""Preallocated sample history shared between the sampler and its readers."""
+import numpy as np
+
+
+class SampleStore:
+    """Fixed-capacity ring of samples with one writer and any number of readers.
+
+    Every row is written twice, at slot i and i + capacity, so the most recent
+    n rows are always one contiguous slice and readers get numpy views without
+    copying. The writer publishes a row by bumping `generation` only after the
+    row is complete, so no lock is needed on either side.
+
+    A view stays valid until the writer wraps around to it; readers that hold
+    on to one can compare `generation` against the value they read with.
+    """
+
+    # flags holds per-sample bits such as bitmeter_anomaly.FLAG_DOWNLOAD
+    COLUMNS = ("timestamp", "download", "upload", "cpu", "ram", "flags")
+
+    def __init__(self, capacity, cores=0, columns=None):
+        if capacity < 2:
+            raise ValueError("SampleStore capacity must be at least 2")
+        if columns is not None:
+            self.COLUMNS = tuple(columns)
+        self.capacity = int(capacity)
+        self.cores = int(cores)
+        self.width = len(self.COLUMNS) + self.cores
+        self.data = np.zeros((2 * self.capacity, self.width), dtype=np.float64)
+        self.index = {name: i for i, name in enumerate(self.COLUMNS)}
+        # (column, argument position) for each append() argument this layout has
+        self.append_slots = tuple((self.index[name], i) for i, name in enumerate(SampleStore.COLUMNS)
+                                  if name in self.index)
+        # Total number of rows ever written
+        self.generation = 0
+
+    def __len__(self):
+        return min(self.generation, self.capacity - 1)
+
+    def append(self, timestamp, download, upload, cpu, ram, per_core=(), flags=0):
+        """Values whose column this store's layout does not have are skipped"""
+        slot = self.generation % self.capacity
+        row = self.data[slot]
+        values = (timestamp, download, upload, cpu, ram, flags)
+        for column, i in self.append_slots:
+            row[column] = values[i]
+        if self.cores:
+            count = min(len(per_core), self.cores)
+            offset = len(self.COLUMNS)
+            row[offset:offset + count] = per_core[:count]
+        self.data[slot + self.capacity] = row
+        self.generation += 1
+
+    def append_row(self, values):
+        """Append a full row given in column order"""
+        slot = self.generation % self.capacity
+        self.data[slot] = values
+        self.data[slot + self.capacity] = values
+        self.generation += 1
+
+    def latest(self, n=None):
+        """Returns a (rows, width) view of the newest n samples, oldest first"""
+        generation = self.generation
+        # The oldest slot may be mid-overwrite, so never hand it out
+        available = min(generation, self.capacity - 1)
+        n = available if n is None else max(0, min(n, available))
+        start = (generation - n) % self.capacity
+        return self.data[start:start + n]
+
+    def since(self, sequence):
+        """Returns (first, rows): a view of the rows from sequence number `sequence` on.
+
+        Row k is the k-th row ever appended. Rows the ring no longer holds are
+        skipped, so `first` can be later than `sequence`.
+        """
+        generation = self.generation
+        first = min(max(sequence, generation - min(generation, self.capacity - 1)), generation)
+        start = first % self.capacity
+        return first, self.data[start:start + generation - first]
+
+    def column(self, name, n=None):
+        return self.latest(n)[:, self.index[name]]
+
+    def per_core(self, n=None):
+        return self.latest(n)[:, len(self.COLUMNS):]
+
+    def last(self):
+        """Returns a view of the newest row, or None when nothing was written yet"""
+        if self.generation == 0:
+            return None
+        return self.data[(self.generation - 1) % self.capacity]
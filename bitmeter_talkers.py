@@ -0,0 +1,232 @@
+"""Per-process network bandwidth attribution ("top talkers").
+
+On Linux, one NETLINK_SOCK_DIAG dump per tick returns every TCP socket with
+its tcp_info byte counters. Socket inodes are mapped to PIDs by reading
+/proc/<pid>/fd, and that map is kept between ticks: only unknown inodes
+trigger a lookup, new PIDs and known socket owners are searched first, and a
+full sweep happens at most every full_scan_interval seconds.
+
+UDP traffic carries no per-socket byte counters and is not attributed.
+Sockets owned by other users can only be resolved when running as root.
+"""
+import os
+import sys
+import time
+import heapq
+import socket
+import struct
+import logging
+
+import psutil
+
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+INET_DIAG_INFO = 2
+TCP_LISTEN = 10
+
+NLMSGHDR = struct.Struct("=IHHII")
+# family, protocol, ext, pad, states, then a zeroed inet_diag_sockid
+INET_DIAG_REQ_V2 = struct.Struct("=BBBxI48x")
+# family, state, timer, retrans, sockid (ports, addresses, if, cookie),
+# expires, rqueue, wqueue, uid, inode
+INET_DIAG_MSG = struct.Struct("=BBBB4x32xIQIIIII")
+RTATTR = struct.Struct("=HH")
+# tcpi_bytes_acked and tcpi_bytes_received
+TCP_INFO_BYTES = struct.Struct("=QQ")
+TCP_INFO_BYTES_OFFSET = 120
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+class SockDiagReader:
+    """Dumps TCP sockets with their byte counters: {cookie: (inode, sent, received)}"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG)
+        self.sock.bind((0, 0))
+        self.seq = 0
+        self.buffer = bytearray(65536)
+
+    def dump(self):
+        sockets = {}
+        states = 0xFFF & ~(1 << TCP_LISTEN)
+        for family in (socket.AF_INET, socket.AF_INET6):
+            self.seq += 1
+            request = INET_DIAG_REQ_V2.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), states)
+            header = NLMSGHDR.pack(NLMSGHDR.size + len(request), SOCK_DIAG_BY_FAMILY,
+                                   NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+            self.sock.send(header + request)
+            self._receive(sockets)
+        return sockets
+
+    def _receive(self, sockets):
+        view = memoryview(self.buffer)
+        while True:
+            size = self.sock.recv_into(self.buffer)
+            offset = 0
+            while offset + NLMSGHDR.size <= size:
+                length, msg_type, _, seq, _ = NLMSGHDR.unpack_from(view, offset)
+                if length < NLMSGHDR.size:
+                    return
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    raise OSError("sock_diag dump failed")
+                if seq == self.seq:
+                    self._parse(view, offset + NLMSGHDR.size, offset + length, sockets)
+                offset += _align(length)
+
+    def _parse(self, view, start, end, sockets):
+        fields = INET_DIAG_MSG.unpack_from(view, start)
+        cookie = fields[5]
+        inode = fields[10]
+        pos = start + INET_DIAG_MSG.size
+        while pos + RTATTR.size <= end:
+            attr_len, attr_type = RTATTR.unpack_from(view, pos)
+            if attr_len < RTATTR.size:
+                break
+            if attr_type == INET_DIAG_INFO and attr_len - RTATTR.size >= TCP_INFO_BYTES_OFFSET + TCP_INFO_BYTES.size:
+                sent, received = TCP_INFO_BYTES.unpack_from(view, pos + RTATTR.size + TCP_INFO_BYTES_OFFSET)
+                sockets[cookie] = (inode, sent, received)
+                return
+            pos += _align(attr_len)
+
+    def close(self):
+        self.sock.close()
+
+
+class TalkerCollector:
+    """Attributes TCP bytes to processes and returns the top talkers"""
+
+    def __init__(self, top_n=3, full_scan_interval=30.0, reader=None):
+        self.top_n = top_n
+        self.full_scan_interval = full_scan_interval
+        self.reader = reader or SockDiagReader()
+
+        self.inode_pid = {}
+        self.socket_owners = set()
+        self.known_pids = set()
+        self.names = {}
+        self.last_sockets = None
+        self.last_time = None
+        self.last_full_scan = 0.0
+
+        self.last_collect_cost = 0.0
+        self.unresolved = 0
+
+    def _socket_inodes(self, pid):
+        inodes = []
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            for fd in os.listdir(fd_dir):
+                try:
+                    target = os.readlink(f"{fd_dir}/{fd}")
+                except OSError:
+                    continue
+                if target.startswith("socket:["):
+                    inodes.append(int(target[8:-1]))
+        except OSError:
+            pass
+        return inodes
+
+    def _resolve(self, unknown, now):
+        """Map unknown inodes to PIDs, looking at the likeliest owners first"""
+        current = set(psutil.pids())
+        new_pids = current - self.known_pids
+        self.known_pids = current
+        self.socket_owners &= current
+
+        candidates = list(new_pids) + [pid for pid in self.socket_owners if pid not in new_pids]
+        if now - self.last_full_scan >= self.full_scan_interval:
+            self.last_full_scan = now
+            seen = set(candidates)
+            candidates += [pid for pid in current if pid not in seen]
+
+        for pid in candidates:
+            if not unknown:
+                break
+            for inode in self._socket_inodes(pid):
+                if inode in unknown:
+                    self.inode_pid[inode] = pid
+                    self.socket_owners.add(pid)
+                    unknown.discard(inode)
+
+    def _name(self, pid):
+        name = self.names.get(pid)
+        if name is None:
+            try:
+                name = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                name = f"pid {pid}"
+            self.names[pid] = name
+        return name
+
+    def collect(self):
+        """Returns [(download_bps, upload_bps, name)] of the busiest processes"""
+        start = time.perf_counter()
+        now = time.monotonic()
+        sockets = self.reader.dump()
+
+        live_inodes = {entry[0] for entry in sockets.values()}
+        for inode in [i for i in self.inode_pid if i not in live_inodes]:
+            del self.inode_pid[inode]
+
+        unknown = {inode for inode in live_inodes if inode and inode not in self.inode_pid}
+        if unknown:
+            self._resolve(unknown, now)
+        self.unresolved = len(unknown)
+
+        previous = self.last_sockets
+        elapsed = now - self.last_time if self.last_time else 0.0
+        self.last_sockets = sockets
+        self.last_time = now
+        if previous is None or elapsed <= 0:
+            # The first dump only sets the baseline
+            self.last_collect_cost = time.perf_counter() - start
+            return []
+
+        per_pid = {}
+        for cookie, (inode, sent, received) in sockets.items():
+            before = previous.get(cookie)
+            # Sockets opened since the last dump count from zero
+            sent_delta = sent - before[1] if before else sent
+            received_delta = received - before[2] if before else received
+            if sent_delta <= 0 and received_delta <= 0:
+                continue
+            pid = self.inode_pid.get(inode)
+            if pid is None:
+                continue
+            totals = per_pid.setdefault(pid, [0, 0])
+            totals[0] += max(received_delta, 0)
+            totals[1] += max(sent_delta, 0)
+
+        for pid in [p for p in self.names if p not in self.known_pids]:
+            del self.names[pid]
+
+        top = heapq.nlargest(self.top_n, per_pid.items(), key=lambda item: item[1][0] + item[1][1])
+        talkers = [(received * 8 / elapsed, sent * 8 / elapsed, self._name(pid))
+                   for pid, (received, sent) in top]
+        self.last_collect_cost = time.perf_counter() - start
+        return talkers
+
+    def close(self):
+        self.reader.close()
+
+
+def create_talker_collector():
+    """TalkerCollector where per-socket counters are available, otherwise None"""
+    if not sys.platform.startswith("linux"):
+        logging.info("Per-process network attribution is only available on Linux")
+        return None
+    try:
+        return TalkerCollector()
+    except OSError as e:
+        logging.warning(f"Per-process network attribution unavailable: {e}")
+        return None
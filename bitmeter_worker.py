@@ -0,0 +1,241 @@
+"""Runs the heavy collectors in a separate process.
+
+The process sweep and the per-socket attribution walk /proc for every PID.
+In a worker process that work never holds the GUI's GIL. The worker runs its
+own SamplingScheduler. Each result goes back over a one-way pipe as a
+compact struct-packed record. A receiver thread in the parent unpacks the
+record and swaps it into the monitor under system_stats_lock, so readers
+still only take a reference to the latest snapshot.
+
+Record layout: HEADER (kind, timestamp, count), then for processes
+SCAN_STATS and `count` PROCESS_ENTRY, or for talkers `count` TALKER_ENTRY.
+Each entry is followed by its UTF-8 name. A HELLO record reports which
+collectors actually started in the worker.
+"""
+import time
+import struct
+import logging
+import threading
+import multiprocessing
+
+
+KIND_HELLO = 0
+KIND_PROCESSES = 1
+KIND_TALKERS = 2
+
+HEADER = struct.Struct("<BdH")
+SCAN_STATS = struct.Struct("<IIddII")
+PROCESS_ENTRY = struct.Struct("<dH")
+TALKER_ENTRY = struct.Struct("<ddH")
+
+OFFLOADABLE = ("processes", "talkers")
+
+
+def _pack_name(name):
+    return name.encode("utf-8", "replace")[:255]
+
+
+def encode_hello(collectors):
+    mask = 0
+    for i, name in enumerate(OFFLOADABLE):
+        if name in collectors:
+            mask |= 1 << i
+    return HEADER.pack(KIND_HELLO, time.time(), mask)
+
+def encode_processes(top_processes, scan_stats):
+    parts = [HEADER.pack(KIND_PROCESSES, time.time(), len(top_processes)),
+             SCAN_STATS.pack(scan_stats["processes"], scan_stats["scans"],
+                             scan_stats["last_scan_ms"], scan_stats["avg_scan_ms"],
+                             scan_stats["added"], scan_stats["removed"])]
+    for cpu, name in top_processes:
+        raw = _pack_name(name)
+        parts.append(PROCESS_ENTRY.pack(cpu, len(raw)))
+        parts.append(raw)
+    return b"".join(parts)
+
+def encode_talkers(top_talkers):
+    parts = [HEADER.pack(KIND_TALKERS, time.time(), len(top_talkers))]
+    for dl, ul, name in top_talkers:
+        raw = _pack_name(name)
+        parts.append(TALKER_ENTRY.pack(dl, ul, len(raw)))
+        parts.append(raw)
+    return b"".join(parts)
+
+def decode(record):
+    """Returns (kind, timestamp, payload) for one record"""
+    kind, timestamp, count = HEADER.unpack_from(record, 0)
+    offset = HEADER.size
+
+    if kind == KIND_HELLO:
+        return kind, timestamp, {name for i, name in enumerate(OFFLOADABLE) if count & (1 << i)}
+
+    if kind == KIND_PROCESSES:
+        fields = SCAN_STATS.unpack_from(record, offset)
+        offset += SCAN_STATS.size
+        scan_stats = dict(zip(("processes", "scans", "last_scan_ms", "avg_scan_ms", "added", "removed"), fields))
+        entries = []
+        for _ in range(count):
+            cpu, length = PROCESS_ENTRY.unpack_from(record, offset)
+            offset += PROCESS_ENTRY.size
+            entries.append((cpu, record[offset:offset + length].decode("utf-8", "replace")))
+            offset += length
+        return kind, timestamp, (entries, scan_stats)
+
+    if kind == KIND_TALKERS:
+        entries = []
+        for _ in range(count):
+            dl, ul, length = TALKER_ENTRY.unpack_from(record, offset)
+            offset += TALKER_ENTRY.size
+            entries.append((dl, ul, record[offset:offset + length].decode("utf-8", "replace")))
+            offset += length
+        return kind, timestamp, entries
+
+    raise ValueError(f"Unknown worker record kind {kind}")
+
+
+def worker_main(conn, stop_event, collectors, intervals):
+    """Entry point of the worker process"""
+    from bitmeter_core import ProcessTable, SamplingScheduler
+    from bitmeter_talkers import create_talker_collector
+
+    scheduler = SamplingScheduler()
+    started = set()
+
+    def send(record):
+        try:
+            conn.send_bytes(record)
+        except (OSError, ValueError):
+            # The parent is gone
+            stop_event.set()
+
+    if "processes" in collectors:
+        process_table = ProcessTable()
+
+        def collect_processes():
+            top_processes = process_table.scan()
+            send(encode_processes(top_processes, process_table.get_scan_stats()))
+
+        scheduler.add("processes", collect_processes, intervals["processes"])
+        started.add("processes")
+
+    talker_collector = create_talker_collector() if "talkers" in collectors else None
+    if talker_collector is not None:
+        scheduler.add("talkers", lambda: send(encode_talkers(talker_collector.collect())),
+                      intervals["talkers"])
+        started.add("talkers")
+
+    send(encode_hello(started))
+    scheduler.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    scheduler.stop()
+    if talker_collector is not None:
+        talker_collector.close()
+    conn.close()
+
+
+class CollectorWorker:
+    """Parent-side handle: starts the worker and applies its results to the monitor"""
+
+    def __init__(self, monitor, collectors, intervals):
+        self.monitor = monitor
+        self.collectors = set(collectors)
+        self.intervals = dict(intervals)
+        # Filled in by the worker's HELLO record
+        self.running_collectors = None
+        self.ready = threading.Event()
+        self.scan_stats = None
+        self.records = 0
+        # Set when the worker died; its collectors then run in the parent
+        self.failed = False
+        self.stopping = False
+
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.conn = None
+        self.stop_event = None
+        self.thread = None
+
+    def start(self):
+        self.stopping = False
+        receiver, sender = self.context.Pipe(duplex=False)
+        self.stop_event = self.context.Event()
+        self.process = self.context.Process(
+            target=worker_main, name="bitmeter-worker",
+            args=(sender, self.stop_event, self.collectors, self.intervals), daemon=True)
+        self.process.start()
+        sender.close()
+        self.conn = receiver
+        self.thread = threading.Thread(target=self._receive, name="bitmeter-worker-receiver", daemon=True)
+        self.thread.start()
+
+    def _receive(self):
+        monitor = self.monitor
+        while True:
+            try:
+                record = self.conn.recv_bytes()
+            except (EOFError, OSError) as e:
+                if not self.stopping:
+                    self._fail(e)
+                break
+            try:
+                kind, _, payload = decode(record)
+            except (struct.error, ValueError) as e:
+                logging.error(f"Bad record from collector worker: {e}")
+                continue
+            self.records += 1
+            if kind == KIND_PROCESSES:
+                top_processes, self.scan_stats = payload
+                with monitor.system_stats_lock:
+                    monitor.top_processes = top_processes
+            elif kind == KIND_TALKERS:
+                with monitor.system_stats_lock:
+                    monitor.top_talkers = payload
+            elif kind == KIND_HELLO:
+                self.running_collectors = payload
+                self.ready.set()
+        self.ready.set()
+
+    def _fail(self, error):
+        exitcode = None
+        if self.process is not None:
+            self.process.join(1.0)
+            exitcode = self.process.exitcode
+        logging.error(f"Collector worker stopped unexpectedly (exit code {exitcode}: {error!r}), "
+                      f"collecting {', '.join(sorted(self.collectors))} in-process")
+        self.failed = True
+        self.monitor.collect_in_process()
+        # From here on monitor.is_offloaded() is False for every collector
+        self.collectors = set()
+
+    def is_running(self, collector):
+        """True once the worker confirmed it runs `collector`"""
+        return self.running_collectors is not None and collector in self.running_collectors
+
+    def stop(self, timeout=2.0):
+        if self.process is None:
+            return
+        self.stopping = True
+        self.stop_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.conn.close()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.process = None
+
+
+def create_collector_worker(monitor, config, intervals):
+    """CollectorWorker for the collectors listed in offload_collectors, or None"""
+    wanted = config.get("Settings", "offload_collectors", fallback="").replace(",", " ").split()
+    collectors = [name for name in wanted if name in OFFLOADABLE]
+    for name in wanted:
+        if name not in OFFLOADABLE:
+            logging.warning(f"Collector '{name}' cannot be offloaded")
+    if not collectors:
+        return None
+    return CollectorWorker(monitor, collectors, {name: intervals[name] for name in collectors})